@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'signaldb.settings')
+# API views run in a bounded thread pool instead of a new thread per request, see AsyncViewMixin
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
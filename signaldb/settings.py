@@ -58,14 +58,20 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'signalp.loaders': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'signalp.pagination.CustomPageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'signalp.pagination.KeysetPagination',
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
-        'rest_framework.filters.SearchFilter',
+        'signalp.custom_filters.FullTextSearchFilter',
+        'rest_framework.filters.OrderingFilter',
     ],
     'DEFAULT_RENDERER_CLASSES': [
         'signalp.custom_renderer.CustomBrowsableAPIRenderer',
@@ -128,10 +134,57 @@ DATABASES = {
         'PASSWORD': config('POSTGRES_PASSWORD'),
         'HOST': config('POSTGRES_HOST', default='localhost'),
         'PORT': config('POSTGRES_PORT', default='5432'),
+        # Seconds connections are kept open between requests, 0 closes them after every request
+        'CONN_MAX_AGE': config('CONN_MAX_AGE', default=0, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
 
+# Caches
+# The default cache is shared by all workers (Redis or memcached when configured), the local cache
+# is a per-worker LRU in front of it. See signalp/caching.py.
+
+REDIS_URL = config('REDIS_URL', default='')
+MEMCACHED_LOCATION = config('MEMCACHED_LOCATION', default='')
+
+if REDIS_URL:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+elif MEMCACHED_LOCATION:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': MEMCACHED_LOCATION,
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'signalp-shared',
+    }
+
+CACHES = {
+    'default': SHARED_CACHE,
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'signalp-local',
+        'OPTIONS': {'MAX_ENTRIES': config('LOCAL_CACHE_MAX_ENTRIES', default=2000, cast=int)},
+    },
+}
+
+# Seconds cached API responses are kept, 0 disables the response cache
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=86400, cast=int)
+# Seconds a worker trusts its copy of the data generation before checking the shared cache again
+GENERATION_CHECK_INTERVAL = config('GENERATION_CHECK_INTERVAL', default=5, cast=int)
+# Serve the API views as coroutines, enabled by signaldb/asgi.py. See AsyncViewMixin in signalp/views.py
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+# Threads per ASGI worker running API requests, each with its own database connection
+ASYNC_VIEW_THREADS = config('ASYNC_VIEW_THREADS', default=16, cast=int)
+# maintenance_work_mem of the index builds of the load_* --rebuild mode
+REBUILD_MAINTENANCE_WORK_MEM = config('REBUILD_MAINTENANCE_WORK_MEM', default='1GB')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,145 @@
+import json
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from signalp.models import LoadGeneration
+
+# API data only changes when the loaders run. Each load bumps the generation of the loaded tables in
+# LoadGeneration, and the load state (generation and load time of every table) is cached per worker
+# ('local' cache) and shared between workers ('default' cache).
+# - Responses are cached in both tiers under keys that include the data generation, the total number
+#   of loads, so that a load invalidates every cached response at once.
+# - ETag and Last-Modified validators are derived from the generations of the tables a view reads.
+LOAD_STATE_CACHE_KEY = 'signalp:load-state'
+# The shared copy of the load state is dropped when a load commits, the timeout only matters for
+# shared caches that the loading process cannot reach (the per-process locmem stand-in)
+SHARED_LOAD_STATE_TIMEOUT = 60
+RESPONSE_CACHE_PREFIX = 'signalp:response'
+# Query parameters that only select a renderer and do not change the response data
+IGNORED_QUERY_PARAMS = {'format'}
+
+local_cache = caches['local']
+shared_cache = caches['default']
+
+
+def load_state():
+    """
+    Return {model label: (generation, loaded_at)} for the loaded tables,
+    looked up in the local, then the shared cache, then the database.
+    """
+    state = local_cache.get(LOAD_STATE_CACHE_KEY)
+    if state is None:
+        state = shared_cache.get(LOAD_STATE_CACHE_KEY)
+        if state is None:
+            state = {label: (generation, loaded_at) for label, generation, loaded_at in
+                     LoadGeneration.objects.values_list('label', 'generation', 'loaded_at')}
+            shared_cache.set(LOAD_STATE_CACHE_KEY, state, SHARED_LOAD_STATE_TIMEOUT)
+        local_cache.set(LOAD_STATE_CACHE_KEY, state, settings.GENERATION_CHECK_INTERVAL)
+    return state
+
+
+def data_generation():
+    """
+    Return the total number of loads recorded, which changes with any load.
+    """
+    return sum(generation for generation, _ in load_state().values())
+
+
+def table_generations(models):
+    """
+    Return the (generation, loaded_at) of each of the given models' tables, (0, None) for tables never loaded.
+    """
+    state = load_state()
+    return [state.get(model._meta.label, (0, None)) for model in models]
+
+
+def forget_load_state():
+    shared_cache.delete(LOAD_STATE_CACHE_KEY)
+    local_cache.delete(LOAD_STATE_CACHE_KEY)
+
+
+def record_load(*models):
+    """
+    Bump the load generation of the tables of the given models.
+    Called by the loaders inside their transaction, the cached load state is dropped once it commits.
+    Other workers pick up the new generations within GENERATION_CHECK_INTERVAL seconds.
+    """
+    now = timezone.now()
+    for model in models:
+        generation, _ = LoadGeneration.objects.get_or_create(label=model._meta.label)
+        LoadGeneration.objects.filter(pk=generation.pk).update(generation=F('generation') + 1, loaded_at=now)
+    transaction.on_commit(forget_load_state)
+
+
+def request_signature(request, view):
+    """
+    Hash the view, its URL arguments and the normalized query: parameters sorted, repeated values
+    sorted and empty values dropped, so that equivalent queries share a signature.
+    Host and scheme are included as responses contain absolute URLs.
+    """
+    signature = json.dumps([
+        request.scheme, request.get_host(), type(view).__name__, sorted(view.kwargs.items()), normalized_params(request.query_params)
+    ], default=str)
+    return md5(signature.encode()).hexdigest()
+
+
+def normalized_params(query_params, names=None):
+    """
+    Return the [name, sorted values] pairs of the query parameters with values, optionally only those in names.
+    """
+    params = []
+    for key, values in sorted(query_params.lists()):
+        values = sorted(value for value in values if value != '')
+        if values and key not in IGNORED_QUERY_PARAMS and (names is None or key in names):
+            params.append([key, values])
+    return params
+
+
+def validators(request, view, models):
+    """
+    Return the strong ETag and the Last-Modified timestamp of a response, derived from the request
+    signature, the rendered media type and the load generations of the tables the view reads.
+    Last-Modified is None until one of the tables has been loaded.
+    """
+    generations = table_generations(models)
+    tag = md5(f"{request_signature(request, view)}:{request.accepted_media_type}:{[g for g, _ in generations]}".encode()).hexdigest()
+    loaded = [loaded_at for _, loaded_at in generations if loaded_at is not None]
+    last_modified = int(max(loaded).timestamp()) if loaded else None
+    return f'"{tag}"', last_modified
+
+
+def response_cache_key(request, view):
+    return f"{RESPONSE_CACHE_PREFIX}:{data_generation()}:{request_signature(request, view)}"
+
+
+def genome_set_cache_key(genome_set, params):
+    """
+    Key of an aggregation over a genome set (see signalp/genome_sets.py) with the normalized row filter params,
+    shared by every query that selects the same genomes.
+    """
+    return f"{RESPONSE_CACHE_PREFIX}:genome-set:{data_generation()}:{genome_set}:{md5(json.dumps(params).encode()).hexdigest()}"
+
+
+def get_cached_response(key):
+    """
+    Return (data, tier) for a cached response, or (None, None).
+    Shared tier hits are copied to the local tier.
+    """
+    data = local_cache.get(key)
+    if data is not None:
+        return data, 'local'
+    data = shared_cache.get(key)
+    if data is not None:
+        local_cache.set(key, data, settings.RESPONSE_CACHE_TIMEOUT)
+        return data, 'shared'
+    return None, None
+
+
+def cache_response(key, data):
+    local_cache.set(key, data, settings.RESPONSE_CACHE_TIMEOUT)
+    shared_cache.set(key, data, settings.RESPONSE_CACHE_TIMEOUT)
@@ -1,16 +1,132 @@
+import json
 import django_filters
-from signalp.models import DomainStatisticsPerProtein, DomainStatisticsPerGenome, DomainStatisticsPerTaxon
+from django import forms
+from django.db.models import Q
+from rest_framework.filters import SearchFilter
+from signalp.loaders.rank_index import GTDB_RANKS
+from signalp.models import (Domain, DomainStatisticsPerProtein, DomainStatisticsPerGenome, DomainStatisticsPerTaxon, FullTextSearchQuerySet, GenomeMetadata,
+                            TaxonomyClosure, TaxonomyNode, TaxonomySystem)
 
 
+class FullTextSearchFilter(SearchFilter):
+    """
+    Sends ?search= through the search_vector GIN index of the statistics tables, ranked, with "phrase" and prefix* terms
+    (see FullTextSearchQuerySet.search). The view's search_fields are matched as substrings, they are served by
+    trigram indexes where pg_trgm is installed (migration 0014).
+    Models without a search_vector are searched on search_fields like SearchFilter does.
+    """
+    def filter_queryset(self, request, queryset, view):
+        if not isinstance(queryset, FullTextSearchQuerySet):
+            return super().filter_queryset(request, queryset, view)
+        return queryset.search(request.query_params.get(self.search_param, ''), self.get_search_fields(view, request) or ())
+
+
+class DomainsFilter(django_filters.BaseCSVFilter, django_filters.CharFilter):
+    """
+    Comma separated domain names, resolved to Domain ids and matched against the GIN indexed domain_ids
+    with integer set operations: contains (@>) for all of the domains, overlap (&&) for any of them.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('field_name', 'domain_ids')
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        ids = list(Domain.objects.filter(name__in=value).values_list('id', flat=True))
+        # Unknown domains match no row
+        if not ids or (self.lookup_expr == 'contains' and len(ids) < len(set(value))):
+            return qs if self.exclude else qs.none()
+        return super().filter(qs, ids)
+
+class DomainCountField(forms.CharField):
+    """
+    Comma separated NAME:MIN:MAX domain count ranges, MIN or MAX may be left empty and NAME:N is an exact count.
+    Cleans to a list of (name, min, max).
+    """
+    def clean(self, value):
+        value = super().clean(value)
+        ranges = []
+        for item in filter(None, (item.strip() for item in (value or '').split(','))):
+            name, *bounds = item.split(':')
+            if len(bounds) == 1:
+                bounds = bounds * 2
+            try:
+                low, high = [int(bound) if bound else None for bound in bounds]
+            except ValueError:
+                raise forms.ValidationError(f"Invalid domain count '{item}', expected NAME:MIN:MAX or NAME:COUNT")
+            if not name or (low is None and high is None) or any(bound is not None and bound < 0 for bound in (low, high)):
+                raise forms.ValidationError(f"Invalid domain count '{item}', expected NAME:MIN:MAX or NAME:COUNT")
+            ranges.append((name, low, high))
+        return ranges
+
+class DomainCountFilter(django_filters.Filter):
+    """
+    Domain count ranges over domain_counts. Exact counts compile to containment (@>), ranges to a
+    jsonpath predicate (@?) guarded by a key existence test (?) when the domain has to be present, both GIN indexable.
+    """
+    field_class = DomainCountField
+
+    def filter(self, qs, value):
+        for name, low, high in value or []:
+            if low == high:
+                condition = Q(domain_counts__contains={name: low})
+            else:
+                predicates = [f"@ >= {low}"] * (low is not None) + [f"@ <= {high}"] * (high is not None)
+                condition = Q(domain_counts__has_key=name) & Q(domain_counts__path_exists=f"$.{json.dumps(name)} ? ({' && '.join(predicates)})")
+            if not low:
+                # Proteins without the domain have a count of 0
+                condition |= Q(domain_counts__isnull=True) | ~Q(domain_counts__has_key=name)
+            qs = qs.filter(condition)
+        return qs
+
+class TaxonTreeFilter(django_filters.CharFilter):
+    """
+    Rows whose taxonomy node is in the subtree (the default) or, with ancestors=True, in the lineage of the taxa
+    named NAME or RANK:NAME, e.g. order:Thermococcales. Resolved through the TaxonomyClosure indexes into
+    a node id IN (...) condition, so the taxonomy columns are neither scanned nor LIKE matched.
+    Names found at several ranks or in both taxonomy systems match all of their nodes, unless taxonomy_system is given.
+    """
+    def __init__(self, *args, ancestors=False, taxonomy_system=None, **kwargs):
+        self.ancestors = ancestors
+        self.taxonomy_system = taxonomy_system
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        rank, _, name = value.partition(':')
+        if rank not in GTDB_RANKS:
+            rank, name = None, value
+        taxa = TaxonomyNode.objects.filter(name=name)
+        if rank:
+            taxa = taxa.filter(rank=rank)
+        if self.taxonomy_system:
+            taxa = taxa.filter(taxonomy_system=self.taxonomy_system)
+        if self.ancestors:
+            nodes = TaxonomyClosure.objects.filter(descendant__in=taxa).values('ancestor_id')
+        else:
+            nodes = TaxonomyClosure.objects.filter(ancestor__in=taxa).values('descendant_id')
+        return qs.filter(**{f"{self.field_name}__in": nodes})
+
 class DomainStatisticsPerProteinFilter(django_filters.FilterSet):
     protein_length__gte = django_filters.NumberFilter(field_name='protein_length', lookup_expr='gte')
     protein_length__lte = django_filters.NumberFilter(field_name='protein_length', lookup_expr='lte')
+    # Domain architecture queries, e.g. ?domains_all=HisKA,HATPase_c&domains_exclude=PAS&domain_count=HisKA:1:2
+    domains_all = DomainsFilter(lookup_expr='contains', help_text='Proteins with all of the domains')
+    domains_any = DomainsFilter(lookup_expr='overlap', help_text='Proteins with any of the domains')
+    domains_exclude = DomainsFilter(lookup_expr='overlap', exclude=True, help_text='Proteins with none of the domains')
+    domain_count = DomainCountFilter(help_text='Domain count ranges, NAME:MIN:MAX or NAME:COUNT, comma separated')
 
     class Meta:
         model = DomainStatisticsPerProtein
-        fields = ['protein_length__gte', 'protein_length__lte', 'genome', 'genome_accession', 'ncbi_protein_accession', 'mist_protein_accession', 'source', 'protein_type']
+        fields = ['protein_length__gte', 'protein_length__lte', 'genome', 'genome_accession', 'ncbi_protein_accession', 'mist_protein_accession', 'source', 'protein_type',
+                  'domains_all', 'domains_any', 'domains_exclude', 'domain_count']
 
 class DomainStatisticsPerGenomeFilter(django_filters.FilterSet):
+    domains_all = DomainsFilter(lookup_expr='contains', help_text='Rows with all of the domains')
+    domains_any = DomainsFilter(lookup_expr='overlap', help_text='Rows with any of the domains')
+    domains_exclude = DomainsFilter(lookup_expr='overlap', exclude=True, help_text='Rows with none of the domains')
     count_raw__gte = django_filters.NumberFilter(field_name='count_raw', lookup_expr='gte')
     count_raw__lte = django_filters.NumberFilter(field_name='count_raw', lookup_expr='lte')
     count_normalized_by_genome_size__gte = django_filters.NumberFilter(field_name='count_normalized_by_genome_size', lookup_expr='gte')
@@ -22,9 +138,65 @@ class DomainStatisticsPerGenomeFilter(django_filters.FilterSet):
         model = DomainStatisticsPerGenome
         fields = ['count_raw__gte', 'count_raw__lte', 'count_normalized_by_genome_size__gte', 'count_normalized_by_genome_size__lte', 
                   'count_normalized_by_total_proteins__gte', 'count_normalized_by_total_proteins__lte',
-                  'genome', 'genome_accession', 'domain_combination_type', 'source', 'protein_type']
+                  'genome', 'genome_accession', 'domain_combination_type', 'source', 'protein_type',
+                  'domains_all', 'domains_any', 'domains_exclude']
+
+class GenomeVersionsFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+class GenomeMetadataFilter(django_filters.FilterSet):
+    gtdb_within = TaxonTreeFilter(field_name='gtdb_taxon', taxonomy_system=TaxonomySystem.GTDB, help_text='Genomes in the GTDB subtree of NAME or RANK:NAME')
+    ncbi_within = TaxonTreeFilter(field_name='ncbi_taxon', taxonomy_system=TaxonomySystem.NCBI, help_text='Genomes in the NCBI subtree of NAME or RANK:NAME')
+
+    class Meta:
+        model = GenomeMetadata
+        fields = ['genome_version', 'genome_accession', 'genome_size', 'protein_count',
+                  'gtdb_kingdom', 'gtdb_phylum', 'gtdb_class', 'gtdb_order', 'gtdb_family', 'gtdb_genus', 'gtdb_species',
+                  'ncbi_kingdom', 'ncbi_phylum', 'ncbi_class', 'ncbi_order', 'ncbi_family', 'ncbi_genus', 'ncbi_species',
+                  'gtdb_within', 'ncbi_within']
+
+class GenomeSetFilter(django_filters.FilterSet):
+    """
+    Selects the genomes of an ad-hoc aggregation: by GTDB or NCBI taxon or subtree, genome size and protein count bounds,
+    or an explicit list, e.g. ?gtdb_genus=Thermococcus&genome_size__gte=2000000 or ?genomes=GCF_000009965.1,GCF_000015765.1
+    """
+    genomes = GenomeVersionsFilter(field_name='genome_version', help_text='Genome versions, comma separated')
+    gtdb_within = TaxonTreeFilter(field_name='gtdb_taxon', taxonomy_system=TaxonomySystem.GTDB, help_text='Genomes in the GTDB subtree of NAME or RANK:NAME')
+    ncbi_within = TaxonTreeFilter(field_name='ncbi_taxon', taxonomy_system=TaxonomySystem.NCBI, help_text='Genomes in the NCBI subtree of NAME or RANK:NAME')
+    genome_size__gte = django_filters.NumberFilter(field_name='genome_size', lookup_expr='gte')
+    genome_size__lte = django_filters.NumberFilter(field_name='genome_size', lookup_expr='lte')
+    protein_count__gte = django_filters.NumberFilter(field_name='protein_count', lookup_expr='gte')
+    protein_count__lte = django_filters.NumberFilter(field_name='protein_count', lookup_expr='lte')
+
+    class Meta:
+        model = GenomeMetadata
+        fields = ['genomes', 'genome_size__gte', 'genome_size__lte', 'protein_count__gte', 'protein_count__lte',
+                  'gtdb_kingdom', 'gtdb_phylum', 'gtdb_class', 'gtdb_order', 'gtdb_family', 'gtdb_genus', 'gtdb_species',
+                  'ncbi_kingdom', 'ncbi_phylum', 'ncbi_class', 'ncbi_order', 'ncbi_family', 'ncbi_genus', 'ncbi_species', 'gtdb_within', 'ncbi_within']
+
+class GenomeSetAggregateFilter(django_filters.FilterSet):
+    """
+    Selects the per-genome statistics rows aggregated over a genome set.
+    """
+    domains_all = DomainsFilter(lookup_expr='contains', help_text='Rows with all of the domains')
+    domains_any = DomainsFilter(lookup_expr='overlap', help_text='Rows with any of the domains')
+    domains_exclude = DomainsFilter(lookup_expr='overlap', exclude=True, help_text='Rows with none of the domains')
+
+    class Meta:
+        model = DomainStatisticsPerGenome
+        fields = ['source', 'protein_type', 'domain_combination_type', 'domains_all', 'domains_any', 'domains_exclude']
 
 class DomainStatisticsPerTaxonFilter(django_filters.FilterSet):
+    """
+    Rows of one taxonomy system, GTDB unless ?taxonomy_system=ncbi, so that taxa of both systems are never mixed.
+    ?within= selects the taxa of a subtree, ?lineage_of= the ancestors of a taxon, itself included, for roll-ups.
+    """
+    taxon = django_filters.NumberFilter(field_name='taxon', help_text='TaxonomyNode id')
+    within = TaxonTreeFilter(field_name='taxon', help_text='Taxa in the subtree of NAME or RANK:NAME')
+    lineage_of = TaxonTreeFilter(field_name='taxon', ancestors=True, help_text='Taxa in the lineage of NAME or RANK:NAME')
+    domains_all = DomainsFilter(lookup_expr='contains', help_text='Rows with all of the domains')
+    domains_any = DomainsFilter(lookup_expr='overlap', help_text='Rows with any of the domains')
+    domains_exclude = DomainsFilter(lookup_expr='overlap', exclude=True, help_text='Rows with none of the domains')
     count_raw__gte = django_filters.NumberFilter(field_name='count_raw', lookup_expr='gte')
     count_raw__lte = django_filters.NumberFilter(field_name='count_raw', lookup_expr='lte')
     count_normalized_by_total_genomes__gte = django_filters.NumberFilter(field_name='count_normalized_by_total_genomes', lookup_expr='gte')
@@ -39,4 +211,23 @@ class DomainStatisticsPerTaxonFilter(django_filters.FilterSet):
         fields = ['count_raw__gte', 'count_raw__lte', 'count_normalized_by_total_genomes__gte', 'count_normalized_by_total_genomes__lte', 
                   'count_normalized_by_genome_size_by_total_genomes__gte', 'count_normalized_by_genome_size_by_total_genomes__lte',
                   'count_normalized_by_total_proteins_by_total_genomes__gte', 'count_normalized_by_total_proteins_by_total_genomes__lte',
-                  'gtdb_taxonomy_last', 'source', 'protein_type', 'domain_combination_type']
+                  'taxonomy_system', 'gtdb_taxonomy_last', 'taxon', 'within', 'lineage_of', 'source', 'protein_type', 'domain_combination_type',
+                  'domains_all', 'domains_any', 'domains_exclude']
+
+    def __init__(self, data=None, *args, **kwargs):
+        if data is not None and not data.get('taxonomy_system'):
+            data = data.copy()
+            data['taxonomy_system'] = TaxonomySystem.GTDB
+        super().__init__(data, *args, **kwargs)
+
+class TaxonomyNodeFilter(django_filters.FilterSet):
+    """
+    Taxonomy nodes by system, rank and name, the children of ?parent=<id>, the subtree of ?within= or the lineage of ?lineage_of=.
+    """
+    parent = django_filters.NumberFilter(field_name='parent', help_text='TaxonomyNode id of the parent')
+    within = TaxonTreeFilter(field_name='id', help_text='Nodes in the subtree of NAME or RANK:NAME')
+    lineage_of = TaxonTreeFilter(field_name='id', ancestors=True, help_text='Nodes in the lineage of NAME or RANK:NAME')
+
+    class Meta:
+        model = TaxonomyNode
+        fields = ['taxonomy_system', 'rank', 'name', 'depth', 'parent', 'within', 'lineage_of']
@@ -1,4 +1,41 @@
-from rest_framework.renderers import BrowsableAPIRenderer
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer
+from signalp import exporters
 
 class CustomBrowsableAPIRenderer(BrowsableAPIRenderer):
-    template = 'rest_framework/api.html'
\ No newline at end of file
+    template = 'rest_framework/api.html'
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Renderer selecting an export format. Exports are streamed by the view with stream(),
+    render() is only used for error responses, which are returned as JSON.
+    """
+    charset = None
+    stream = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+    stream = staticmethod(exporters.ndjson_stream)
+
+class TSVRenderer(ExportRenderer):
+    media_type = 'text/tab-separated-values'
+    format = 'tsv'
+    charset = 'utf-8'
+    stream = staticmethod(exporters.tsv_stream)
+
+class ParquetRenderer(ExportRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+    stream = staticmethod(exporters.parquet_stream)
+
+class ArrowRenderer(ExportRenderer):
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    stream = staticmethod(exporters.arrow_stream)
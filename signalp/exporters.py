@@ -0,0 +1,163 @@
+import csv
+import json
+from decimal import Decimal
+from itertools import islice
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Rows fetched per round trip from the server-side cursor, and per Arrow record batch / Parquet row group
+EXPORT_CHUNK_SIZE = 5000
+
+
+def export_columns(serializer_class):
+    """
+    Return the serializer fields that are concrete model columns, in serializer order.
+    Hyperlinks and many-to-many relations are not exported.
+    """
+    model = serializer_class.Meta.model
+    concrete = {field.name for field in model._meta.concrete_fields}
+    return [name for name in serializer_class.Meta.fields if name in concrete]
+
+
+def iter_chunks(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield lists of value tuples read through a server-side cursor, so memory use is bounded by chunk_size.
+    """
+    rows = queryset.values_list(*columns).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield chunk
+
+
+def json_columns(model, columns):
+    return {index for index, name in enumerate(columns) if model._meta.get_field(name).get_internal_type() == 'JSONField'}
+
+
+class ExportJSONEncoder(DjangoJSONEncoder):
+    """Renders decimals in fixed-point notation, as the API does."""
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return format(o, 'f')
+        return super().default(o)
+
+
+def tsv_value(value, is_json):
+    if value is None:
+        return None
+    if is_json:
+        return json.dumps(value)
+    if isinstance(value, Decimal):
+        return format(value, 'f')
+    return value
+
+
+def ndjson_stream(queryset, columns):
+    encoder = ExportJSONEncoder(separators=(',', ':'))
+    for chunk in iter_chunks(queryset, columns):
+        yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in chunk)
+
+
+class _Echo:
+    """Pseudo-buffer handing back what csv.writer writes to it."""
+    def write(self, value):
+        return value
+
+
+def tsv_stream(queryset, columns):
+    writer = csv.writer(_Echo(), delimiter='\t', lineterminator='\n')
+    json_indexes = json_columns(queryset.model, columns)
+    yield writer.writerow(columns)
+    for chunk in iter_chunks(queryset, columns):
+        lines = []
+        for row in chunk:
+            lines.append(writer.writerow(tsv_value(value, index in json_indexes) for index, value in enumerate(row)))
+        yield ''.join(lines)
+
+
+def arrow_type(field):
+    if field.is_relation:
+        field = field.target_field
+    internal_type = field.get_internal_type()
+    if internal_type in ('AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField', 'PositiveIntegerField'):
+        return pa.int64()
+    if internal_type == 'DecimalField':
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    # Text, choices and JSON (serialized) columns
+    return pa.string()
+
+
+def arrow_schema(model, columns):
+    return pa.schema([(name, arrow_type(model._meta.get_field(name))) for name in columns])
+
+
+def record_batches(queryset, columns, schema):
+    json_indexes = json_columns(queryset.model, columns)
+    for chunk in iter_chunks(queryset, columns):
+        arrays = []
+        for index, values in enumerate(zip(*chunk)):
+            if index in json_indexes:
+                values = [json.dumps(value) if value is not None else None for value in values]
+            arrays.append(pa.array(values, type=schema.field(index).type))
+        yield pa.record_batch(arrays, schema=schema)
+
+
+class _ChunkSink:
+    """Write-only file object collecting what pyarrow writes until it is drained."""
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _pyarrow_stream(queryset, columns, new_writer):
+    schema = arrow_schema(queryset.model, columns)
+    sink = _ChunkSink()
+    writer = new_writer(sink, schema)
+    for batch in record_batches(queryset, columns, schema):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def arrow_stream(queryset, columns):
+    return _pyarrow_stream(queryset, columns, pa.ipc.new_stream)
+
+
+def parquet_stream(queryset, columns):
+    # Each chunk becomes a row group, only the footer is held back until the end
+    return _pyarrow_stream(queryset, columns, pq.ParquetWriter)
+
+
+def export_response(queryset, columns, renderer, filename):
+    """
+    Stream the queryset in the format of the given export renderer.
+    """
+    content_type = f"{renderer.media_type}; charset={renderer.charset}" if renderer.charset else renderer.media_type
+    response = StreamingHttpResponse(renderer.stream(queryset, columns), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{renderer.format}"'
+    # Let nginx pass the rows through instead of buffering the whole export
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,73 @@
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from signalp.caching import forget_load_state, table_generations
+from signalp.models import (DomainStatisticsPerGenome, DomainStatisticsPerGenomeFacet, DomainStatisticsPerTaxon,
+                            DomainStatisticsPerTaxonFacet, LoadGeneration)
+
+# Facet summary tables hold the statistics tables grouped by their dimensions: the genome or taxon and
+# the source, protein type and domain combination type. Facet requests filtered on dimensions only are
+# answered by re-aggregating the (small) summary table, other requests aggregate the statistics table.
+# A summary is refreshed by the loaders in the load transaction and records the generation of the
+# statistics table it was built from, it is only used while that generation is current.
+FACET_FIELDS = ['source', 'protein_type', 'domain_combination_type']
+
+SUMMARY_TABLES = {
+    DomainStatisticsPerGenome: (DomainStatisticsPerGenomeFacet, ['genome_id', 'genome_accession'],
+                                ['count_raw', 'count_normalized_by_genome_size', 'count_normalized_by_total_proteins']),
+    DomainStatisticsPerTaxon: (DomainStatisticsPerTaxonFacet, ['taxonomy_system', 'gtdb_taxonomy_string', 'gtdb_taxonomy_last'],
+                               ['count_raw', 'count_normalized_by_total_genomes', 'count_normalized_by_genome_size_by_total_genomes',
+                                'count_normalized_by_total_proteins_by_total_genomes']),
+}
+
+
+def summary_fields(model):
+    """
+    Return the filter names a summary table of model can answer.
+    """
+    _, keys, _ = SUMMARY_TABLES[model]
+    return {key.removesuffix('_id') for key in keys} | set(FACET_FIELDS)
+
+
+def refresh_facets(*models):
+    """
+    Rebuild the facet summary tables of the given statistics models from their current rows.
+    Rows are deleted rather than truncated, readers keep seeing the previous summary until the load commits.
+    """
+    with connection.cursor() as cursor:
+        for model in models:
+            summary, keys, measures = SUMMARY_TABLES[model]
+            group_by = ', '.join(keys + FACET_FIELDS)
+            cursor.execute(f"DELETE FROM {summary._meta.db_table}")
+            cursor.execute(
+                f"INSERT INTO {summary._meta.db_table} ({group_by}, row_count, {', '.join(measures)}) "
+                f"SELECT {group_by}, count(*), {', '.join(f'sum({measure})' for measure in measures)} "
+                f"FROM {model._meta.db_table} GROUP BY {group_by}"
+            )
+            generation = LoadGeneration.objects.filter(label=model._meta.label).values_list('generation', flat=True).first() or 0
+            LoadGeneration.objects.update_or_create(label=summary._meta.label, defaults={'generation': generation, 'loaded_at': timezone.now()})
+    transaction.on_commit(forget_load_state)
+
+
+def summary_is_current(model):
+    """
+    Whether the summary table of model was built from the current generation of the model's table.
+    """
+    summary, _, _ = SUMMARY_TABLES[model]
+    (generation, _), (summary_generation, refreshed_at) = table_generations([model, summary])
+    return refreshed_at is not None and generation == summary_generation
+
+
+def facet_counts(queryset, facets, precomputed):
+    """
+    Group queryset by facets with the number of rows and the sums of the count measures per group.
+    queryset is a queryset of the statistics model, or of its summary model when precomputed.
+    """
+    model = queryset.model
+    if precomputed:
+        model = next(source for source, (summary, _, _) in SUMMARY_TABLES.items() if summary is model)
+    _, _, measures = SUMMARY_TABLES[model]
+    aggregates = {measure: Sum(measure) for measure in measures}
+    aggregates['count'] = Sum('row_count') if precomputed else Count('id')
+    return list(queryset.order_by().values(*facets).annotate(**aggregates).order_by(*facets))
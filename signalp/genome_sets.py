@@ -0,0 +1,42 @@
+from hashlib import md5
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import Count, DecimalField, Sum, Value
+from django.db.models.functions import MD5, Cast, Round
+
+# Taxon-style statistics over an arbitrary set of genomes, selected with GenomeSetFilter. A set is identified
+# by the md5 of its sorted genome versions, so that different filters selecting the same genomes share
+# cached results. The measures are those of DomainStatisticsPerTaxon (see loaders/taxon_aggregation.py),
+# normalized by the number of genomes in the set.
+GROUP_FIELDS = ['source', 'protein_type', 'domains', 'domain_combination_type']
+EMPTY_SET_SIGNATURE = md5(b'').hexdigest()
+
+
+def genome_set_signature(genomes):
+    """
+    Return (signature, number of genomes) of a GenomeMetadata queryset, computed in the database.
+    """
+    result = genomes.order_by().aggregate(
+        signature=MD5(StringAgg('genome_version', delimiter=',', order_by='genome_version')),
+        total=Count('id'),
+    )
+    return result['signature'] or EMPTY_SET_SIGNATURE, result['total']
+
+
+def aggregate_genome_set(queryset, genomes, total):
+    """
+    Group the DomainStatisticsPerGenome rows of queryset that belong to genomes (a GenomeMetadata queryset
+    of total genomes) by source, protein type, domains and domain combination type, with the number of genomes
+    per group, count_raw summed and the normalized counts divided by total. Largest count_raw first.
+    """
+    if not total:
+        return []
+    return list(
+        queryset.filter(genome__in=genomes.values('genome_version')).order_by().values(*GROUP_FIELDS).annotate(
+            genome_count=Count('id'),
+            count_raw=Sum('count_raw'),
+            count_normalized_by_total_genomes=Round(Cast('count_raw', DecimalField(max_digits=20, decimal_places=0)) / Value(total), 7),
+            count_normalized_by_genome_size_by_total_genomes=Round(Sum('count_normalized_by_genome_size') / Value(total), 9),
+            count_normalized_by_total_proteins_by_total_genomes=Round(Sum('count_normalized_by_total_proteins') / Value(total), 9),
+        ).order_by('-count_raw', *GROUP_FIELDS)
+    )
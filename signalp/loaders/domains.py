@@ -0,0 +1,43 @@
+from signalp.loaders.staging import quote
+from signalp.models import Domain
+
+# The domains columns list domain names separated by commas, the Domain dictionary maps them to the
+# integer ids of the domain_ids columns, whose GIN indexes answer domain filters with integer set operations.
+DOMAIN_SEPARATOR = ","
+
+
+def split_domains(domains):
+    return [name.strip() for name in (domains or "").split(DOMAIN_SEPARATOR) if name.strip()]
+
+
+def register_domains(cursor, table_name, column="domains"):
+    """
+    Add the domain names of the rows of table_name that are missing from the Domain dictionary.
+    Returns the number of names added.
+    """
+    cursor.execute(
+        f"INSERT INTO {quote(Domain._meta.db_table)} (name) "
+        f"SELECT DISTINCT btrim(name) FROM {quote(table_name)} s, unnest(string_to_array(s.{quote(column)}, '{DOMAIN_SEPARATOR}')) AS name "
+        f"WHERE btrim(name) <> '' ON CONFLICT (name) DO NOTHING"
+    )
+    return cursor.rowcount
+
+
+def domain_ids_sql(column="domains"):
+    """
+    SQL expression mapping the domain names of a staged row (alias s) to their Domain ids, in order.
+    For upsert_from_staging's computed_columns, after register_domains.
+    """
+    return (
+        f"ARRAY(SELECT d.id FROM unnest(string_to_array(s.{quote(column)}, '{DOMAIN_SEPARATOR}')) WITH ORDINALITY AS u(name, position) "
+        f"JOIN {quote(Domain._meta.db_table)} d ON d.name = btrim(u.name) ORDER BY u.position)"
+    )
+
+
+def domain_id_map(names):
+    """
+    Return {name: id} for the given domain names, adding the missing ones to the dictionary.
+    """
+    names = set(names)
+    Domain.objects.bulk_create([Domain(name=name) for name in names], ignore_conflicts=True)
+    return dict(Domain.objects.filter(name__in=names).values_list("name", "id"))
@@ -2,8 +2,14 @@ import csv
 import logging
 from pathlib import Path
 
-from django.db import transaction
-from signalp.models import GenomeMetadata
+from django.db import connection, transaction
+from signalp.caching import record_load
+from signalp.facets import refresh_facets
+from signalp.loaders.parallel import resolve_input_files, staged_files
+from signalp.loaders.staging import delete_missing_rows, upsert_from_staging
+from signalp.loaders.taxonomy import refresh_taxonomy
+from signalp.models import (GenomeMetadata, DomainStatisticsPerProtein, DomainStatisticsPerGenome, DomainStatisticsPerTaxon, TaxonGenomeLink,
+                            TaxonomyClosure, TaxonomyNode)
 
 logger = logging.getLogger(__name__)
 
@@ -16,104 +22,87 @@ def safe_int(value):
     except (ValueError, TypeError):
         return None
 
-def load_genome_metadata_from_tsv(file_path=None, batch_size=1000):
+FIELDS = [
+    'genome_version',
+    'genome_accession',
+    'genome_size',
+    'protein_count',
+    'gtdb_kingdom',
+    'gtdb_phylum',
+    'gtdb_class',
+    'gtdb_order',
+    'gtdb_family',
+    'gtdb_genus',
+    'gtdb_species',
+    'ncbi_kingdom',
+    'ncbi_phylum',
+    'ncbi_class',
+    'ncbi_order',
+    'ncbi_family',
+    'ncbi_genus',
+    'ncbi_species',
+]
+
+INTEGER_FIELDS = {'genome_size', 'protein_count'}
+
+STAGING_TABLE = "staging_genome_metadata"
+
+
+def iter_genome_metadata_rows(file_path):
     """
-    Load or update GenomeMetadata entries from a TSV file.
-    Args:
-        file_path (Path or str): Path to the TSV file.
-        batch_size (int): Number of records per batch for bulk ops.
+    Yield validated rows from the TSV file as tuples ordered like FIELDS.
     """
-    if file_path is None:
-        file_path = FILE_PATH
-
-    file_path = Path(file_path)
-    if not file_path.is_file():
-        raise FileNotFoundError(f"File {file_path} does not exist")
-
-    rows = []
-    genome_versions = set()
-
-    # Read all rows first
     with file_path.open(newline='') as tsvfile:
         reader = csv.DictReader(tsvfile, delimiter='\t')
         for row_num, row in enumerate(reader, start=1):
-            genome_version = row.get('genome_version')
-            if not genome_version:
+            if not row.get('genome_version'):
                 logger.warning(f"Skipping row {row_num} without genome_version: {row}")
                 continue
-            genome_versions.add(genome_version)
-            rows.append(row)
-
-    # Fetch existing GenomeMetadata records
-    existing_gs = GenomeMetadata.objects.filter(genome_version__in=genome_versions)
-    existing_map = {gm.genome_version: gm for gm in existing_gs}
-
-    to_create = []
-    to_update = []
-
-    for row_num, row in enumerate(rows, start=1):
-        genome_version = row['genome_version']
-
-        defaults = {
-            'genome_accession': row.get('genome_accession'),
-            'genome_size': safe_int(row.get('genome_size')),
-            'protein_count': safe_int(row.get('protein_count')),
-            'gtdb_kingdom': row.get('gtdb_kingdom'),
-            'gtdb_phylum': row.get('gtdb_phylum'),
-            'gtdb_class': row.get('gtdb_class'),
-            'gtdb_order': row.get('gtdb_order'),
-            'gtdb_family': row.get('gtdb_family'),
-            'gtdb_genus': row.get('gtdb_genus'),
-            'gtdb_species': row.get('gtdb_species'),
-            'ncbi_kingdom': row.get('ncbi_kingdom'),
-            'ncbi_phylum': row.get('ncbi_phylum'),
-            'ncbi_class': row.get('ncbi_class'),
-            'ncbi_order': row.get('ncbi_order'),
-            'ncbi_family': row.get('ncbi_family'),
-            'ncbi_genus': row.get('ncbi_genus'),
-            'ncbi_species': row.get('ncbi_species'),
-        }
-
-        if genome_version in existing_map:
-            # Update existing object fields
-            gm = existing_map[genome_version]
-            for key, val in defaults.items():
-                setattr(gm, key, val)
-            to_update.append(gm)
-        else:
-            # Create new instance
-            gm = GenomeMetadata(genome_version=genome_version, **defaults)
-            to_create.append(gm)
-
-    with transaction.atomic():
-        # Bulk update existing records in batches
-        for i in range(0, len(to_update), batch_size):
-            GenomeMetadata.objects.bulk_update(
-                to_update[i : i + batch_size],
-                fields=[
-                    'genome_accession',
-                    'genome_size',
-                    'protein_count',
-                    'gtdb_kingdom',
-                    'gtdb_phylum',
-                    'gtdb_class',
-                    'gtdb_order',
-                    'gtdb_family',
-                    'gtdb_genus',
-                    'gtdb_species',
-                    'ncbi_kingdom',
-                    'ncbi_phylum',
-                    'ncbi_class',
-                    'ncbi_order',
-                    'ncbi_family',
-                    'ncbi_genus',
-                    'ncbi_species',
-                ],
-            )
-
-        # Bulk create new records in batches
-        for i in range(0, len(to_create), batch_size):
-            GenomeMetadata.objects.bulk_create(to_create[i : i + batch_size])
-
-    logger.info(f"Created {len(to_create)} new GenomeMetadata records")
-    logger.info(f"Updated {len(to_update)} existing GenomeMetadata records")
+            yield tuple(safe_int(row.get(field)) if field in INTEGER_FIELDS else row.get(field) for field in FIELDS)
+
+
+def load_genome_metadata_from_tsv(file_path=None, workers=1, delete_missing=False):
+    """
+    Load or update GenomeMetadata entries from TSV files and refresh the taxonomy trees built from them.
+    Rows are staged with COPY and merged with a single INSERT ... ON CONFLICT that only rewrites changed rows.
+    Args:
+        file_path (Path or str): Path to a TSV file, a directory of TSV files or a glob pattern.
+        workers (int): Number of processes parsing and staging the files.
+        delete_missing (bool): Delete GenomeMetadata entries that are not present in the files.
+    Returns:
+        dict: Number of created, updated, unchanged and deleted entries.
+    """
+    file_paths = resolve_input_files(file_path, FILE_PATH)
+
+    with staged_files(GenomeMetadata, FIELDS, iter_genome_metadata_rows, file_paths, STAGING_TABLE, workers) as (staging_table, staged):
+        with transaction.atomic(), connection.cursor() as cursor:
+            created, updated, unchanged = upsert_from_staging(cursor, GenomeMetadata, staging_table, FIELDS, key_fields=['genome_version'])
+
+            deleted = 0
+            if delete_missing:
+                # An empty input is almost certainly a mistake, never let it wipe the table
+                if created + updated + unchanged:
+                    deleted = delete_missing_rows(GenomeMetadata, staging_table, ['genome_version'])
+                else:
+                    logger.warning("No GenomeMetadata rows were loaded, skipping deletion of missing rows")
+
+            if created or updated or deleted:
+                taxonomy = refresh_taxonomy(cursor)
+                if taxonomy["created"] or taxonomy["updated"] or taxonomy["deleted"]:
+                    record_load(TaxonomyNode, TaxonomyClosure)
+                if taxonomy["statistics"]:
+                    record_load(DomainStatisticsPerTaxon)
+
+            if created or updated:
+                record_load(GenomeMetadata)
+            if deleted:
+                # Deleted genomes cascade to their statistics
+                record_load(GenomeMetadata, DomainStatisticsPerProtein, DomainStatisticsPerGenome, TaxonGenomeLink)
+                refresh_facets(DomainStatisticsPerGenome)
+
+    logger.info(f"Created {created} new GenomeMetadata records")
+    logger.info(f"Updated {updated} existing GenomeMetadata records")
+    logger.info(f"Skipped {unchanged} unchanged GenomeMetadata records")
+    logger.info(f"Deleted {deleted} missing GenomeMetadata records")
+
+    return {"created": created, "updated": updated, "unchanged": unchanged, "deleted": deleted}
@@ -0,0 +1,84 @@
+import glob
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from uuid import uuid4
+
+import django
+from django.db import connection, connections
+from signalp.loaders.staging import create_staging_table, drop_staging_table, stage_chunk, quote
+
+
+def resolve_input_files(file_path, default_path):
+    """
+    Resolve the --file argument of the load_* commands into a list of TSV files.
+    Args:
+        file_path (Path or str): A file, a directory (all *.tsv files in it) or a glob pattern.
+            Falls back to default_path when None.
+    Returns:
+        list: Paths sorted by name, which is also the order in which chunks take precedence.
+    """
+    if file_path is None:
+        file_path = default_path
+
+    path = Path(file_path)
+    if path.is_dir():
+        file_paths = sorted(p for p in path.glob("*.tsv") if p.is_file())
+    elif path.is_file():
+        file_paths = [path]
+    else:
+        file_paths = sorted(Path(p) for p in glob.glob(str(file_path)) if Path(p).is_file())
+
+    if not file_paths:
+        raise FileNotFoundError(f"File {file_path} does not exist")
+    return file_paths
+
+
+def _init_worker():
+    # A no-op for forked workers, needed when workers are spawned
+    django.setup()
+
+
+def _stage_chunk(args):
+    return stage_chunk(*args)
+
+
+@contextmanager
+def staged_files(model, field_names, iter_rows, file_paths, table_name, workers=1):
+    """
+    Stage every input file into a fresh staging table and drop the table afterwards.
+    With workers > 1 the files are parsed, validated and COPYed by a pool of processes,
+    each writing through its own database connection. Rows keep their file order, so
+    merges resolve duplicated keys exactly like a sequential load.
+    Args:
+        iter_rows (callable): Module level function yielding row tuples for a file path.
+        workers (int): Number of worker processes.
+    Yields:
+        (staging table name, number of rows staged)
+    """
+    parallel = workers > 1 and len(file_paths) > 1
+    if parallel and connection.in_atomic_block:
+        raise RuntimeError("Parallel loading uses its own connections and cannot run inside a transaction")
+
+    # Unique name so that concurrent loads of the same model do not collide
+    table_name = f"{table_name}_{uuid4().hex[:8]}"
+    with connection.cursor() as cursor:
+        create_staging_table(cursor, model, field_names, table_name)
+
+    try:
+        tasks = [(model, field_names, iter_rows, path, table_name, chunk_number) for chunk_number, path in enumerate(file_paths)]
+        if parallel:
+            # Forked workers must not share the parent's database connection
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+                staged = sum(executor.map(_stage_chunk, tasks))
+        else:
+            staged = sum(_stage_chunk(task) for task in tasks)
+
+        with connection.cursor() as cursor:
+            # Autovacuum may not have analyzed the fresh table yet, without statistics the merge joins get poor plans
+            cursor.execute(f"ANALYZE {quote(table_name)}")
+        yield table_name, staged
+    finally:
+        with connection.cursor() as cursor:
+            drop_staging_table(cursor, table_name)
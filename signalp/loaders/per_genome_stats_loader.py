@@ -3,7 +3,14 @@ import logging
 from pathlib import Path
 from decimal import Decimal, InvalidOperation
 
-from django.db import transaction
+from django.db import connection, transaction
+from signalp.caching import record_load
+from signalp.facets import refresh_facets
+from signalp.loaders.domains import domain_ids_sql, register_domains
+from signalp.loaders.parallel import resolve_input_files, staged_files
+from signalp.loaders.rebuild import rebuild_from_staging
+from signalp.loaders.staging import delete_missing_rows, delete_unmatched_rows, upsert_from_staging
+from signalp.loaders.taxon_aggregation import mark_all_taxa_stale
 from signalp.models import DomainStatisticsPerGenome, GenomeMetadata
 
 logger = logging.getLogger(__name__)
@@ -22,17 +29,29 @@ def safe_decimal(value):
     except (InvalidOperation, ValueError, TypeError):
         return None
 
-def load_domain_statistics_per_genome(file_path=None, batch_size=1000):
-    if file_path is None:
-        file_path = FILE_PATH
-
-    file_path = Path(file_path)
-    if not file_path.is_file():
-        raise FileNotFoundError(f"File {file_path} does not exist")
-
-    rows = []
-    genome_versions = set()
-
+FIELDS = [
+    "genome",
+    "genome_accession",
+    "source",
+    "protein_type",
+    "domains",
+    "domain_combination_type",
+    "count_raw",
+    "count_normalized_by_genome_size",
+    "count_normalized_by_total_proteins",
+]
+
+KEY_FIELDS = ["genome", "source", "protein_type", "domains", "domain_combination_type"]
+# Name of the UniqueConstraint declared on DomainStatisticsPerGenome over KEY_FIELDS
+UNIQUE_CONSTRAINT = "unique_domain_statistics_per_genome"
+
+STAGING_TABLE = "staging_domain_statistics_per_genome"
+
+
+def iter_genome_stats_rows(file_path):
+    """
+    Yield validated rows from the TSV file as tuples ordered like FIELDS.
+    """
     with file_path.open(newline='') as tsvfile:
         reader = csv.DictReader(tsvfile, delimiter='\t')
         for row_num, row in enumerate(reader, start=1):
@@ -45,68 +64,71 @@ def load_domain_statistics_per_genome(file_path=None, batch_size=1000):
             if not genome_version or not source or not protein_type or not domains or not domain_combination_type:
                 logger.warning(f"Skipping row {row_num} due to missing required fields: {row}")
                 continue
-            
-            genome_versions.add(genome_version)
-            rows.append(row)
-
-    # We extracting genome versions from the metadat table to ensure by comparision with this data that
-    # all per_genome_stats entries have genomes associated with them in the genome_metadata table (see below "Check existance" during loading data)
-    genome_map = {gm.genome_version: gm for gm in GenomeMetadata.objects.filter(genome_version__in=genome_versions)}
-    existing_entires = DomainStatisticsPerGenome.objects.filter(genome__genome_version__in=genome_versions)
-    existing_map = {
-        (obj.genome.genome_version, obj.source, obj.protein_type, obj.domains, obj.domain_combination_type): obj
-        for obj in existing_entires
-    }
-
-    to_create = []
-    to_update = []
-
-    for row in rows:
-        genome = genome_map.get(row["genome"])
-        # Check existance: load records only if associated genomes are present in the genome_metadata table
-        if not genome:
-            logger.warning(f"Skipping row with unknown genome: {row['genome']}")
-            continue
-
-        key = (row["genome"], row["source"], row["protein_type"], row["domains"], row["domain_combination_type"])
-        defaults = {
-            "genome": genome,
-            "genome_accession": row.get("genome_accession"),
-            "source": row.get("source"),
-            "protein_type": row.get("protein_type"),
-            "domains": row.get("domains"),
-            "domain_combination_type": row.get("domain_combination_type"),
-            "count_raw": safe_int(row.get("count_raw")),
-            "count_normalized_by_genome_size": safe_decimal(row.get("count_normalized_by_genome_size")),
-            "count_normalized_by_total_proteins": safe_decimal(row.get("count_normalized_by_total_proteins")),
-        }
-
-        if key in existing_map:
-            obj = existing_map[key]
-            for field, value in defaults.items():
-                setattr(obj, field, value)
-            to_update.append(obj)
-        else:
-            to_create.append(DomainStatisticsPerGenome(**defaults))
-
-    with transaction.atomic():
-        for i in range(0, len(to_update), batch_size):
-            DomainStatisticsPerGenome.objects.bulk_update(
-                to_update[i:i + batch_size],
-                fields=[
-                    "genome_accession",
-                    "source",
-                    "protein_type",
-                    "domains",
-                    "domain_combination_type",
-                    "count_raw",
-                    "count_normalized_by_genome_size",
-                    "count_normalized_by_total_proteins",
-                ]
+
+            yield (
+                genome_version,
+                row.get("genome_accession"),
+                source,
+                protein_type,
+                domains,
+                domain_combination_type,
+                safe_int(row.get("count_raw")),
+                safe_decimal(row.get("count_normalized_by_genome_size")),
+                safe_decimal(row.get("count_normalized_by_total_proteins")),
             )
 
-        for i in range(0, len(to_create), batch_size):
-            DomainStatisticsPerGenome.objects.bulk_create(to_create[i:i + batch_size])
 
-    logger.info(f"Created {len(to_create)} new DomainStatisticsPerGenome records")
-    logger.info(f"Updated {len(to_update)} existing DomainStatisticsPerGenome records")
\ No newline at end of file
+def load_domain_statistics_per_genome(file_path=None, workers=1, delete_missing=False, rebuild=False):
+    """
+    Load or update DomainStatisticsPerGenome entries from TSV files.
+    Rows are staged with COPY and merged with a single INSERT ... ON CONFLICT that only rewrites changed rows.
+    Args:
+        file_path (Path or str): Path to a TSV file, a directory of TSV files or a glob pattern.
+        workers (int): Number of processes parsing and staging the files.
+        delete_missing (bool): Delete DomainStatisticsPerGenome entries that are not present in the files.
+        rebuild (bool): Build a new table from the files and swap it in (see loaders.rebuild) instead of
+            merging into the table, faster when most rows are loaded anew.
+    Returns:
+        dict: Number of created, updated, unchanged and deleted entries.
+    """
+    file_paths = resolve_input_files(file_path, FILE_PATH)
+
+    with staged_files(DomainStatisticsPerGenome, FIELDS, iter_genome_stats_rows, file_paths, STAGING_TABLE, workers) as (staging_table, staged):
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Check existance: load records only if associated genomes are present in the genome_metadata table
+            unknown_genomes = delete_unmatched_rows(cursor, staging_table, "genome_id", GenomeMetadata._meta.db_table, "genome_version")
+            for genome in sorted(unknown_genomes):
+                logger.warning(f"Skipping rows with unknown genome: {genome}")
+
+            register_domains(cursor, staging_table)
+            if rebuild:
+                created, updated, unchanged, deleted = rebuild_from_staging(
+                    cursor, DomainStatisticsPerGenome, staging_table, FIELDS, key_fields=KEY_FIELDS,
+                    computed_columns={"domain_ids": domain_ids_sql()}, delete_missing=delete_missing
+                )
+                # The new table is filled before its triggers exist, none of its changes marked their taxa stale
+                if created or updated or deleted:
+                    mark_all_taxa_stale(cursor)
+            else:
+                created, updated, unchanged = upsert_from_staging(
+                    cursor, DomainStatisticsPerGenome, staging_table, FIELDS, key_fields=KEY_FIELDS, constraint=UNIQUE_CONSTRAINT,
+                    computed_columns={"domain_ids": domain_ids_sql()}
+                )
+                deleted = 0
+                if delete_missing:
+                    # An empty input is almost certainly a mistake, never let it wipe the table
+                    if created + updated + unchanged:
+                        deleted = delete_missing_rows(DomainStatisticsPerGenome, staging_table, KEY_FIELDS)
+                    else:
+                        logger.warning("No DomainStatisticsPerGenome rows were loaded, skipping deletion of missing rows")
+
+            if created or updated or deleted:
+                record_load(DomainStatisticsPerGenome)
+                refresh_facets(DomainStatisticsPerGenome)
+
+    logger.info(f"Created {created} new DomainStatisticsPerGenome records")
+    logger.info(f"Updated {updated} existing DomainStatisticsPerGenome records")
+    logger.info(f"Skipped {unchanged} unchanged DomainStatisticsPerGenome records")
+    logger.info(f"Deleted {deleted} missing DomainStatisticsPerGenome records")
+
+    return {"created": created, "updated": updated, "unchanged": unchanged, "deleted": deleted}
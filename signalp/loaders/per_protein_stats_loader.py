@@ -1,8 +1,14 @@
 import csv
+import json
 import logging
 from pathlib import Path
 
-from django.db import transaction
+from django.db import connection, transaction
+from signalp.caching import record_load
+from signalp.loaders.domains import domain_id_map, domain_ids_sql, register_domains, split_domains
+from signalp.loaders.parallel import resolve_input_files, staged_files
+from signalp.loaders.rebuild import rebuild_from_staging
+from signalp.loaders.staging import delete_missing_rows, delete_unmatched_rows, upsert_from_staging
 from signalp.models import DomainStatisticsPerProtein, GenomeMetadata
 
 logger = logging.getLogger(__name__)
@@ -15,6 +21,19 @@ def safe_int(value):
     except (ValueError, TypeError):
         return None
 
+def parse_domain_counts(value):
+    """
+    Parse a "HisKA:1,HATPase_c:2" domain counts column into {"HisKA": 1, "HATPase_c": 2}, so that
+    domain_counts can be queried with JSONB containment. Malformed entries are skipped, None when nothing is left.
+    """
+    counts = {}
+    for item in (value or '').split(','):
+        name, _, count = item.strip().rpartition(':')
+        count = safe_int(count)
+        if name and count is not None:
+            counts[name] = count
+    return counts or None
+
 def load_domain_statistics_per_protein(file_path=None, batch_size=1000):
     if file_path is None:
         file_path = FILE_PATH
@@ -46,6 +65,7 @@ def load_domain_statistics_per_protein(file_path=None, batch_size=1000):
     genome_map = {gm.genome_version: gm for gm in GenomeMetadata.objects.filter(genome_version__in=genome_versions)}
     existing_entries = DomainStatisticsPerProtein.objects.filter(genome__genome_version__in=genome_versions)
     existing_map = { obj.mist_protein_accession: obj for obj in existing_entries }
+    domain_ids = domain_id_map(name for row in rows for name in split_domains(row.get("domains")))
 
     to_create = []
     to_update = []
@@ -68,8 +88,11 @@ def load_domain_statistics_per_protein(file_path=None, batch_size=1000):
             "protein_length": safe_int(row.get("protein_length")),
             "domain_architecture": row.get("domain_architecture"),
             "sensors_or_regulators": row.get("sensors_or_regulators"),
-            "domain_counts": row.get("domain_counts"),
+            "domain_counts": parse_domain_counts(row.get("domain_counts")),
             "domains": row.get("domains"),
+            "domain_ids": [domain_ids[name] for name in split_domains(row.get("domains"))],
+            # Not hashed here, the next streamed load rewrites the row instead of taking it as unchanged
+            "content_hash": None,
         }
 
         if mist_protein_accession in existing_map:
@@ -96,11 +119,120 @@ def load_domain_statistics_per_protein(file_path=None, batch_size=1000):
                     "sensors_or_regulators",
                     "domain_counts",
                     "domains",
+                    "domain_ids",
+                    "content_hash",
                 ],
             )
 
         for i in range(0, len(to_create), batch_size):
             DomainStatisticsPerProtein.objects.bulk_create(to_create[i:i + batch_size])
 
+        record_load(DomainStatisticsPerProtein)
+
     logger.info(f"Created {len(to_create)} new DomainStatisticsPerProtein records")
-    logger.info(f"Updated {len(to_update)} existing DomainStatisticsPerProtein records")
\ No newline at end of file
+    logger.info(f"Updated {len(to_update)} existing DomainStatisticsPerProtein records")
+
+
+STAGING_TABLE = "staging_domain_statistics_per_protein"
+
+STREAM_FIELDS = [
+    "genome",
+    "genome_accession",
+    "ncbi_protein_accession",
+    "mist_protein_accession",
+    "protein_type",
+    "source",
+    "protein_length",
+    "domain_architecture",
+    "sensors_or_regulators",
+    "domain_counts",
+    "domains",
+]
+
+
+def iter_protein_rows(file_path):
+    """
+    Yield validated rows from the TSV file as tuples ordered like STREAM_FIELDS.
+    Rows are produced one at a time so the file is never held in memory.
+    """
+    with file_path.open(newline='') as tsvfile:
+        reader = csv.DictReader(tsvfile, delimiter='\t')
+        for row_num, row in enumerate(reader, start=1):
+            genome_version = row.get("genome")
+            mist_protein_accession = row.get("mist_protein_accession")
+            source = row.get("source")
+            protein_type = row.get("protein_type")
+
+            if not mist_protein_accession or not genome_version or not source or not protein_type:
+                logger.warning(f"Skipping row {row_num} due to missing required fields: {row}")
+                continue
+
+            domain_counts = parse_domain_counts(row.get("domain_counts"))
+            yield (
+                genome_version,
+                row.get("genome_accession"),
+                row.get("ncbi_protein_accession"),
+                mist_protein_accession,
+                protein_type,
+                source,
+                safe_int(row.get("protein_length")),
+                row.get("domain_architecture"),
+                row.get("sensors_or_regulators"),
+                # Stored the same way the ORM loader stores it: as a JSON object of counts per domain
+                json.dumps(domain_counts) if domain_counts is not None else None,
+                row.get("domains"),
+            )
+
+
+def stream_domain_statistics_per_protein(file_path=None, workers=1, delete_missing=False, rebuild=False):
+    """
+    Load or update DomainStatisticsPerProtein entries by streaming TSV files through
+    PostgreSQL COPY into a staging table and merging it with a single INSERT ... ON CONFLICT.
+    Peak memory stays constant regardless of the file size.
+    Args:
+        file_path (Path or str): Path to a TSV file, a directory of TSV files or a glob pattern.
+        workers (int): Number of processes parsing and staging the files.
+        delete_missing (bool): Delete DomainStatisticsPerProtein entries that are not present in the files.
+        rebuild (bool): Build a new table from the files and swap it in (see loaders.rebuild) instead of
+            merging into the table, faster when most rows are loaded anew.
+    Returns:
+        dict: Number of created, updated, unchanged and deleted entries.
+    """
+    file_paths = resolve_input_files(file_path, FILE_PATH)
+
+    with staged_files(DomainStatisticsPerProtein, STREAM_FIELDS, iter_protein_rows, file_paths, STAGING_TABLE, workers) as (staging_table, staged):
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Check existance: load records only if associated genomes are present in the genome_metadata table
+            unknown_genomes = delete_unmatched_rows(cursor, staging_table, "genome_id", GenomeMetadata._meta.db_table, "genome_version")
+            for genome in sorted(unknown_genomes):
+                logger.warning(f"Skipping rows with unknown genome: {genome}")
+
+            register_domains(cursor, staging_table)
+            if rebuild:
+                created, updated, unchanged, deleted = rebuild_from_staging(
+                    cursor, DomainStatisticsPerProtein, staging_table, STREAM_FIELDS, key_fields=["mist_protein_accession"],
+                    computed_columns={"domain_ids": domain_ids_sql()}, delete_missing=delete_missing
+                )
+            else:
+                created, updated, unchanged = upsert_from_staging(
+                    cursor, DomainStatisticsPerProtein, staging_table, STREAM_FIELDS, key_fields=["mist_protein_accession"],
+                    computed_columns={"domain_ids": domain_ids_sql()}
+                )
+                deleted = 0
+                if delete_missing:
+                    # An empty input is almost certainly a mistake, never let it wipe the table
+                    if created + updated + unchanged:
+                        deleted = delete_missing_rows(DomainStatisticsPerProtein, staging_table, ["mist_protein_accession"])
+                    else:
+                        logger.warning("No DomainStatisticsPerProtein rows were loaded, skipping deletion of missing rows")
+
+            if created or updated or deleted:
+                record_load(DomainStatisticsPerProtein)
+
+    logger.info(f"Staged {staged} DomainStatisticsPerProtein rows")
+    logger.info(f"Created {created} new DomainStatisticsPerProtein records")
+    logger.info(f"Updated {updated} existing DomainStatisticsPerProtein records")
+    logger.info(f"Skipped {unchanged} unchanged DomainStatisticsPerProtein records")
+    logger.info(f"Deleted {deleted} missing DomainStatisticsPerProtein records")
+
+    return {"created": created, "updated": updated, "unchanged": unchanged, "deleted": deleted}
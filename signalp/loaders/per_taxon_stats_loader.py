@@ -3,9 +3,18 @@ import logging
 from pathlib import Path
 from decimal import Decimal, InvalidOperation
 from collections import defaultdict
-
-from django.db import transaction
-from signalp.models import DomainStatisticsPerTaxon, GenomeMetadata
+from functools import partial
+
+from django.db import connection, transaction
+from signalp.caching import record_load
+from signalp.facets import refresh_facets
+from signalp.loaders.domains import domain_ids_sql, register_domains
+from signalp.loaders.parallel import resolve_input_files, staged_files
+from signalp.loaders.rebuild import rebuild_from_staging
+from signalp.loaders.staging import delete_missing_rows, copy_rows, upsert_from_staging, drop_staging_table, quote
+from signalp.loaders.rank_index import build_rank_index
+from signalp.loaders.taxonomy import link_statistics_to_taxa
+from signalp.models import DomainStatisticsPerTaxon, TaxonGenomeLink, TaxonomySystem
 
 logger = logging.getLogger(__name__)
 
@@ -23,24 +32,44 @@ def safe_decimal(value):
     except (InvalidOperation, ValueError, TypeError):
         return None
 
-def load_domain_statistics_per_taxon(file_path=None, batch_size=1000):
-    if file_path is None:
-        file_path = FILE_PATH
-
-    file_path = Path(file_path)
-    if not file_path.is_file():
-        raise FileNotFoundError(f"File {file_path} does not exist")
-
-    rows = []
-    # gtdb_taxonomy_rank to gtdb_taxonomy_last dict to check in the genome metadata table for the presense of corresponding taxon entries before loading data
-    rank_to_last = defaultdict(set)
-        
+FIELDS = [
+    "taxonomy_system",
+    "gtdb_taxonomy_string",
+    "gtdb_taxonomy_last",
+    "gtdb_taxonomy_rank",
+    "source",
+    "protein_type",
+    "domains",
+    "domain_combination_type",
+    "count_raw",
+    "count_normalized_by_total_genomes",
+    "count_normalized_by_genome_size_by_total_genomes",
+    "count_normalized_by_total_proteins_by_total_genomes",
+]
+
+KEY_FIELDS = ["taxonomy_system", "gtdb_taxonomy_string", "source", "protein_type", "domains", "domain_combination_type"]
+# Name of the UniqueConstraint declared on DomainStatisticsPerTaxon over KEY_FIELDS
+UNIQUE_CONSTRAINT = "unique_domain_statistics_per_taxon"
+
+STAGING_TABLE = "staging_domain_statistics_per_taxon"
+MEMBERS_STAGING_TABLE = "staging_taxon_members"
+LOADED_STAGING_TABLE = "staging_loaded_taxa"
+LINKS_STAGING_TABLE = "staging_taxon_genome_links"
+# Name of the UniqueConstraint declared on TaxonGenomeLink over (taxon, genome)
+LINK_UNIQUE_CONSTRAINT = "unique_taxon_genome_link"
+
+
+def iter_taxon_stats_rows(file_path, taxonomy_system=TaxonomySystem.GTDB):
+    """
+    Yield validated rows from the TSV file as tuples ordered like FIELDS.
+    The taxa are read from the {taxonomy_system}_taxonomy_string, _last and _rank columns.
+    """
     with file_path.open(newline='') as tsvfile:
         reader = csv.DictReader(tsvfile, delimiter='\t')
         for row_num, row in enumerate(reader, start=1):
-            gtdb_taxonomy_string = row.get("gtdb_taxonomy_string")
-            gtdb_taxonomy_last = row.get("gtdb_taxonomy_last")
-            gtdb_taxonomy_rank = row.get("gtdb_taxonomy_rank")
+            gtdb_taxonomy_string = row.get(f"{taxonomy_system}_taxonomy_string")
+            gtdb_taxonomy_last = row.get(f"{taxonomy_system}_taxonomy_last")
+            gtdb_taxonomy_rank = row.get(f"{taxonomy_system}_taxonomy_rank")
             source = row.get("source")
             protein_type = row.get("protein_type")
             domains = row.get("domains")
@@ -49,98 +78,176 @@ def load_domain_statistics_per_taxon(file_path=None, batch_size=1000):
             if not gtdb_taxonomy_string or not source or not protein_type or not domains or not domain_combination_type:
                 logger.warning(f"Skipping row {row_num} due to missing required fields: {row}")
                 continue
-            
-            rank_to_last[gtdb_taxonomy_rank].add(gtdb_taxonomy_last)
-            rows.append(row)
-
-    # We are extracting GTDB taxonomy fields from the metadat table to ensure by comparision with this data that
-    # all DomainStatisticsPerTaxon entries have taxons associated with them in the genome_metadata table (see below "Check existance" during loading data)
-    # In addition, we create lasttaxon_to_genomes dictionary to set many-to-many relationships
-    taxons = set()
-    existing_entries = []
-    lasttaxon_to_genomes = {}  # maps the last_taxon to a list of associated genomes  ([genomeobj1, genomeobj2, ...])
-    
-    for rank, last_taxons in rank_to_last.items():
-        # To recreate the field name
-        rank="gtdb_" + rank
-        existing_entries.extend(list(DomainStatisticsPerTaxon.objects.filter(gtdb_taxonomy_last__in=last_taxons)))
-        for last_taxon in last_taxons:
-            # Here we do dynamic filtering of fields using **{rank: last_taxon} expression
-            genomes_qs = GenomeMetadata.objects.filter(**{rank: last_taxon})
-            genomes_list = list(genomes_qs)
-            lasttaxon_to_genomes[last_taxon] = genomes_list
-            taxons.update(set(genomes_qs.values_list(rank, flat=True)))
-
-    existing_map = {
-        (obj.gtdb_taxonomy_string, obj.source, obj.protein_type, obj.domains, obj.domain_combination_type): obj
-        for obj in existing_entries
-    }
-
-    to_create = []
-    to_update = []
-    for row in rows:
-        gtdb_taxonomy_last = row.get("gtdb_taxonomy_last")
-        # Check existance: load records only if associated taxons are present in the genome_metadata table
-        if not gtdb_taxonomy_last in taxons:
-            logger.warning(f"Skipping row with unknown taxonomy: {row.get("gtdb_taxonomy_last")}")
-            continue
-
-        key = (row["gtdb_taxonomy_string"], row["source"], row["protein_type"], row["domains"], row["domain_combination_type"])
-        defaults = {
-            "gtdb_taxonomy_string": row.get("gtdb_taxonomy_string"),
-            "gtdb_taxonomy_last": row.get("gtdb_taxonomy_last"),
-            "gtdb_taxonomy_rank": row.get("gtdb_taxonomy_rank"),
-            "source": row.get("source"),
-            "protein_type": row.get("protein_type"),
-            "domains": row.get("domains"),
-            "domain_combination_type": row.get("domain_combination_type"),
-            "count_raw": safe_int(row.get("count_raw")),
-            "count_normalized_by_total_genomes": safe_decimal(row.get("count_normalized_by_total_genomes")),
-            "count_normalized_by_genome_size_by_total_genomes": safe_decimal(row.get("count_normalized_by_genome_size_by_total_genomes")),
-            "count_normalized_by_total_proteins_by_total_genomes": safe_decimal(row.get("count_normalized_by_total_proteins_by_total_genomes")),
-        }
-
-        if key in existing_map:
-            obj = existing_map[key]
-            for field, value in defaults.items():
-                setattr(obj, field, value)
-            to_update.append(obj)
-        else:
-            to_create.append(DomainStatisticsPerTaxon(**defaults))
-
-    with transaction.atomic():
-        for i in range(0, len(to_update), batch_size):
-            DomainStatisticsPerTaxon.objects.bulk_update(
-                to_update[i:i + batch_size],
-                fields=[
-                    "gtdb_taxonomy_string",
-                    "gtdb_taxonomy_last",
-                    "gtdb_taxonomy_rank",
-                    "source",
-                    "protein_type",
-                    "domains",
-                    "domain_combination_type",
-                    "count_raw",
-                    "count_normalized_by_total_genomes",
-                    "count_normalized_by_genome_size_by_total_genomes",
-                    "count_normalized_by_total_proteins_by_total_genomes",
-                ]
-            )
 
-        for i in range(0, len(to_create), batch_size):
-            DomainStatisticsPerTaxon.objects.bulk_create(to_create[i:i + batch_size])
-       
-        # Assign M2M relationships
-        assign_m2m_relationships(to_update, lasttaxon_to_genomes)
-        assign_m2m_relationships(to_create, lasttaxon_to_genomes)
-
-
-    logger.info(f"Created {len(to_create)} new DomainStatisticsPerTaxon records")
-    logger.info(f"Updated {len(to_update)} existing DomainStatisticsPerTaxon records")
+            yield (
+                taxonomy_system,
+                gtdb_taxonomy_string,
+                gtdb_taxonomy_last,
+                gtdb_taxonomy_rank,
+                source,
+                protein_type,
+                domains,
+                domain_combination_type,
+                safe_int(row.get("count_raw")),
+                safe_decimal(row.get("count_normalized_by_total_genomes")),
+                safe_decimal(row.get("count_normalized_by_genome_size_by_total_genomes")),
+                safe_decimal(row.get("count_normalized_by_total_proteins_by_total_genomes")),
+            )
 
 
-def assign_m2m_relationships(object_list, lasttaxon_to_genomes):
-    if object_list:
-        for obj in object_list:
-            genomeobjs = lasttaxon_to_genomes[obj.gtdb_taxonomy_last]
-            obj.genomes.set(genomeobjs)
+def load_domain_statistics_per_taxon(file_path=None, workers=1, delete_missing=False, rebuild=False, taxonomy_system=TaxonomySystem.GTDB):
+    """
+    Load or update DomainStatisticsPerTaxon entries of a taxonomy system from TSV files and link them to their genomes.
+    Rows are staged with COPY and merged with a single INSERT ... ON CONFLICT that only rewrites changed rows.
+    Args:
+        file_path (Path or str): Path to a TSV file, a directory of TSV files or a glob pattern.
+        workers (int): Number of processes parsing and staging the files.
+        delete_missing (bool): Delete DomainStatisticsPerTaxon entries of the taxonomy system that are not present in the files.
+        rebuild (bool): Build a new table from the files and swap it in (see loaders.rebuild) instead of
+            merging into the table, faster when most rows are loaded anew.
+        taxonomy_system (str): 'gtdb' or 'ncbi', the taxonomy of the files.
+    Returns:
+        dict: Number of created, updated, unchanged and deleted entries.
+    """
+    if taxonomy_system not in TaxonomySystem.values:
+        raise ValueError(f"Unknown taxonomy system '{taxonomy_system}', expected one of {', '.join(TaxonomySystem.values)}")
+    file_paths = resolve_input_files(file_path, FILE_PATH)
+    iter_rows = partial(iter_taxon_stats_rows, taxonomy_system=taxonomy_system)
+    # Rows of the other taxonomy system are never missing from the files
+    scope = {"taxonomy_system": taxonomy_system}
+
+    with staged_files(DomainStatisticsPerTaxon, FIELDS, iter_rows, file_paths, STAGING_TABLE, workers) as (staging_table, staged):
+        with transaction.atomic(), connection.cursor() as cursor:
+            # gtdb_taxonomy_rank to gtdb_taxonomy_last dict of the taxa present in the files
+            rank_to_last = defaultdict(set)
+            cursor.execute(f"SELECT DISTINCT gtdb_taxonomy_rank, gtdb_taxonomy_last FROM {quote(staging_table)}")
+            for rank, last_taxon in cursor.fetchall():
+                rank_to_last[rank].add(last_taxon)
+
+            # The taxa of the system are indexed with one scan of the genome metadata table. The index is used to ensure
+            # that all DomainStatisticsPerTaxon entries have taxons associated with them in the genome_metadata table
+            # (see below "Check existance") and to set many-to-many relationships
+            rank_index = build_rank_index(systems=[taxonomy_system])[taxonomy_system]
+            taxon_to_genome_ids = {}  # maps (taxonomy_system, gtdb_taxonomy_rank, gtdb_taxonomy_last) to a list of associated genome ids
+            for rank, last_taxons in rank_to_last.items():
+                genomes_by_taxon = rank_index.get(rank, {})
+                for last_taxon in last_taxons:
+                    if last_taxon in genomes_by_taxon:
+                        taxon_to_genome_ids[(taxonomy_system, rank, last_taxon)] = genomes_by_taxon[last_taxon]
+            stage_taxon_members(cursor, taxon_to_genome_ids)
+
+            # Check existance: load records only if associated taxons are present in the genome_metadata table
+            cursor.execute(
+                f"WITH deleted AS ("
+                f"DELETE FROM {quote(staging_table)} s WHERE NOT EXISTS ("
+                f"SELECT 1 FROM {quote(MEMBERS_STAGING_TABLE)} m "
+                f"WHERE m.system = s.taxonomy_system AND m.rank = s.gtdb_taxonomy_rank AND m.last = s.gtdb_taxonomy_last"
+                f") RETURNING s.gtdb_taxonomy_rank, s.gtdb_taxonomy_last"
+                f") SELECT DISTINCT gtdb_taxonomy_rank, gtdb_taxonomy_last FROM deleted"
+            )
+            for rank, taxon in sorted(cursor.fetchall(), key=str):
+                logger.warning(f"Skipping rows with unknown taxonomy: {rank} {taxon}")
+
+            register_domains(cursor, staging_table)
+            if rebuild:
+                created, updated, unchanged, deleted = rebuild_from_staging(
+                    cursor, DomainStatisticsPerTaxon, staging_table, FIELDS, key_fields=KEY_FIELDS,
+                    computed_columns={"domain_ids": domain_ids_sql()}, delete_missing=delete_missing, scope=scope
+                )
+            else:
+                created, updated, unchanged = upsert_from_staging(
+                    cursor, DomainStatisticsPerTaxon, staging_table, FIELDS, key_fields=KEY_FIELDS, constraint=UNIQUE_CONSTRAINT,
+                    computed_columns={"domain_ids": domain_ids_sql()}
+                )
+                deleted = 0
+                if delete_missing:
+                    # An empty input is almost certainly a mistake, never let it wipe the table
+                    if created + updated + unchanged:
+                        deleted = delete_missing_rows(DomainStatisticsPerTaxon, staging_table, KEY_FIELDS, scope=scope)
+                    else:
+                        logger.warning("No DomainStatisticsPerTaxon rows were loaded, skipping deletion of missing rows")
+
+            # Assign M2M relationships to every loaded row, changed or not
+            links_created, links_deleted = link_taxa_to_genomes(cursor, staging_table)
+            relinked = link_statistics_to_taxa(cursor)
+
+            if created or updated or deleted or relinked:
+                record_load(DomainStatisticsPerTaxon)
+                refresh_facets(DomainStatisticsPerTaxon)
+            if links_created or links_deleted:
+                record_load(TaxonGenomeLink)
+
+    logger.info(f"Created {created} new DomainStatisticsPerTaxon records")
+    logger.info(f"Updated {updated} existing DomainStatisticsPerTaxon records")
+    logger.info(f"Skipped {unchanged} unchanged DomainStatisticsPerTaxon records")
+    logger.info(f"Deleted {deleted} missing DomainStatisticsPerTaxon records")
+    logger.info(f"Created {links_created} and deleted {links_deleted} TaxonGenomeLink records")
+
+    return {"created": created, "updated": updated, "unchanged": unchanged, "deleted": deleted}
+
+
+def stage_taxon_members(cursor, taxon_to_genome_ids):
+    """
+    COPY the genome membership of the loaded taxa into a temporary table dropped at commit.
+    Args:
+        taxon_to_genome_ids (dict): Maps (taxonomy_system, gtdb_taxonomy_rank, gtdb_taxonomy_last) to genome ids.
+    """
+    members = quote(MEMBERS_STAGING_TABLE)
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {members} (system varchar(4), rank varchar(20), last varchar(100), genome_id bigint) ON COMMIT DROP"
+    )
+    copy_rows(
+        cursor, MEMBERS_STAGING_TABLE, ["system", "rank", "last", "genome_id"],
+        ((system, rank, last, genome_id) for (system, rank, last), genome_ids in taxon_to_genome_ids.items() for genome_id in genome_ids),
+    )
+    cursor.execute(f"ANALYZE {members}")
+
+
+def link_taxa_to_genomes(cursor, staging_table):
+    """
+    Make the TaxonGenomeLink rows of every taxon row in staging_table match its genomes.
+    The (taxon_id, genome_id) pairs are derived in SQL from the staged taxon membership, then
+    diffed against the existing links with one DELETE and one INSERT instead of a set() per row.
+    Returns:
+        (created, deleted) link counts.
+    """
+    taxon_table = quote(DomainStatisticsPerTaxon._meta.db_table)
+    link_table = quote(TaxonGenomeLink._meta.db_table)
+    members = quote(MEMBERS_STAGING_TABLE)
+    loaded = quote(LOADED_STAGING_TABLE)
+    pairs = quote(LINKS_STAGING_TABLE)
+    key_columns = ", ".join(quote(DomainStatisticsPerTaxon._meta.get_field(name).column) for name in KEY_FIELDS)
+
+    # The loaded taxon ids are materialized first: the planner badly underestimates the 5-column key join
+    # and would otherwise pick a nested loop over the members table
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {loaded} ON COMMIT DROP AS "
+        f"SELECT t.id, t.taxonomy_system AS system, t.gtdb_taxonomy_rank AS rank, t.gtdb_taxonomy_last AS last FROM {taxon_table} t "
+        f"JOIN {quote(staging_table)} s USING ({key_columns})"
+    )
+    cursor.execute(f"ANALYZE {loaded}")
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {pairs} ON COMMIT DROP AS "
+        f"SELECT l.id AS taxon_id, m.genome_id FROM {loaded} l JOIN {members} m USING (system, rank, last)"
+    )
+    cursor.execute(f"ANALYZE {pairs}")
+
+    # A set difference rather than NOT EXISTS: the anti join is estimated at one row when most pairs are new,
+    # and the planner would then rescan the pairs per existing link
+    cursor.execute(
+        f"DELETE FROM {link_table} l USING ("
+        f"SELECT k.taxon_id, k.genome_id FROM {link_table} k JOIN {loaded} t ON k.taxon_id = t.id "
+        f"EXCEPT SELECT taxon_id, genome_id FROM {pairs}"
+        f") stale WHERE l.taxon_id = stale.taxon_id AND l.genome_id = stale.genome_id"
+    )
+    deleted = cursor.rowcount
+    cursor.execute(
+        f"INSERT INTO {link_table} (taxon_id, genome_id) SELECT taxon_id, genome_id FROM {pairs} "
+        f"ON CONFLICT ON CONSTRAINT {quote(LINK_UNIQUE_CONSTRAINT)} DO NOTHING"
+    )
+    created = cursor.rowcount
+
+    drop_staging_table(cursor, LINKS_STAGING_TABLE)
+    drop_staging_table(cursor, LOADED_STAGING_TABLE)
+    drop_staging_table(cursor, MEMBERS_STAGING_TABLE)
+    return created, deleted
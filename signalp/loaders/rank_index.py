@@ -0,0 +1,23 @@
+from collections import defaultdict
+
+from signalp.models import GenomeMetadata, TaxonomySystem
+
+# Both taxonomy systems use the same ranks, stored in the {system}_{rank} fields of GenomeMetadata
+GTDB_RANKS = ['kingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']
+TAXONOMY_SYSTEMS = TaxonomySystem.values
+
+
+def build_rank_index(systems=TAXONOMY_SYSTEMS, chunk_size=10000):
+    """
+    Build an in-memory taxon to genome ids index for every rank of the taxonomy systems with a single scan of GenomeMetadata.
+    Returns:
+        dict: {system: {rank: {taxon: [genome_id, ...]}}}, e.g. index['ncbi']['order']['Thermococcales'].
+    """
+    index = {system: {rank: defaultdict(list) for rank in GTDB_RANKS} for system in systems}
+    fields = [(system, rank) for system in systems for rank in GTDB_RANKS]
+    for genome_id, *taxa in (GenomeMetadata.objects.values_list("id", *(f"{system}_{rank}" for system, rank in fields))
+                             .order_by("id").iterator(chunk_size=chunk_size)):
+        for (system, rank), taxon in zip(fields, taxa):
+            if taxon:
+                index[system][rank][taxon].append(genome_id)
+    return {system: {rank: dict(genomes_by_taxon) for rank, genomes_by_taxon in ranks.items()} for system, ranks in index.items()}
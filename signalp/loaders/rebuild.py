@@ -0,0 +1,181 @@
+import logging
+import re
+
+from django.conf import settings
+from django.db.models import CASCADE
+from django.db.models.expressions import RawSQL
+from signalp.loaders.staging import quote, staged_rows_sql
+from signalp.models import SEARCH_CONFIG, DomainStatisticsPerGenome, DomainStatisticsPerProtein, DomainStatisticsPerTaxon
+
+logger = logging.getLogger(__name__)
+
+# A rebuild loads a table from scratch instead of merging into it: the rows are written into an
+# index-free, trigger-free shadow table, the constraints, indexes and triggers of the live table are
+# recreated on it from the catalog, and it replaces the live table in the load transaction. Readers
+# keep querying the live table until the swap, writers wait for the load to commit.
+
+# Weighted columns of search_vector, as computed per row by the update_*_search_vector triggers (migration 0014)
+SEARCH_DOCUMENTS = {
+    DomainStatisticsPerProtein: [("domains", "A"), ("domain_architecture", "B"), ("sensors_or_regulators", "B")],
+    DomainStatisticsPerGenome: [("domains", "A")],
+    DomainStatisticsPerTaxon: [("domains", "A"), ("gtdb_taxonomy_string", "B")],
+}
+
+
+def search_vector_sql(model, alias="s"):
+    """
+    Return the SQL expression of the search_vector of a model row (alias), for set-based computation.
+    """
+    return " || ".join(
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({alias}.{quote(model._meta.get_field(name).column)}, '')), '{weight}')"
+        for name, weight in SEARCH_DOCUMENTS[model]
+    )
+
+
+def rebuild_from_staging(cursor, model, table_name, field_names, key_fields, computed_columns=None, delete_missing=False, scope=None):
+    """
+    Replace the model table by a table built from the staging table, for full reloads.
+    Rows keep the id of the existing row with the same key. Rows missing from the staging table are
+    carried over, or dropped when delete_missing, together with the rows referencing them (all relations
+    to the model must cascade). Must run inside a transaction.
+    Args:
+        key_fields (list): Fields identifying a row, the last staged occurrence of a key wins.
+        computed_columns (dict): Field name to SQL expression over the staged row (alias s), as for upsert_from_staging.
+        delete_missing (bool): Drop the rows that are not present in the staging table.
+        scope (dict): Field name to value, with delete_missing only matching rows are dropped.
+    Returns:
+        (created, updated, unchanged, deleted) counts.
+    """
+    table = model._meta.db_table
+    shadow = f"{table}_shadow"
+    pk = model._meta.pk.column
+    relations = [rel for rel in model._meta.related_objects if not rel.many_to_many]
+    for rel in relations:
+        if rel.on_delete is not CASCADE:
+            raise ValueError(f"{model.__name__} cannot be rebuilt, {rel.related_model.__name__}.{rel.field.name} does not cascade")
+
+    # Deferred foreign key checks pending on the table would block dropping it
+    cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+    # Reads continue, writes wait until the rebuilt table is committed
+    cursor.execute(f"LOCK TABLE {quote(table)} IN EXCLUSIVE MODE")
+    # Index builds sort in memory up to maintenance_work_mem
+    cursor.execute("SELECT set_config('maintenance_work_mem', %s, true)", [settings.REBUILD_MAINTENANCE_WORK_MEM])
+
+    cursor.execute(
+        f"CREATE TABLE {quote(shadow)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING GENERATED INCLUDING STORAGE)"
+    )
+    # New rows continue the id sequence of the live table
+    cursor.execute("SELECT pg_get_serial_sequence(%s, %s), pg_get_serial_sequence(%s, %s)", [table, pk, shadow, pk])
+    sequence, shadow_sequence = cursor.fetchone()
+    cursor.execute("SELECT setval(%s, nextval(%s))", [shadow_sequence, sequence])
+
+    computed = dict(computed_columns or {}, search_vector=search_vector_sql(model))
+    source_sql, columns = staged_rows_sql(model, table_name, field_names, key_fields, computed)
+    hash_column = quote(model._meta.get_field("content_hash").column)
+    key_match = " AND ".join(
+        f"t.{quote(column)} = source.{quote(column)}" for column in (model._meta.get_field(name).column for name in key_fields)
+    )
+    column_list = ", ".join(quote(column) for column in columns)
+    cursor.execute(
+        f"WITH source AS ({source_sql}), matched AS ("
+        f"SELECT source.*, t.{quote(pk)} AS existing_id, t.{hash_column} AS existing_hash "
+        f"FROM source LEFT JOIN {quote(table)} t ON {key_match}"
+        f"), inserted AS ("
+        f"INSERT INTO {quote(shadow)} ({quote(pk)}, {column_list}) "
+        f"SELECT coalesce(existing_id, nextval(%s)), {column_list} FROM matched"
+        f") SELECT count(*) FILTER (WHERE existing_id IS NULL), "
+        f"count(*) FILTER (WHERE existing_id IS NOT NULL AND existing_hash IS DISTINCT FROM {hash_column}), count(*) FROM matched",
+        [shadow_sequence],
+    )
+    created, updated, total = cursor.fetchone()
+
+    missing = f"FROM {quote(table)} t WHERE NOT EXISTS (SELECT 1 FROM {quote(shadow)} source WHERE {key_match})"
+    scope = scope or {}
+    in_scope = " AND ".join(f"t.{quote(model._meta.get_field(name).column)} = %s" for name in scope) or "true"
+    deleted = 0
+    if delete_missing and total:
+        cursor.execute(f"SELECT count(*) {missing} AND {in_scope}", list(scope.values()))
+        deleted = cursor.fetchone()[0]
+        cursor.execute(f"INSERT INTO {quote(shadow)} SELECT t.* {missing} AND NOT ({in_scope})", list(scope.values()))
+    else:
+        if delete_missing:
+            # An empty input is almost certainly a mistake, never let it wipe the table
+            logger.warning(f"No {model.__name__} rows were loaded, skipping deletion of missing rows")
+        cursor.execute(f"INSERT INTO {quote(shadow)} SELECT t.* {missing}")
+
+    build_like(cursor, table, shadow)
+    swap_tables(cursor, model, shadow, sequence, shadow_sequence, relations)
+    cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+    return created, updated, total - created - updated, deleted
+
+
+def build_like(cursor, table, shadow):
+    """
+    Create the constraints, indexes and triggers of table on shadow. Constraints and indexes get
+    temporary names (index names are unique per schema), swap_tables gives them back their names.
+    """
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype <> 'n' ORDER BY conname",
+        [table],
+    )
+    for number, (name, definition) in enumerate(cursor.fetchall()):
+        cursor.execute(f"ALTER TABLE {quote(shadow)} ADD CONSTRAINT {quote(f'{shadow}_c{number}')} {definition}")
+
+    # Indexes of primary key, unique and exclusion constraints were created with them
+    cursor.execute(
+        "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i WHERE i.indrelid = %s::regclass "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conrelid = i.indrelid AND c.conindid = i.indexrelid) "
+        "ORDER BY i.indexrelid",
+        [table],
+    )
+    for number, (definition,) in enumerate(cursor.fetchall()):
+        cursor.execute(re.sub(r"^(CREATE (?:UNIQUE )?INDEX) \S+ ON (?:ONLY )?\S+ ", rf"\1 {shadow}_i{number} ON {shadow} ", definition))
+
+    cursor.execute("SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal", [table])
+    for (definition,) in cursor.fetchall():
+        cursor.execute(re.sub(rf" ON (?:\S+\.)?{table} ", f" ON {shadow} ", definition, count=1))
+
+
+def swap_tables(cursor, model, shadow, sequence, shadow_sequence, relations):
+    """
+    Drop the model table and rename shadow, with its constraints, indexes and id sequence, in its place.
+    Rows referencing dropped ids are deleted, foreign keys to the table are recreated on shadow.
+    """
+    table = model._meta.db_table
+    for rel in relations:
+        rel.related_model._base_manager.exclude(
+            **{f"{rel.field.attname}__in": RawSQL(f"SELECT {quote(model._meta.pk.column)} FROM {quote(shadow)}", [])}
+        ).filter(**{f"{rel.field.attname}__isnull": False}).delete()
+
+    cursor.execute(
+        "SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE confrelid = %s::regclass AND contype = 'f' AND conrelid <> confrelid",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    for referencing, name, _ in foreign_keys:
+        cursor.execute(f"ALTER TABLE {referencing} DROP CONSTRAINT {quote(name)}")
+
+    # Names of the live objects, matched to the shadow objects by the numbering of build_like
+    cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype <> 'n' ORDER BY conname", [table])
+    constraints = [name for (name,) in cursor.fetchall()]
+    cursor.execute(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE i.indrelid = %s::regclass "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conrelid = i.indrelid AND k.conindid = i.indexrelid) "
+        "ORDER BY i.indexrelid",
+        [table],
+    )
+    indexes = [name for (name,) in cursor.fetchall()]
+
+    cursor.execute(f"DROP TABLE {quote(table)}")
+    cursor.execute(f"ALTER TABLE {quote(shadow)} RENAME TO {quote(table)}")
+    for number, name in enumerate(constraints):
+        cursor.execute(f"ALTER TABLE {quote(table)} RENAME CONSTRAINT {quote(f'{shadow}_c{number}')} TO {quote(name)}")
+    for number, name in enumerate(indexes):
+        cursor.execute(f"ALTER INDEX {quote(f'{shadow}_i{number}')} RENAME TO {quote(name)}")
+    cursor.execute(f"ALTER SEQUENCE {shadow_sequence} RENAME TO {sequence.rsplit('.', 1)[-1]}")
+
+    for referencing, name, definition in foreign_keys:
+        cursor.execute(f"ALTER TABLE {referencing} ADD CONSTRAINT {quote(name)} {definition}")
+    # The new table has no planner statistics yet
+    cursor.execute(f"ANALYZE {quote(table)}")
@@ -0,0 +1,170 @@
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+# Staging tables hold raw rows streamed from the TSV files via COPY. Each row records the chunk
+# (input file) it came from and gets a row_number, so that merges can keep the last occurrence
+# of a duplicated key, which mirrors the "last row wins" behaviour of the ORM based loaders.
+CHUNK_COLUMN = "chunk_number"
+ROW_NUMBER_COLUMN = "row_number"
+# Models merged from staging tables keep an md5 of their loaded fields in this field
+HASH_FIELD = "content_hash"
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def staging_columns(model, field_names):
+    """
+    Return (column, db_type) pairs for the given model fields.
+    ForeignKey fields resolve to the column and type of their target field.
+    """
+    columns = []
+    for field_name in field_names:
+        field = model._meta.get_field(field_name)
+        columns.append((field.column, field.db_type(connection)))
+    return columns
+
+
+def create_staging_table(cursor, model, field_names, table_name):
+    """
+    Create an unlogged, index-free table shaped like the given model fields.
+    The table is unlogged rather than temporary so that worker processes, each with its
+    own connection, can COPY into it. Callers drop it with drop_staging_table.
+    """
+    column_defs = ", ".join(f"{quote(column)} {db_type}" for column, db_type in staging_columns(model, field_names))
+    cursor.execute(
+        f"CREATE UNLOGGED TABLE {quote(table_name)} "
+        f"({quote(CHUNK_COLUMN)} integer NOT NULL DEFAULT 0, {quote(ROW_NUMBER_COLUMN)} bigserial, {column_defs})"
+    )
+
+
+def drop_staging_table(cursor, table_name):
+    cursor.execute(f"DROP TABLE IF EXISTS {quote(table_name)}")
+
+
+def copy_rows(cursor, table_name, columns, rows):
+    """
+    Stream an iterable of row tuples into table_name with COPY FROM STDIN.
+    Rows are consumed lazily, so memory use does not depend on the input size.
+    Returns the number of rows copied.
+    """
+    column_list = ", ".join(quote(column) for column in columns)
+    copied = 0
+    with cursor.copy(f"COPY {quote(table_name)} ({column_list}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+            copied += 1
+    return copied
+
+
+def stage_chunk(model, field_names, iter_rows, file_path, table_name, chunk_number=0):
+    """
+    Parse one input file with iter_rows and COPY its rows into the staging table.
+    Runs on the default connection of the calling process, which may be a worker process.
+    Returns the number of rows staged.
+    """
+    columns = [CHUNK_COLUMN] + [model._meta.get_field(name).column for name in field_names]
+    with connection.cursor() as cursor:
+        return copy_rows(cursor, table_name, columns, ((chunk_number, *row) for row in iter_rows(file_path)))
+
+
+def delete_unmatched_rows(cursor, table_name, column, ref_table, ref_column):
+    """
+    Delete staged rows whose column value has no match in ref_table.ref_column.
+    Used to keep foreign-key style existence checks set-based.
+    Returns the set of unmatched values.
+    """
+    # Only the distinct values are sent back, not one row per deleted staged row
+    cursor.execute(
+        f"WITH deleted AS ("
+        f"DELETE FROM {quote(table_name)} s WHERE NOT EXISTS ("
+        f"SELECT 1 FROM {quote(ref_table)} r WHERE r.{quote(ref_column)} = s.{quote(column)}"
+        f") RETURNING s.{quote(column)}"
+        f") SELECT DISTINCT {quote(column)} FROM deleted"
+    )
+    return {value for (value,) in cursor.fetchall()}
+
+
+def staged_rows_sql(model, table_name, field_names, key_fields, computed_columns=None):
+    """
+    Build a SELECT of the last staged occurrence of every key, with the content hash of its loaded fields
+    and the computed columns.
+    Args:
+        computed_columns (dict): Field name to SQL expression over the staged row (alias s), for fields
+            derived from the loaded ones. They are left out of the content hash.
+    Returns:
+        (sql, columns) where columns are the model columns the SELECT returns, in order.
+    """
+    columns = [model._meta.get_field(name).column for name in field_names]
+    key_columns = [model._meta.get_field(name).column for name in key_fields]
+    hash_column = model._meta.get_field(HASH_FIELD).column
+    computed = [(model._meta.get_field(name).column, expression) for name, expression in (computed_columns or {}).items()]
+
+    staged_column_list = ", ".join(f"s.{quote(column)}" for column in columns)
+    key_list = ", ".join(f"s.{quote(column)}" for column in key_columns)
+    computed_select = "".join(f", {expression} AS {quote(column)}" for column, expression in computed)
+    # DISTINCT ON keeps the last occurrence of a duplicated key
+    sql = (
+        f"SELECT DISTINCT ON ({key_list}) {staged_column_list}, md5(ROW({staged_column_list})::text) AS {quote(hash_column)}{computed_select} "
+        f"FROM {quote(table_name)} s "
+        f"ORDER BY {key_list}, s.{quote(CHUNK_COLUMN)} DESC, s.{quote(ROW_NUMBER_COLUMN)} DESC"
+    )
+    return sql, columns + [hash_column] + [column for column, _ in computed]
+
+
+def upsert_from_staging(cursor, model, table_name, field_names, key_fields, constraint=None, computed_columns=None):
+    """
+    Merge the staging table into the model table with a single INSERT ... ON CONFLICT DO UPDATE.
+    Every row gets a content hash of its loaded fields, and existing rows are only rewritten when
+    their hash differs, so unchanged rows cost neither a trigger call nor a dead tuple.
+    Args:
+        key_fields (list): Fields identifying a row, the last staged occurrence of a key wins.
+        constraint (str): Name of the unique constraint to resolve conflicts on.
+            If not given, the conflict target is inferred from key_fields.
+        computed_columns (dict): Field name to SQL expression over the staged row (alias s), for fields
+            derived from the loaded ones. They are merged but left out of the content hash.
+    Returns:
+        (created, updated, unchanged) counts.
+    """
+    table = quote(model._meta.db_table)
+    hash_column = quote(model._meta.get_field(HASH_FIELD).column)
+    key_columns = [model._meta.get_field(name).column for name in key_fields]
+    source_sql, columns = staged_rows_sql(model, table_name, field_names, key_fields, computed_columns)
+
+    column_list = ", ".join(quote(column) for column in columns)
+    update_list = ", ".join(f"{quote(column)} = EXCLUDED.{quote(column)}" for column in columns if column not in key_columns)
+    if constraint:
+        conflict_target = f"ON CONSTRAINT {quote(constraint)}"
+    else:
+        conflict_target = "(" + ", ".join(quote(column) for column in key_columns) + ")"
+
+    # ON CONFLICT cannot touch a row twice, source holds every key once
+    cursor.execute(
+        f"WITH source AS ({source_sql}), merged AS ("
+        f"INSERT INTO {table} AS target ({column_list}) SELECT * FROM source "
+        f"ON CONFLICT {conflict_target} DO UPDATE SET {update_list} "
+        f"WHERE target.{hash_column} IS DISTINCT FROM EXCLUDED.{hash_column} "
+        f"RETURNING (xmax = 0) AS created"
+        f") SELECT count(*) FILTER (WHERE created), count(*) FILTER (WHERE NOT created), (SELECT count(*) FROM source) FROM merged"
+    )
+    created, updated, total = cursor.fetchone()
+    return created, updated, total - created - updated
+
+
+def delete_missing_rows(model, table_name, key_fields, scope=None):
+    """
+    Delete model rows whose key is not present in the staging table, only among the rows matching
+    the scope filters (field name to value) if given.
+    Goes through the ORM so that cascades to dependent rows are applied.
+    Returns the number of deleted model rows.
+    """
+    table = quote(model._meta.db_table)
+    key_conditions = " AND ".join(
+        f"s.{quote(column)} = t.{quote(column)}" for column in (model._meta.get_field(name).column for name in key_fields)
+    )
+    missing = RawSQL(
+        f"SELECT t.id FROM {table} t WHERE NOT EXISTS (SELECT 1 FROM {quote(table_name)} s WHERE {key_conditions})", []
+    )
+    _, deleted_per_model = model._base_manager.filter(pk__in=missing, **(scope or {})).delete()
+    return deleted_per_model.get(model._meta.label, 0)
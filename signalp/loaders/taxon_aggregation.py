@@ -0,0 +1,138 @@
+import logging
+from uuid import uuid4
+
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from signalp.caching import record_load
+from signalp.facets import refresh_facets
+from signalp.loaders.domains import domain_ids_sql, register_domains
+from signalp.loaders.per_taxon_stats_loader import FIELDS, KEY_FIELDS, MEMBERS_STAGING_TABLE, UNIQUE_CONSTRAINT, link_taxa_to_genomes
+from signalp.loaders.staging import create_staging_table, drop_staging_table, quote, upsert_from_staging
+from signalp.loaders.taxonomy import lineages_sql, link_statistics_to_taxa
+from signalp.models import DomainStatisticsPerGenome, DomainStatisticsPerTaxon, GenomeMetadata, StaleTaxon, TaxonGenomeLink
+
+logger = logging.getLogger(__name__)
+
+# DomainStatisticsPerTaxon rows are aggregated from DomainStatisticsPerGenome for every GTDB and NCBI taxon:
+# the genomes of a taxon are the GenomeMetadata rows with the taxon at its rank, and its total genomes
+# their number. Per source, protein type, domains and domain combination type a taxon row holds
+#   count_raw: the sum of the genomes' count_raw
+#   count_normalized_by_total_genomes: count_raw / total genomes
+#   count_normalized_by_genome_size_by_total_genomes: sum of count_normalized_by_genome_size / total genomes
+#   count_normalized_by_total_proteins_by_total_genomes: sum of count_normalized_by_total_proteins / total genomes
+# Only the taxa listed in StaleTaxon are recomputed, the triggers of migration 0018 list the taxa of
+# every changed genome and per-genome statistics row.
+STAGING_TABLE = "staging_aggregated_taxa"
+STALE_STAGING_TABLE = "staging_stale_taxa"
+
+
+def mark_all_taxa_stale(cursor):
+    """
+    List every taxon of the genome metadata and of the aggregated statistics in StaleTaxon.
+    """
+    stale = quote(StaleTaxon._meta.db_table)
+    cursor.execute(
+        f"INSERT INTO {stale} (taxonomy_system, rank, name) "
+        f"SELECT taxon.system, taxon.rank, taxon.name FROM {quote(GenomeMetadata._meta.db_table)} g "
+        f"CROSS JOIN LATERAL (VALUES {lineages_sql()}) AS taxon(system, rank, name, lineage) WHERE taxon.name <> '' "
+        f"UNION SELECT taxonomy_system, gtdb_taxonomy_rank, gtdb_taxonomy_last FROM {quote(DomainStatisticsPerTaxon._meta.db_table)} "
+        f"WHERE gtdb_taxonomy_rank IS NOT NULL "
+        f"ON CONFLICT DO NOTHING"
+    )
+
+
+def aggregate_domain_statistics_per_taxon(full=False):
+    """
+    Recompute the DomainStatisticsPerTaxon rows and genome links of the stale taxa from DomainStatisticsPerGenome.
+    Rows of stale taxa that no longer aggregate any per-genome statistics are deleted.
+    Args:
+        full (bool): Recompute every taxon, replacing rows loaded from per-taxon files.
+    Returns:
+        dict: Number of taxa recomputed and of created, updated, unchanged and deleted entries.
+    """
+    taxon_table = quote(DomainStatisticsPerTaxon._meta.db_table)
+    # Unique name so that concurrent aggregations do not collide
+    staging_table = f"{STAGING_TABLE}_{uuid4().hex[:8]}"
+    stale = quote(STALE_STAGING_TABLE)
+    members = quote(MEMBERS_STAGING_TABLE)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if full:
+            mark_all_taxa_stale(cursor)
+        # Claim the stale taxa, a concurrent aggregation waits for them and then skips them
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {stale} ON COMMIT DROP AS "
+            f"WITH claimed AS (DELETE FROM {quote(StaleTaxon._meta.db_table)} RETURNING taxonomy_system AS system, rank, name) "
+            f"SELECT * FROM claimed"
+        )
+        taxa = cursor.rowcount
+        cursor.execute(f"ANALYZE {stale}")
+
+        # Empty ranks are not taxa, the rows aggregated for them are deleted
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {members} ON COMMIT DROP AS "
+            f"SELECT taxon.system, taxon.rank, taxon.name AS last, taxon.lineage, g.id AS genome_id, g.genome_version "
+            f"FROM {quote(GenomeMetadata._meta.db_table)} g "
+            f"CROSS JOIN LATERAL (VALUES {lineages_sql()}) AS taxon(system, rank, name, lineage) "
+            f"JOIN {stale} st ON st.system = taxon.system AND st.rank = taxon.rank AND st.name = taxon.name "
+            f"WHERE taxon.name <> ''"
+        )
+        cursor.execute(f"ANALYZE {members}")
+
+        create_staging_table(cursor, DomainStatisticsPerTaxon, FIELDS, staging_table)
+        try:
+            # A taxon whose genomes disagree on the higher ranks gets the most common taxonomy string
+            cursor.execute(
+                f"WITH taxa AS ("
+                f"SELECT system, rank, last, mode() WITHIN GROUP (ORDER BY lineage) AS lineage, count(*) AS total_genomes "
+                f"FROM {members} GROUP BY system, rank, last"
+                f") INSERT INTO {quote(staging_table)} ({', '.join(quote(DomainStatisticsPerTaxon._meta.get_field(name).column) for name in FIELDS)}) "
+                f"SELECT t.system, t.lineage, t.last, t.rank, s.source, s.protein_type, s.domains, s.domain_combination_type, sum(s.count_raw), "
+                f"round(sum(s.count_raw) / t.total_genomes::numeric, 7), "
+                f"round(sum(s.count_normalized_by_genome_size) / t.total_genomes, 9), "
+                f"round(sum(s.count_normalized_by_total_proteins) / t.total_genomes, 9) "
+                f"FROM taxa t JOIN {members} m USING (system, rank, last) "
+                f"JOIN {quote(DomainStatisticsPerGenome._meta.db_table)} s ON s.genome_id = m.genome_version "
+                f"GROUP BY t.system, t.rank, t.last, t.lineage, t.total_genomes, s.source, s.protein_type, s.domains, s.domain_combination_type"
+            )
+            cursor.execute(f"ANALYZE {quote(staging_table)}")
+
+            register_domains(cursor, staging_table)
+            created, updated, unchanged = upsert_from_staging(
+                cursor, DomainStatisticsPerTaxon, staging_table, FIELDS, key_fields=KEY_FIELDS, constraint=UNIQUE_CONSTRAINT,
+                computed_columns={"domain_ids": domain_ids_sql()}
+            )
+
+            # Goes through the ORM so that the genome links are deleted with the rows
+            key_conditions = " AND ".join(
+                f"s.{quote(column)} = t.{quote(column)}"
+                for column in (DomainStatisticsPerTaxon._meta.get_field(name).column for name in KEY_FIELDS)
+            )
+            outdated = RawSQL(
+                f"SELECT t.id FROM {taxon_table} t "
+                f"JOIN {stale} st ON st.system = t.taxonomy_system AND st.rank = t.gtdb_taxonomy_rank AND st.name = t.gtdb_taxonomy_last "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {quote(staging_table)} s WHERE {key_conditions})", []
+            )
+            _, deleted_per_model = DomainStatisticsPerTaxon._base_manager.filter(pk__in=outdated).delete()
+            deleted = deleted_per_model.get(DomainStatisticsPerTaxon._meta.label, 0)
+
+            links_created, links_deleted = link_taxa_to_genomes(cursor, staging_table)
+            drop_staging_table(cursor, STALE_STAGING_TABLE)
+        finally:
+            drop_staging_table(cursor, staging_table)
+        relinked = link_statistics_to_taxa(cursor)
+
+        if created or updated or deleted or relinked:
+            record_load(DomainStatisticsPerTaxon)
+            refresh_facets(DomainStatisticsPerTaxon)
+        if links_created or links_deleted or deleted:
+            record_load(TaxonGenomeLink)
+
+    logger.info(f"Aggregated {taxa} stale taxa")
+    logger.info(f"Created {created} new DomainStatisticsPerTaxon records")
+    logger.info(f"Updated {updated} existing DomainStatisticsPerTaxon records")
+    logger.info(f"Skipped {unchanged} unchanged DomainStatisticsPerTaxon records")
+    logger.info(f"Deleted {deleted} outdated DomainStatisticsPerTaxon records")
+    logger.info(f"Created {links_created} and deleted {links_deleted} TaxonGenomeLink records")
+
+    return {"taxa": taxa, "created": created, "updated": updated, "unchanged": unchanged, "deleted": deleted}
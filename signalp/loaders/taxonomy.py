@@ -0,0 +1,155 @@
+import logging
+
+from django.db.models.expressions import RawSQL
+from signalp.loaders.rank_index import GTDB_RANKS, TAXONOMY_SYSTEMS
+from signalp.loaders.staging import drop_staging_table, quote
+from signalp.models import DomainStatisticsPerTaxon, GenomeMetadata, TaxonomyClosure, TaxonomyNode
+
+logger = logging.getLogger(__name__)
+
+# The GTDB and NCBI trees are derived from the rank fields of GenomeMetadata: every ranked name is a
+# TaxonomyNode, the child of the taxon at the nearest ranked ancestor in the genomes' lineages.
+# TaxonomyClosure lists every ancestor of every node, so that subtrees and lineages are index range
+# scans instead of scans over the rank columns or LIKE matches on taxonomy strings. Genomes reference
+# their deepest taxon in each system and per-taxon statistics the taxon they describe.
+NODES_STAGING_TABLE = "staging_taxonomy_nodes"
+RANKS_SQL = "ARRAY[" + ", ".join(f"'{rank}'" for rank in GTDB_RANKS) + "]::varchar[]"
+
+
+def lineages_sql(alias="g"):
+    """
+    Return a VALUES list of (taxonomy system, rank, name, taxonomy string) per rank of both taxonomy systems
+    of a GenomeMetadata row (alias), for unpivoting genomes into the taxa they belong to.
+    """
+    return ", ".join(
+        f"('{system}', '{rank}', {alias}.{system}_{rank}, "
+        f"concat_ws(';', {', '.join(f'{alias}.{system}_{parent}' for parent in GTDB_RANKS[:depth + 1])}))"
+        for system in TAXONOMY_SYSTEMS
+        for depth, rank in enumerate(GTDB_RANKS)
+    )
+
+
+def refresh_taxonomy(cursor):
+    """
+    Make the TaxonomyNode trees and their closure match the ranks of the genome metadata, then point genomes
+    and per-taxon statistics at their nodes. Nodes that no genome has anymore are deleted. Must run inside a transaction.
+    Returns:
+        dict: Number of created, updated and deleted nodes, and of relinked genomes and statistics rows.
+    """
+    node_table = quote(TaxonomyNode._meta.db_table)
+    staged = quote(NODES_STAGING_TABLE)
+    depth = f"array_position({RANKS_SQL}, taxon.rank) - 1"
+    # A taxon whose genomes disagree on its lineage or parent gets the most common one. Empty ranks are
+    # skipped, the parent is the nearest named ancestor
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {staged} ON COMMIT DROP AS "
+        f"SELECT system, rank, name, depth, lineage, "
+        f"split_part(parent, ':', 1)::int AS parent_depth, substr(parent, strpos(parent, ':') + 1) AS parent_name FROM ("
+        f"SELECT system, rank, name, min(depth) AS depth, mode() WITHIN GROUP (ORDER BY lineage) AS lineage, "
+        f"mode() WITHIN GROUP (ORDER BY parent) AS parent FROM ("
+        f"SELECT taxon.system, taxon.rank, taxon.name, taxon.lineage, {depth} AS depth, "
+        f"lag(({depth}) || ':' || taxon.name) OVER (PARTITION BY g.id, taxon.system ORDER BY {depth}) AS parent "
+        f"FROM {quote(GenomeMetadata._meta.db_table)} g "
+        f"CROSS JOIN LATERAL (VALUES {lineages_sql()}) AS taxon(system, rank, name, lineage) WHERE taxon.name <> ''"
+        f") memberships GROUP BY system, rank, name"
+        f") taxa"
+    )
+    cursor.execute(f"ANALYZE {staged}")
+
+    # Top down, so that the parents of a level are merged before it
+    created = updated = 0
+    for level in range(len(GTDB_RANKS)):
+        cursor.execute(
+            f"WITH merged AS ("
+            f"INSERT INTO {node_table} AS n (taxonomy_system, rank, name, depth, lineage, parent_id) "
+            f"SELECT s.system, s.rank, s.name, s.depth, s.lineage, p.id FROM {staged} s "
+            f"LEFT JOIN {node_table} p ON p.taxonomy_system = s.system AND p.rank = ({RANKS_SQL})[s.parent_depth + 1] AND p.name = s.parent_name "
+            f"WHERE s.depth = %s "
+            f"ON CONFLICT ON CONSTRAINT unique_taxonomy_node DO UPDATE SET lineage = EXCLUDED.lineage, parent_id = EXCLUDED.parent_id "
+            f"WHERE (n.lineage, n.parent_id) IS DISTINCT FROM (EXCLUDED.lineage, EXCLUDED.parent_id) "
+            f"RETURNING (xmax = 0) AS created"
+            f") SELECT count(*) FILTER (WHERE created), count(*) FILTER (WHERE NOT created) FROM merged",
+            [level],
+        )
+        level_created, level_updated = cursor.fetchone()
+        created += level_created
+        updated += level_updated
+
+    # Goes through the ORM so that genomes and statistics let go of the deleted nodes
+    outdated = RawSQL(
+        f"SELECT n.id FROM {node_table} n WHERE NOT EXISTS ("
+        f"SELECT 1 FROM {staged} s WHERE s.system = n.taxonomy_system AND s.rank = n.rank AND s.name = n.name)", []
+    )
+    _, deleted_per_model = TaxonomyNode._base_manager.filter(pk__in=outdated).delete()
+    deleted = deleted_per_model.get(TaxonomyNode._meta.label, 0)
+    drop_staging_table(cursor, NODES_STAGING_TABLE)
+
+    if created or updated or deleted:
+        rebuild_closure(cursor)
+    genomes = link_genomes_to_taxa(cursor)
+    statistics = link_statistics_to_taxa(cursor)
+
+    logger.info(f"Created {created}, updated {updated} and deleted {deleted} TaxonomyNode records")
+    logger.info(f"Relinked {genomes} GenomeMetadata and {statistics} DomainStatisticsPerTaxon records to their taxa")
+    return {"created": created, "updated": updated, "deleted": deleted, "genomes": genomes, "statistics": statistics}
+
+
+def rebuild_closure(cursor):
+    """
+    Replace the TaxonomyClosure rows by the ancestor and descendant pairs of the current trees.
+    The trees are at most as deep as the ranks, rebuilding is cheaper than patching moved subtrees.
+    """
+    closure_table = quote(TaxonomyClosure._meta.db_table)
+    cursor.execute(f"DELETE FROM {closure_table}")
+    cursor.execute(
+        f"INSERT INTO {closure_table} (ancestor_id, descendant_id, distance) "
+        f"WITH RECURSIVE pairs AS ("
+        f"SELECT id AS ancestor_id, id AS descendant_id, 0 AS distance FROM {quote(TaxonomyNode._meta.db_table)} "
+        f"UNION ALL SELECT p.ancestor_id, n.id, p.distance + 1 FROM pairs p "
+        f"JOIN {quote(TaxonomyNode._meta.db_table)} n ON n.parent_id = p.descendant_id"
+        f") SELECT ancestor_id, descendant_id, distance FROM pairs"
+    )
+    cursor.execute(f"ANALYZE {closure_table}")
+
+
+def link_genomes_to_taxa(cursor):
+    """
+    Point the {system}_taxon of every genome at the node of its deepest ranked taxon in the system.
+    Only genomes whose nodes changed are written. Returns their number.
+    """
+    genome_table = quote(GenomeMetadata._meta.db_table)
+    node_table = quote(TaxonomyNode._meta.db_table)
+    columns = [GenomeMetadata._meta.get_field(f"{system}_taxon").column for system in TAXONOMY_SYSTEMS]
+    joins = []
+    for system in TAXONOMY_SYSTEMS:
+        deepest_rank = "CASE " + " ".join(f"WHEN g.{system}_{rank} <> '' THEN '{rank}'" for rank in reversed(GTDB_RANKS)) + " END"
+        names = [f"nullif(g.{system}_{rank}, '')" for rank in reversed(GTDB_RANKS)]
+        deepest_name = f"coalesce({', '.join(names)})"
+        joins.append(
+            f"LEFT JOIN {node_table} {system} ON {system}.taxonomy_system = '{system}' "
+            f"AND {system}.rank = {deepest_rank} AND {system}.name = {deepest_name}"
+        )
+    cursor.execute(
+        f"UPDATE {genome_table} g SET {', '.join(f'{quote(column)} = t.{quote(column)}' for column in columns)} FROM ("
+        f"SELECT g.id, {', '.join(f'{system}.id AS {quote(column)}' for system, column in zip(TAXONOMY_SYSTEMS, columns))} "
+        f"FROM {genome_table} g {' '.join(joins)}"
+        f") t WHERE g.id = t.id "
+        f"AND ({', '.join(f'g.{quote(column)}' for column in columns)}) IS DISTINCT FROM ({', '.join(f't.{quote(column)}' for column in columns)})"
+    )
+    return cursor.rowcount
+
+
+def link_statistics_to_taxa(cursor):
+    """
+    Point every DomainStatisticsPerTaxon row at the node of its taxonomy system, rank and last taxon.
+    Only rows whose node changed are written. Returns their number.
+    """
+    taxon_table = quote(DomainStatisticsPerTaxon._meta.db_table)
+    column = quote(DomainStatisticsPerTaxon._meta.get_field("taxon").column)
+    cursor.execute(
+        f"UPDATE {taxon_table} t SET {column} = m.node_id FROM ("
+        f"SELECT t.id, n.id AS node_id FROM {taxon_table} t LEFT JOIN {quote(TaxonomyNode._meta.db_table)} n "
+        f"ON n.taxonomy_system = t.taxonomy_system AND n.rank = t.gtdb_taxonomy_rank AND n.name = t.gtdb_taxonomy_last"
+        f") m WHERE t.id = m.id AND t.{column} IS DISTINCT FROM m.node_id"
+    )
+    return cursor.rowcount
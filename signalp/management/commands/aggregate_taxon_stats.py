@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from signalp.loaders.taxon_aggregation import aggregate_domain_statistics_per_taxon
+
+class Command(BaseCommand):
+    help = 'Aggregate per taxon statistics from the per genome statistics, for the taxa whose genomes changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every taxon, replacing per taxon statistics loaded from files',
+        )
+
+    def handle(self, *args, **options):
+        result = aggregate_domain_statistics_per_taxon(full=options['full'])
+        self.stdout.write("Aggregated {taxa} taxa: created {created}, updated {updated}, unchanged {unchanged}, deleted {deleted}".format(**result))
+        self.stdout.write(self.style.SUCCESS("Domain stats per taxon aggregated."))
\ No newline at end of file
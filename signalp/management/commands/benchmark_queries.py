@@ -0,0 +1,92 @@
+import statistics
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from signalp.loaders.per_genome_stats_loader import FILE_PATH as GENOME_STATS_FILE, load_domain_statistics_per_genome
+from signalp.loaders.per_protein_stats_loader import FILE_PATH as PROTEIN_STATS_FILE, stream_domain_statistics_per_protein
+from signalp.models import DomainStatisticsPerGenome, DomainStatisticsPerProtein, DomainStatisticsPerTaxon
+
+# The API queries the indexes are tuned for, {genome} and {taxon} are filled from the database
+WORKLOAD = [
+    "/genome-stats/?protein_type=hk&source=mistdb&domain_combination_type=domain&ordering=-count_raw",
+    "/genome-stats/?protein_type=rr&source=rmodels&domain_combination_type=domain_comb&ordering=-count_raw",
+    "/genome-stats/?protein_type=hk&source=mistdb&domain_combination_type=domain&ordering=-count_raw&page=2",
+    "/genome-stats/?protein_type=hk&source=mistdb&ordering=-count_normalized_by_genome_size",
+    "/genome-stats/?genome={genome}&protein_type=hk",
+    "/genome-stats/facets/?protein_type=hk&source=mistdb&count_raw__gte=2",
+    "/taxon-stats/?protein_type=hk&source=mistdb&domain_combination_type=domain&ordering=-count_raw",
+    "/taxon-stats/?gtdb_taxonomy_last={taxon}",
+    "/protein-stats/?genome={genome}&protein_type=hk&source=mistdb",
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Report API latency percentiles of the common queries, and optionally the time to load the statistics into empty tables. '
+            'Run it before and after a schema change (e.g. migrate back to the previous migration) to compare index sets.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50, help='Number of timed requests per query')
+        parser.add_argument('--load', action='store_true',
+                            help='Also time loading the per-genome and per-protein statistics into emptied tables, rolled back afterwards')
+        parser.add_argument('--genome-stats-file', type=str, default=None, help='Per-genome statistics to load with --load')
+        parser.add_argument('--protein-stats-file', type=str, default=None, help='Per-protein statistics to load with --load')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1")
+        self.benchmark_queries(options['repeat'])
+        if options['load']:
+            self.benchmark_loads(
+                Path(options['genome_stats_file'] or GENOME_STATS_FILE), Path(options['protein_stats_file'] or PROTEIN_STATS_FILE)
+            )
+
+    def benchmark_queries(self, repeat):
+        genome = DomainStatisticsPerGenome.objects.values_list('genome_id', flat=True).first()
+        taxon = DomainStatisticsPerTaxon.objects.values_list('gtdb_taxonomy_last', flat=True).first()
+        client = Client(HTTP_ACCEPT='application/json')
+        self.stdout.write(f"{'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}  query ({repeat} requests)")
+        # Cached responses would only measure the cache
+        with override_settings(RESPONSE_CACHE_TIMEOUT=0, ALLOWED_HOSTS=['testserver']):
+            for query in WORKLOAD:
+                if ('{genome}' in query and genome is None) or ('{taxon}' in query and taxon is None):
+                    self.stdout.write(f"Skipping {query}, no statistics loaded")
+                    continue
+                url = query.format(genome=genome, taxon=taxon)
+                client.get(url)  # warm up
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200:
+                        raise CommandError(f"{url} returned {response.status_code}")
+                self.stdout.write(f"{statistics.median(timings):8.1f} {percentile(timings, 95):8.1f} {max(timings):8.1f}  {url}")
+
+    def benchmark_loads(self, genome_stats_file, protein_stats_file):
+        for model, load, file_path in [
+            (DomainStatisticsPerGenome, load_domain_statistics_per_genome, genome_stats_file),
+            (DomainStatisticsPerProtein, stream_domain_statistics_per_protein, protein_stats_file),
+        ]:
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"TRUNCATE {connection.ops.quote_name(model._meta.db_table)}")
+                    start = time.perf_counter()
+                    result = load(file_path=file_path)
+                    elapsed = time.perf_counter() - start
+                    raise Rollback
+            except Rollback:
+                pass
+            self.stdout.write(f"Loaded {result['created']} {model.__name__} rows in {elapsed:.2f} s (rolled back)")
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(percent / 100 * (len(values) - 1)))]
@@ -9,10 +9,22 @@ class Command(BaseCommand):
             '--file',
             type=str,
             default=None,
-            help='Path to the TSV file to load',
+            help='Path to the TSV file to load, a directory of TSV files or a glob pattern',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes parsing and staging the input files in parallel',
+        )
+        parser.add_argument(
+            '--delete-missing',
+            action='store_true',
+            help='Delete entries that are not present in the input files',
         )
 
     def handle(self, *args, **options):
         file_path = options['file']
-        load_genome_metadata_from_tsv(file_path=file_path)
+        result = load_genome_metadata_from_tsv(file_path=file_path, workers=options['workers'], delete_missing=options['delete_missing'])
+        self.stdout.write("Created {created}, updated {updated}, unchanged {unchanged}, deleted {deleted}".format(**result))
         self.stdout.write(self.style.SUCCESS("Genome metadata loaded."))
\ No newline at end of file
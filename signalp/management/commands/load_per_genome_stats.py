@@ -9,10 +9,29 @@ class Command(BaseCommand):
             '--file',
             type=str,
             default=None,
-            help='Path to the TSV file to load',
+            help='Path to the TSV file to load, a directory of TSV files or a glob pattern',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes parsing and staging the input files in parallel',
+        )
+        parser.add_argument(
+            '--delete-missing',
+            action='store_true',
+            help='Delete entries that are not present in the input files',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Load into a new unindexed table and swap it in, for full reloads',
         )
 
     def handle(self, *args, **options):
         file_path = options['file']
-        load_domain_statistics_per_genome(file_path=file_path)
+        result = load_domain_statistics_per_genome(
+            file_path=file_path, workers=options['workers'], delete_missing=options['delete_missing'], rebuild=options['rebuild']
+        )
+        self.stdout.write("Created {created}, updated {updated}, unchanged {unchanged}, deleted {deleted}".format(**result))
         self.stdout.write(self.style.SUCCESS("Domain stats per genome loaded."))
\ No newline at end of file
@@ -1,5 +1,6 @@
-from django.core.management.base import BaseCommand
-from signalp.loaders.per_protein_stats_loader import load_domain_statistics_per_protein
+from django.core.management.base import BaseCommand, CommandError
+from signalp.loaders.parallel import resolve_input_files
+from signalp.loaders.per_protein_stats_loader import load_domain_statistics_per_protein, stream_domain_statistics_per_protein, FILE_PATH
 
 class Command(BaseCommand):
     help = 'Load per protein statistics from a TSV file'
@@ -9,10 +10,43 @@ class Command(BaseCommand):
             '--file',
             type=str,
             default=None,
-            help='Path to the TSV file to load',
+            help='Path to the TSV file to load, a directory of TSV files or a glob pattern',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes parsing and staging the input files in parallel',
+        )
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Stream the file through PostgreSQL COPY and merge it in one statement (constant memory)',
+        )
+        parser.add_argument(
+            '--delete-missing',
+            action='store_true',
+            help='Delete entries that are not present in the input files (requires --stream)',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Load into a new unindexed table and swap it in, for full reloads (requires --stream)',
         )
 
     def handle(self, *args, **options):
         file_path = options['file']
-        load_domain_statistics_per_protein(file_path=file_path)
+        if options['stream']:
+            result = stream_domain_statistics_per_protein(
+                file_path=file_path, workers=options['workers'], delete_missing=options['delete_missing'], rebuild=options['rebuild']
+            )
+            self.stdout.write("Created {created}, updated {updated}, unchanged {unchanged}, deleted {deleted}".format(**result))
+        elif options['delete_missing']:
+            raise CommandError("--delete-missing requires --stream")
+        elif options['rebuild']:
+            raise CommandError("--rebuild requires --stream")
+        else:
+            # The ORM based loader reads one file at a time and ignores --workers
+            for path in resolve_input_files(file_path, FILE_PATH):
+                load_domain_statistics_per_protein(file_path=path)
         self.stdout.write(self.style.SUCCESS("Domain stats per protein loaded."))
\ No newline at end of file
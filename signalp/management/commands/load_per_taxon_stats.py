@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from signalp.loaders.per_taxon_stats_loader import load_domain_statistics_per_taxon
+from signalp.models import TaxonomySystem
 
 class Command(BaseCommand):
     help = 'Load per taxon statistics from a TSV file'
@@ -9,10 +10,36 @@ class Command(BaseCommand):
             '--file',
             type=str,
             default=None,
-            help='Path to the TSV file to load',
+            help='Path to the TSV file to load, a directory of TSV files or a glob pattern',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes parsing and staging the input files in parallel',
+        )
+        parser.add_argument(
+            '--delete-missing',
+            action='store_true',
+            help='Delete entries that are not present in the input files',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Load into a new unindexed table and swap it in, for full reloads',
+        )
+        parser.add_argument(
+            '--taxonomy-system',
+            choices=TaxonomySystem.values,
+            default=TaxonomySystem.GTDB,
+            help='Taxonomy of the input files, read from the <system>_taxonomy_string, _last and _rank columns',
         )
 
     def handle(self, *args, **options):
         file_path = options['file']
-        load_domain_statistics_per_taxon(file_path=file_path)
+        result = load_domain_statistics_per_taxon(
+            file_path=file_path, workers=options['workers'], delete_missing=options['delete_missing'], rebuild=options['rebuild'],
+            taxonomy_system=options['taxonomy_system']
+        )
+        self.stdout.write("Created {created}, updated {updated}, unchanged {unchanged}, deleted {deleted}".format(**result))
         self.stdout.write(self.style.SUCCESS("Domain stats per taxon loaded."))
\ No newline at end of file
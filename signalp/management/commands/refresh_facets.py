@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from signalp.facets import refresh_facets
+from signalp.models import DomainStatisticsPerGenome, DomainStatisticsPerTaxon
+
+class Command(BaseCommand):
+    help = 'Rebuild the facet summary tables, for statistics changed outside the loaders'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            refresh_facets(DomainStatisticsPerGenome, DomainStatisticsPerTaxon)
+        self.stdout.write(self.style.SUCCESS("Facet summary tables refreshed."))
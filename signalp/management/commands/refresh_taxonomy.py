@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from signalp.caching import record_load
+from signalp.loaders.taxonomy import refresh_taxonomy
+from signalp.models import DomainStatisticsPerTaxon, GenomeMetadata, TaxonomyClosure, TaxonomyNode
+
+class Command(BaseCommand):
+    help = 'Rebuild the taxonomy trees from the genome metadata, for genomes loaded before them or changed outside the loaders'
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            result = refresh_taxonomy(cursor)
+            record_load(TaxonomyNode, TaxonomyClosure, GenomeMetadata, DomainStatisticsPerTaxon)
+        self.stdout.write("Created {created}, updated {updated}, deleted {deleted} taxa, "
+                          "relinked {genomes} genomes and {statistics} taxon statistics".format(**result))
+        self.stdout.write(self.style.SUCCESS("Taxonomy refreshed."))
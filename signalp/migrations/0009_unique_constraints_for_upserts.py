@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0008_alter_domainstatisticspergenome_count_normalized_by_genome_size_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='domainstatisticspergenome',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='domainstatisticspertaxon',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='domainstatisticspergenome',
+            constraint=models.UniqueConstraint(fields=('genome', 'source', 'protein_type', 'domains', 'domain_combination_type'), name='unique_domain_statistics_per_genome'),
+        ),
+        migrations.AddConstraint(
+            model_name='domainstatisticspertaxon',
+            constraint=models.UniqueConstraint(fields=('gtdb_taxonomy_string', 'source', 'protein_type', 'domains', 'domain_combination_type'), name='unique_domain_statistics_per_taxon'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0009_unique_constraints_for_upserts'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='taxongenomelink',
+            constraint=models.UniqueConstraint(fields=('taxon', 'genome'), name='unique_taxon_genome_link'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0011_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoadGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=100, unique=True)),
+                ('generation', models.PositiveBigIntegerField(default=0)),
+                ('loaded_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0012_load_generation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DomainStatisticsPerTaxonFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gtdb_taxonomy_string', models.TextField()),
+                ('gtdb_taxonomy_last', models.CharField(db_index=True, max_length=100)),
+                ('source', models.CharField(choices=[('mistdb', 'MiST database'), ('rmodels', 'Pfam models with relaxed thresholds')], max_length=7)),
+                ('protein_type', models.CharField(choices=[('hk', 'Histidine Kinase'), ('rr', 'Response Regulator'), ('ocp', 'One-Component System')], max_length=3)),
+                ('domain_combination_type', models.TextField(blank=True, choices=[('domain', 'Domain'), ('domain_comb', 'Domain Comb'), ('superfamily', 'Superfamily'), ('superfamily_comb', 'Superfamily Comb')], null=True)),
+                ('row_count', models.IntegerField()),
+                ('count_raw', models.BigIntegerField(blank=True, null=True)),
+                ('count_normalized_by_total_genomes', models.DecimalField(blank=True, decimal_places=7, max_digits=20, null=True)),
+                ('count_normalized_by_genome_size_by_total_genomes', models.DecimalField(blank=True, decimal_places=9, max_digits=20, null=True)),
+                ('count_normalized_by_total_proteins_by_total_genomes', models.DecimalField(blank=True, decimal_places=9, max_digits=20, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['source', 'protein_type', 'domain_combination_type'], name='taxon_facet_dims_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DomainStatisticsPerGenomeFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genome_accession', models.CharField(blank=True, max_length=100, null=True)),
+                ('source', models.CharField(choices=[('mistdb', 'MiST database'), ('rmodels', 'Pfam models with relaxed thresholds')], max_length=7)),
+                ('protein_type', models.CharField(choices=[('hk', 'Histidine Kinase'), ('rr', 'Response Regulator'), ('ocp', 'One-Component System')], max_length=3)),
+                ('domain_combination_type', models.TextField(blank=True, choices=[('domain', 'Domain'), ('domain_comb', 'Domain Comb'), ('superfamily', 'Superfamily'), ('superfamily_comb', 'Superfamily Comb')], null=True)),
+                ('row_count', models.IntegerField()),
+                ('count_raw', models.BigIntegerField(blank=True, null=True)),
+                ('count_normalized_by_genome_size', models.DecimalField(blank=True, decimal_places=9, max_digits=20, null=True)),
+                ('count_normalized_by_total_proteins', models.DecimalField(blank=True, decimal_places=9, max_digits=20, null=True)),
+                ('genome', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='signalp.genomemetadata', to_field='genome_version')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['source', 'protein_type', 'domain_combination_type'], name='genome_facet_dims_idx')],
+            },
+        ),
+    ]
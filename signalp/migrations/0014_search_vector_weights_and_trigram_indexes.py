@@ -0,0 +1,123 @@
+from django.db import migrations
+
+# search_vector covers the text columns of each statistics table, weighted, with the 'simple' configuration
+# (models.SEARCH_CONFIG). Updating search_vector fires the triggers, which recompute it.
+SEARCH_VECTOR_SQL = """
+DROP TRIGGER IF EXISTS domain_stats_protein_search_vector_trigger ON signalp_domainstatisticsperprotein;
+DROP TRIGGER IF EXISTS domain_stats_genome_search_vector_trigger ON signalp_domainstatisticspergenome;
+DROP TRIGGER IF EXISTS domain_stats_taxon_search_vector_trigger ON signalp_domainstatisticspertaxon;
+DROP FUNCTION IF EXISTS update_search_vector();
+
+CREATE FUNCTION update_protein_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := setweight(to_tsvector('simple', coalesce(NEW.domains, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(NEW.domain_architecture, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce(NEW.sensors_or_regulators, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION update_genome_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := setweight(to_tsvector('simple', coalesce(NEW.domains, '')), 'A');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION update_taxon_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := setweight(to_tsvector('simple', coalesce(NEW.domains, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(NEW.gtdb_taxonomy_string, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER domain_stats_protein_search_vector_trigger
+BEFORE INSERT OR UPDATE ON signalp_domainstatisticsperprotein
+FOR EACH ROW EXECUTE FUNCTION update_protein_search_vector();
+
+CREATE TRIGGER domain_stats_genome_search_vector_trigger
+BEFORE INSERT OR UPDATE ON signalp_domainstatisticspergenome
+FOR EACH ROW EXECUTE FUNCTION update_genome_search_vector();
+
+CREATE TRIGGER domain_stats_taxon_search_vector_trigger
+BEFORE INSERT OR UPDATE ON signalp_domainstatisticspertaxon
+FOR EACH ROW EXECUTE FUNCTION update_taxon_search_vector();
+
+UPDATE signalp_domainstatisticsperprotein SET search_vector = NULL;
+UPDATE signalp_domainstatisticspergenome SET search_vector = NULL;
+UPDATE signalp_domainstatisticspertaxon SET search_vector = NULL;
+"""
+
+REVERSE_SEARCH_VECTOR_SQL = """
+DROP TRIGGER IF EXISTS domain_stats_protein_search_vector_trigger ON signalp_domainstatisticsperprotein;
+DROP TRIGGER IF EXISTS domain_stats_genome_search_vector_trigger ON signalp_domainstatisticspergenome;
+DROP TRIGGER IF EXISTS domain_stats_taxon_search_vector_trigger ON signalp_domainstatisticspertaxon;
+DROP FUNCTION IF EXISTS update_protein_search_vector();
+DROP FUNCTION IF EXISTS update_genome_search_vector();
+DROP FUNCTION IF EXISTS update_taxon_search_vector();
+
+CREATE FUNCTION update_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('english', NEW.domains);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER domain_stats_protein_search_vector_trigger
+BEFORE INSERT OR UPDATE ON signalp_domainstatisticsperprotein
+FOR EACH ROW EXECUTE FUNCTION update_search_vector();
+
+CREATE TRIGGER domain_stats_genome_search_vector_trigger
+BEFORE INSERT OR UPDATE ON signalp_domainstatisticspergenome
+FOR EACH ROW EXECUTE FUNCTION update_search_vector();
+
+CREATE TRIGGER domain_stats_taxon_search_vector_trigger
+BEFORE INSERT OR UPDATE ON signalp_domainstatisticspertaxon
+FOR EACH ROW EXECUTE FUNCTION update_search_vector();
+
+UPDATE signalp_domainstatisticsperprotein SET search_vector = NULL;
+UPDATE signalp_domainstatisticspergenome SET search_vector = NULL;
+UPDATE signalp_domainstatisticspertaxon SET search_vector = NULL;
+"""
+
+# Substring searches (icontains, UPPER(column::text) LIKE '%term%') on the views' search_fields.
+# pg_trgm is a contrib extension, the indexes are only created where it is available.
+TRIGRAM_INDEXES = [
+    ('genome_version_trgm_idx', 'signalp_genomemetadata', 'genome_version'),
+    ('genome_accession_trgm_idx', 'signalp_genomemetadata', 'genome_accession'),
+] + [
+    (f'genome_{column}_trgm_idx', 'signalp_genomemetadata', column)
+    for prefix in ['gtdb', 'ncbi']
+    for column in [f'{prefix}_{rank}' for rank in ['kingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']]
+] + [
+    ('prot_mist_accession_trgm_idx', 'signalp_domainstatisticsperprotein', 'mist_protein_accession'),
+    ('prot_ncbi_accession_trgm_idx', 'signalp_domainstatisticsperprotein', 'ncbi_protein_accession'),
+    ('genome_stats_accession_trgm_idx', 'signalp_domainstatisticspergenome', 'genome_accession'),
+    ('taxon_last_trgm_idx', 'signalp_domainstatisticspertaxon', 'gtdb_taxonomy_last'),
+]
+
+def create_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, table, column in TRIGRAM_INDEXES:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ((UPPER("{column}"::text)) gin_trgm_ops)')
+
+def drop_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for name, _, _ in TRIGRAM_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0013_facet_summary_tables'),
+    ]
+
+    operations = [
+        migrations.RunSQL(SEARCH_VECTOR_SQL, reverse_sql=REVERSE_SEARCH_VECTOR_SQL),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+# domain_counts used to be loaded as the JSON string of the "HisKA:1,HATPase_c:1" column,
+# it is now a JSON object of counts per domain that GIN containment and key lookups can match
+PARSE_DOMAIN_COUNTS_SQL = """
+UPDATE signalp_domainstatisticsperprotein
+SET domain_counts = (
+    SELECT jsonb_object_agg(substring(item FROM '^(.+):[0-9]+$'), substring(item FROM ':([0-9]+)$')::integer)
+    FROM (SELECT btrim(part) AS item FROM unnest(string_to_array(domain_counts #>> '{}', ',')) AS part) AS items
+    WHERE item ~ '^.+:[0-9]+$'
+)
+WHERE jsonb_typeof(domain_counts) = 'string';
+"""
+
+FORMAT_DOMAIN_COUNTS_SQL = """
+UPDATE signalp_domainstatisticsperprotein
+SET domain_counts = (
+    SELECT to_jsonb(string_agg(key || ':' || value, ',' ORDER BY key))
+    FROM jsonb_each_text(domain_counts)
+)
+WHERE jsonb_typeof(domain_counts) = 'object';
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0014_search_vector_weights_and_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(PARSE_DOMAIN_COUNTS_SQL, reverse_sql=FORMAT_DOMAIN_COUNTS_SQL),
+    ]
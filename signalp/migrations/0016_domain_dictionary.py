@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:24
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+STATISTICS_TABLES = ['signalp_domainstatisticsperprotein', 'signalp_domainstatisticspergenome', 'signalp_domainstatisticspertaxon']
+
+# Fill the dictionary from the domains columns and map them to ids, before the GIN indexes are built
+FILL_DOMAIN_IDS_SQL = [
+    "INSERT INTO signalp_domain (name) SELECT DISTINCT btrim(name) FROM ("
+    + " UNION ALL ".join(f"SELECT unnest(string_to_array(domains, ',')) AS name FROM {table}" for table in STATISTICS_TABLES)
+    + ") AS names WHERE btrim(name) <> '' ON CONFLICT (name) DO NOTHING",
+] + [
+    f"UPDATE {table} s SET domain_ids = ARRAY("
+    f"SELECT d.id FROM unnest(string_to_array(s.domains, ',')) WITH ORDINALITY AS u(name, position) "
+    f"JOIN signalp_domain d ON d.name = btrim(u.name) ORDER BY u.position)"
+    for table in STATISTICS_TABLES
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0015_domain_counts_objects'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Domain',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.TextField(unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='domainstatisticspergenome',
+            name='domain_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, null=True, size=None),
+        ),
+        migrations.AddField(
+            model_name='domainstatisticsperprotein',
+            name='domain_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, null=True, size=None),
+        ),
+        migrations.AddField(
+            model_name='domainstatisticspertaxon',
+            name='domain_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, null=True, size=None),
+        ),
+        migrations.RunSQL(FILL_DOMAIN_IDS_SQL, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='domainstatisticspergenome',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['domain_ids'], name='domain_ids_genome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='domainstatisticsperprotein',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['domain_ids'], name='domain_ids_prot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='domainstatisticspertaxon',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['domain_ids'], name='domain_ids_taxon_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0016_domain_dictionary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='domainstatisticspergenome',
+            name='domain_combination_type',
+            field=models.TextField(blank=True, choices=[('domain', 'Domain'), ('domain_comb', 'Domain Comb'), ('superfamily', 'Superfamily'), ('superfamily_comb', 'Superfamily Comb')], null=True),
+        ),
+        migrations.AlterField(
+            model_name='domainstatisticspergenome',
+            name='protein_type',
+            field=models.CharField(choices=[('hk', 'Histidine Kinase'), ('rr', 'Response Regulator'), ('ocp', 'One-Component System')], max_length=3),
+        ),
+        migrations.AlterField(
+            model_name='domainstatisticspergenome',
+            name='source',
+            field=models.CharField(choices=[('mistdb', 'MiST database'), ('rmodels', 'Pfam models with relaxed thresholds')], max_length=7),
+        ),
+        migrations.AlterField(
+            model_name='domainstatisticsperprotein',
+            name='domain_counts',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='domainstatisticsperprotein',
+            name='genome',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='domain_statistics_perprotein', to='signalp.genomemetadata', to_field='genome_version'),
+        ),
+        migrations.AlterField(
+            model_name='domainstatisticsperprotein',
+            name='protein_type',
+            field=models.CharField(choices=[('hk', 'Histidine Kinase'), ('rr', 'Response Regulator'), ('ocp', 'One-Component System')], max_length=3),
+        ),
+        migrations.AlterField(
+            model_name='domainstatisticsperprotein',
+            name='source',
+            field=models.CharField(choices=[('mistdb', 'MiST database'), ('rmodels', 'Pfam models with relaxed thresholds')], max_length=7),
+        ),
+        migrations.AlterField(
+            model_name='domainstatisticspertaxon',
+            name='domain_combination_type',
+            field=models.TextField(blank=True, choices=[('domain', 'Domain'), ('domain_comb', 'Domain Comb'), ('superfamily', 'Superfamily'), ('superfamily_comb', 'Superfamily Comb')], null=True),
+        ),
+        migrations.AlterField(
+            model_name='domainstatisticspertaxon',
+            name='protein_type',
+            field=models.CharField(choices=[('hk', 'Histidine Kinase'), ('rr', 'Response Regulator'), ('ocp', 'One-Component System')], max_length=3),
+        ),
+        migrations.AlterField(
+            model_name='domainstatisticspertaxon',
+            name='source',
+            field=models.CharField(choices=[('mistdb', 'MiST database'), ('rmodels', 'Pfam models with relaxed thresholds')], max_length=7),
+        ),
+        migrations.AddIndex(
+            model_name='domainstatisticspergenome',
+            index=models.Index(condition=models.Q(('source', 'mistdb')), fields=['protein_type', 'domain_combination_type', 'count_raw', 'id'], include=('count_normalized_by_genome_size', 'count_normalized_by_total_proteins'), name='genome_stats_mistdb_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='domainstatisticspergenome',
+            index=models.Index(condition=models.Q(('source', 'rmodels')), fields=['protein_type', 'domain_combination_type', 'count_raw', 'id'], include=('count_normalized_by_genome_size', 'count_normalized_by_total_proteins'), name='genome_stats_rmodels_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='domainstatisticsperprotein',
+            index=models.Index(fields=['genome', 'protein_type', 'source'], name='prot_genome_type_source_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='domainstatisticspertaxon',
+            index=models.Index(condition=models.Q(('source', 'mistdb')), fields=['protein_type', 'domain_combination_type', 'count_raw', 'id'], include=('count_normalized_by_total_genomes', 'count_normalized_by_genome_size_by_total_genomes', 'count_normalized_by_total_proteins_by_total_genomes'), name='taxon_stats_mistdb_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='domainstatisticspertaxon',
+            index=models.Index(condition=models.Q(('source', 'rmodels')), fields=['protein_type', 'domain_combination_type', 'count_raw', 'id'], include=('count_normalized_by_total_genomes', 'count_normalized_by_genome_size_by_total_genomes', 'count_normalized_by_total_proteins_by_total_genomes'), name='taxon_stats_rmodels_count_idx'),
+        ),
+    ]
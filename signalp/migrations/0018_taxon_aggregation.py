@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:38
+
+from django.db import migrations, models
+
+GTDB_RANKS = ['kingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']
+
+
+def taxa_of(genomes):
+    # (rank, name) of every GTDB taxon of the genome rows in genomes
+    values = ", ".join(f"('{rank}', g.gtdb_{rank})" for rank in GTDB_RANKS)
+    return (
+        f"INSERT INTO signalp_staletaxon (rank, name) SELECT DISTINCT taxon.rank, taxon.name FROM {genomes} g "
+        f"CROSS JOIN LATERAL (VALUES {values}) AS taxon(rank, name) WHERE taxon.name IS NOT NULL ON CONFLICT DO NOTHING;"
+    )
+
+
+# Statement triggers mark the taxa of changed genomes and per-genome statistics stale, from the transition
+# tables, so a load costs one INSERT per statement rather than a trigger call per row. Genome metadata
+# updates mark both the old and the new taxa of a genome.
+STALE_TAXA_SQL = f"""
+CREATE FUNCTION mark_stale_taxa_of_genomes() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        {taxa_of('new_rows')}
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        {taxa_of('old_rows')}
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION mark_stale_taxa_of_genome_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        {taxa_of('(SELECT * FROM signalp_genomemetadata WHERE genome_version IN (SELECT genome_id FROM new_rows))')}
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        {taxa_of('(SELECT * FROM signalp_genomemetadata WHERE genome_version IN (SELECT genome_id FROM old_rows))')}
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+""" + "".join(
+    f"""
+CREATE TRIGGER {name}_{event.lower()}_stale_taxa_trigger
+AFTER {event} ON {table} REFERENCING {referencing}
+FOR EACH STATEMENT EXECUTE FUNCTION {function}();
+"""
+    for name, table, function in [
+        ('genome', 'signalp_genomemetadata', 'mark_stale_taxa_of_genomes'),
+        ('genome_stats', 'signalp_domainstatisticspergenome', 'mark_stale_taxa_of_genome_stats'),
+    ]
+    for event, referencing in [
+        ('INSERT', 'NEW TABLE AS new_rows'),
+        ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+        ('DELETE', 'OLD TABLE AS old_rows'),
+    ]
+)
+
+REVERSE_STALE_TAXA_SQL = "".join(
+    f"DROP TRIGGER IF EXISTS {name}_{event}_stale_taxa_trigger ON {table};\n"
+    for name, table in [('genome', 'signalp_genomemetadata'), ('genome_stats', 'signalp_domainstatisticspergenome')]
+    for event in ['insert', 'update', 'delete']
+) + """
+DROP FUNCTION IF EXISTS mark_stale_taxa_of_genomes();
+DROP FUNCTION IF EXISTS mark_stale_taxa_of_genome_stats();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0017_workload_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleTaxon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.CharField(max_length=20)),
+                ('name', models.CharField(max_length=100)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('rank', 'name'), name='unique_stale_taxon')],
+            },
+        ),
+        migrations.RunSQL(STALE_TAXA_SQL, reverse_sql=REVERSE_STALE_TAXA_SQL),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:47
+
+from django.db import migrations, models
+
+RANKS = ['kingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']
+
+
+def taxa_of(genomes, systems):
+    # (system, rank, name) of every taxon of the genome rows in genomes
+    values = ", ".join(f"('{system}', '{rank}', g.{system}_{rank})" for system in systems for rank in RANKS)
+    return (
+        f"INSERT INTO signalp_staletaxon (taxonomy_system, rank, name) SELECT DISTINCT taxon.system, taxon.rank, taxon.name FROM {genomes} g "
+        f"CROSS JOIN LATERAL (VALUES {values}) AS taxon(system, rank, name) WHERE taxon.name IS NOT NULL ON CONFLICT DO NOTHING;"
+    )
+
+
+def stale_taxa_functions_sql(systems):
+    # The trigger functions of migration 0018, marking the taxa of the systems stale
+    return f"""
+CREATE OR REPLACE FUNCTION mark_stale_taxa_of_genomes() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        {taxa_of('new_rows', systems)}
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        {taxa_of('old_rows', systems)}
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION mark_stale_taxa_of_genome_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        {taxa_of('(SELECT * FROM signalp_genomemetadata WHERE genome_version IN (SELECT genome_id FROM new_rows))', systems)}
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        {taxa_of('(SELECT * FROM signalp_genomemetadata WHERE genome_version IN (SELECT genome_id FROM old_rows))', systems)}
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+# The NCBI taxa of the loaded genomes are due for their first aggregation
+STALE_NCBI_TAXA_SQL = taxa_of('signalp_genomemetadata', ['ncbi'])
+
+# NCBI rows would collide on the GTDB-only unique constraints
+REVERSE_NCBI_ROWS_SQL = """
+DELETE FROM signalp_staletaxon WHERE taxonomy_system = 'ncbi';
+DELETE FROM signalp_domainstatisticspertaxon WHERE taxonomy_system = 'ncbi';
+DELETE FROM signalp_domainstatisticspertaxonfacet WHERE taxonomy_system = 'ncbi';
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0018_taxon_aggregation'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='domainstatisticspertaxon',
+            name='unique_domain_statistics_per_taxon',
+        ),
+        migrations.RemoveConstraint(
+            model_name='staletaxon',
+            name='unique_stale_taxon',
+        ),
+        migrations.RemoveIndex(
+            model_name='domainstatisticspertaxon',
+            name='taxon_stats_mistdb_count_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='domainstatisticspertaxon',
+            name='taxon_stats_rmodels_count_idx',
+        ),
+        migrations.AddField(
+            model_name='domainstatisticspertaxon',
+            name='taxonomy_system',
+            field=models.CharField(choices=[('gtdb', 'GTDB'), ('ncbi', 'NCBI')], default='gtdb', max_length=4),
+        ),
+        migrations.AddField(
+            model_name='domainstatisticspertaxonfacet',
+            name='taxonomy_system',
+            field=models.CharField(choices=[('gtdb', 'GTDB'), ('ncbi', 'NCBI')], default='gtdb', max_length=4),
+        ),
+        migrations.AddField(
+            model_name='staletaxon',
+            name='taxonomy_system',
+            field=models.CharField(choices=[('gtdb', 'GTDB'), ('ncbi', 'NCBI')], default='gtdb', max_length=4),
+        ),
+        migrations.AddIndex(
+            model_name='domainstatisticspertaxon',
+            index=models.Index(condition=models.Q(('source', 'mistdb')), fields=['taxonomy_system', 'protein_type', 'domain_combination_type', 'count_raw', 'id'], include=('count_normalized_by_total_genomes', 'count_normalized_by_genome_size_by_total_genomes', 'count_normalized_by_total_proteins_by_total_genomes'), name='taxon_stats_mistdb_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='domainstatisticspertaxon',
+            index=models.Index(condition=models.Q(('source', 'rmodels')), fields=['taxonomy_system', 'protein_type', 'domain_combination_type', 'count_raw', 'id'], include=('count_normalized_by_total_genomes', 'count_normalized_by_genome_size_by_total_genomes', 'count_normalized_by_total_proteins_by_total_genomes'), name='taxon_stats_rmodels_count_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='domainstatisticspertaxon',
+            constraint=models.UniqueConstraint(fields=('taxonomy_system', 'gtdb_taxonomy_string', 'source', 'protein_type', 'domains', 'domain_combination_type'), name='unique_domain_statistics_per_taxon'),
+        ),
+        migrations.AddConstraint(
+            model_name='staletaxon',
+            constraint=models.UniqueConstraint(fields=('taxonomy_system', 'rank', 'name'), name='unique_stale_taxon'),
+        ),
+        migrations.RunSQL(stale_taxa_functions_sql(['gtdb', 'ncbi']), reverse_sql=stale_taxa_functions_sql(['gtdb'])),
+        migrations.RunSQL(STALE_NCBI_TAXA_SQL, reverse_sql=migrations.RunSQL.noop),
+        # Runs first when migrating back
+        migrations.RunSQL(migrations.RunSQL.noop, reverse_sql=REVERSE_NCBI_ROWS_SQL),
+    ]
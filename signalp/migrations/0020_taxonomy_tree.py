@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0019_ncbi_taxonomy_system'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxonomyNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taxonomy_system', models.CharField(choices=[('gtdb', 'GTDB'), ('ncbi', 'NCBI')], max_length=4)),
+                ('rank', models.CharField(max_length=20)),
+                ('name', models.CharField(db_index=True, max_length=100)),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('lineage', models.TextField()),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='signalp.taxonomynode')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TaxonomyClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='signalp.taxonomynode')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='signalp.taxonomynode')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='domainstatisticspertaxon',
+            name='taxon',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='statistics', to='signalp.taxonomynode'),
+        ),
+        migrations.AddField(
+            model_name='genomemetadata',
+            name='gtdb_taxon',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='gtdb_genomes', to='signalp.taxonomynode'),
+        ),
+        migrations.AddField(
+            model_name='genomemetadata',
+            name='ncbi_taxon',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ncbi_genomes', to='signalp.taxonomynode'),
+        ),
+        migrations.AddConstraint(
+            model_name='taxonomynode',
+            constraint=models.UniqueConstraint(fields=('taxonomy_system', 'rank', 'name'), name='unique_taxonomy_node'),
+        ),
+        migrations.AddIndex(
+            model_name='taxonomyclosure',
+            index=models.Index(fields=['descendant', 'distance'], name='taxonomy_closure_lineage_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='taxonomyclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_taxonomy_closure'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:15
+
+from django.db import migrations
+
+RANKS = ['kingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']
+
+
+def taxa_of(genomes, condition):
+    # (system, rank, name) of every taxon of the genome rows in genomes whose name meets condition
+    values = ", ".join(f"('{system}', '{rank}', g.{system}_{rank})" for system in ['gtdb', 'ncbi'] for rank in RANKS)
+    return (
+        f"INSERT INTO signalp_staletaxon (taxonomy_system, rank, name) SELECT DISTINCT taxon.system, taxon.rank, taxon.name FROM {genomes} g "
+        f"CROSS JOIN LATERAL (VALUES {values}) AS taxon(system, rank, name) WHERE {condition} ON CONFLICT DO NOTHING;"
+    )
+
+
+def stale_taxa_functions_sql(condition):
+    # The trigger functions of migration 0019, marking the taxa whose name meets condition stale
+    return f"""
+CREATE OR REPLACE FUNCTION mark_stale_taxa_of_genomes() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        {taxa_of('new_rows', condition)}
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        {taxa_of('old_rows', condition)}
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION mark_stale_taxa_of_genome_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        {taxa_of('(SELECT * FROM signalp_genomemetadata WHERE genome_version IN (SELECT genome_id FROM new_rows))', condition)}
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        {taxa_of('(SELECT * FROM signalp_genomemetadata WHERE genome_version IN (SELECT genome_id FROM old_rows))', condition)}
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+# The genome metadata loader stores empty ranks as '', which are not taxa. Rows aggregated for them are
+# marked stale, the next aggregation finds no genomes for them and deletes them.
+STALE_EMPTY_TAXA_SQL = """
+INSERT INTO signalp_staletaxon (taxonomy_system, rank, name)
+SELECT DISTINCT taxonomy_system, gtdb_taxonomy_rank, gtdb_taxonomy_last FROM signalp_domainstatisticspertaxon
+WHERE gtdb_taxonomy_last = '' AND gtdb_taxonomy_rank IS NOT NULL
+ON CONFLICT DO NOTHING;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signalp', '0020_taxonomy_tree'),
+    ]
+
+    operations = [
+        migrations.RunSQL(stale_taxa_functions_sql("taxon.name <> ''"), reverse_sql=stale_taxa_functions_sql("taxon.name IS NOT NULL")),
+        migrations.RunSQL(STALE_EMPTY_TAXA_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -1,5 +1,11 @@
+import re
+from functools import reduce
+from operator import and_, or_
+
 from django.db import models
-from django.db.models import F
+from django.db.models import F, Lookup, Q
+from django.db.models.functions import Cast
+from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.search import SearchVectorField
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchQuery, SearchRank
@@ -28,9 +34,28 @@ class GenomeMetadata(models.Model):
     ncbi_genus = models.CharField(max_length=100, blank=True, null=True, db_index=True)
     ncbi_species = models.CharField(max_length=100, blank=True, null=True, db_index=True)
 
+    # Deepest taxon of the genome in each taxonomy, set by load_genome_metadata (see loaders/taxonomy.py)
+    gtdb_taxon = models.ForeignKey('TaxonomyNode', blank=True, null=True, related_name='gtdb_genomes', on_delete=models.SET_NULL)
+    ncbi_taxon = models.ForeignKey('TaxonomyNode', blank=True, null=True, related_name='ncbi_genomes', on_delete=models.SET_NULL)
+
+    # md5 of the loaded fields, maintained by the loaders to skip unchanged rows
+    content_hash = models.CharField(max_length=32, blank=True, null=True, editable=False)
+
     def __str__(self):
         return self.genome_version
 
+class Domain(models.Model):
+    """
+    Dictionary of the domain names of the statistics tables, which reference them in their domain_ids arrays.
+    Filled by the loaders, ids never change once assigned.
+    """
+    # domain_ids arrays are int[], the dictionary stays far below the integer range
+    id = models.AutoField(primary_key=True)
+    name = models.TextField(unique=True)
+
+    def __str__(self):
+        return self.name
+
 class ProteinType(models.TextChoices):
     HK = 'hk', 'Histidine Kinase'
     RR = 'rr', 'Response Regulator'
@@ -40,30 +65,143 @@ class Source(models.TextChoices):
     MIST = 'mistdb', 'MiST database'
     RMODELS = 'rmodels', 'Pfam models with relaxed thresholds'
 
+class TaxonomySystem(models.TextChoices):
+    GTDB = 'gtdb', 'GTDB'
+    NCBI = 'ncbi', 'NCBI'
+
+class TaxonomyNode(models.Model):
+    """
+    Taxon of the GTDB or NCBI taxonomy tree built from the genome metadata ranks. A taxon is identified by
+    its rank and name, its parent is the taxon of the nearest ranked ancestor and lineage its taxonomy string.
+    """
+    taxonomy_system = models.CharField(max_length=4, choices=TaxonomySystem.choices)
+    rank = models.CharField(max_length=20)
+    name = models.CharField(max_length=100, db_index=True)
+    # Position of the rank, 0 for kingdoms
+    depth = models.PositiveSmallIntegerField()
+    lineage = models.TextField()
+    parent = models.ForeignKey('self', blank=True, null=True, related_name='children', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['taxonomy_system', 'rank', 'name'], name='unique_taxonomy_node')
+        ]
+
+    def __str__(self):
+        return f"{self.taxonomy_system} {self.rank} {self.name}"
+
+class TaxonomyClosure(models.Model):
+    """
+    Closure of the TaxonomyNode tree: one row per ancestor and descendant pair, a node included as its own
+    ancestor at distance 0. Subtrees and lineages are single index range scans.
+    """
+    ancestor = models.ForeignKey(TaxonomyNode, related_name='descendant_links', on_delete=models.CASCADE)
+    descendant = models.ForeignKey(TaxonomyNode, related_name='ancestor_links', on_delete=models.CASCADE)
+    distance = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_taxonomy_closure')
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'distance'], name='taxonomy_closure_lineage_idx')
+        ]
+
+# Text search configuration of the search_vector triggers (migration 0014). Domain names and taxa are
+# identifiers, 'simple' lowercases them without stemming or dropping stop words.
+SEARCH_CONFIG = 'simple'
+SEARCH_TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+LEXEME_RE = re.compile(r'[^\W_]+')
+
+def search_terms(query_string):
+    """
+    Split a search into (text, prefix) terms: "quoted phrases", words and prefixes (words ending with *).
+    Terms without letters or digits are dropped.
+    """
+    terms = []
+    for phrase, word in SEARCH_TERM_RE.findall(query_string):
+        text, prefix = (phrase, False) if phrase else (word.rstrip('*'), word.endswith('*'))
+        if LEXEME_RE.search(text):
+            terms.append((text, prefix))
+    return terms
+
+def search_query(terms):
+    """
+    Build a tsquery matching all terms. Words and phrases match their lexemes in sequence,
+    so PAS_3 matches 'pas' <-> '3', prefixes match lexemes starting with the last one.
+    """
+    queries = []
+    for text, prefix in terms:
+        if prefix:
+            lexemes = [f"'{lexeme.lower()}'" for lexeme in LEXEME_RE.findall(text)]
+            queries.append(SearchQuery(' <-> '.join(lexemes) + ':*', search_type='raw', config=SEARCH_CONFIG))
+        else:
+            queries.append(SearchQuery(text, search_type='phrase', config=SEARCH_CONFIG))
+    return reduce(and_, queries)
+
 class FullTextSearchQuerySet(models.QuerySet):
-    def search(self, query_string):
-        query = SearchQuery(query_string)
-        return self.annotate(rank=SearchRank(F('search_vector'), query)).filter(search_vector=query).order_by('-rank')
+    def search(self, query_string, substring_fields=()):
+        """
+        Filter on search_vector (GIN index) and order by rank. Rows also match when every term is a substring
+        of one of substring_fields, for accessions and taxa that are not in the vector, those rank last.
+        """
+        terms = search_terms(query_string)
+        if not terms:
+            return self
+        query = search_query(terms)
+        condition = Q(search_vector=query)
+        if substring_fields:
+            condition |= reduce(and_, [reduce(or_, [Q(**{f"{field}__icontains": text}) for field in substring_fields])
+                                       for text, _ in terms])
+        # ts_rank() is a real, whose rounded text form would not seek keyset pages exactly
+        rank = Cast(SearchRank(F('search_vector'), query), models.FloatField())
+        return self.annotate(rank=rank).filter(condition).order_by('-rank', 'id')
+
+@models.JSONField.register_lookup
+class JSONPathExists(Lookup):
+    """
+    jsonb @? jsonpath: whether the path returns any item for the value, e.g.
+    domain_counts__path_exists='$."HisKA" ? (@ >= 2)'. Served by jsonb_ops GIN indexes for equality predicates only.
+    """
+    lookup_name = 'path_exists'
+    prepare_rhs = False
+
+    def get_db_prep_lookup(self, value, connection):
+        return '%s', [value]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} @? {rhs}::jsonpath", [*lhs_params, *rhs_params]
 
 class DomainStatisticsPerProtein(models.Model):
-    genome = models.ForeignKey(GenomeMetadata, to_field='genome_version', related_name='domain_statistics_perprotein', on_delete=models.CASCADE)
+    # Indexed by prot_genome_type_source_idx
+    genome = models.ForeignKey(GenomeMetadata, to_field='genome_version', related_name='domain_statistics_perprotein', on_delete=models.CASCADE, db_index=False)
     genome_accession = models.CharField(max_length=100, blank=True, null=True)
     ncbi_protein_accession = models.CharField(max_length=100, blank=True, null=True, db_index=True)
     mist_protein_accession = models.CharField(max_length=100, unique=True, db_index=True)
-    protein_type = models.CharField(max_length=3, choices=ProteinType.choices, db_index=True)
-    source =  models.CharField(max_length=7, choices=Source.choices, db_index=True)
+    protein_type = models.CharField(max_length=3, choices=ProteinType.choices)
+    source =  models.CharField(max_length=7, choices=Source.choices)
     protein_length = models.IntegerField(blank=True, null=True)
     domain_architecture = models.TextField(blank=True, null=True)
     sensors_or_regulators = models.TextField(blank=True, null=True)
-    domain_counts = models.JSONField(blank=True, null=True, db_index=True)
+    # Counts per domain, {"HisKA": 1, "HATPase_c": 1}, queried by DomainStatisticsPerProteinFilter
+    domain_counts = models.JSONField(blank=True, null=True)
     domains = models.TextField(blank=True, null=True)
+    # Ids of the Domain entries of domains, in order, set by the loaders
+    domain_ids = ArrayField(models.IntegerField(), blank=True, null=True)
     search_vector = SearchVectorField(blank=True, null=True)
+    # md5 of the loaded fields, maintained by the loaders to skip unchanged rows
+    content_hash = models.CharField(max_length=32, blank=True, null=True, editable=False)
     objects = FullTextSearchQuerySet.as_manager()
 
     class Meta:
         indexes = [
             GinIndex(fields=['search_vector'], name='search_vector_prot_idx'),
-            GinIndex(fields=['domain_counts'])
+            GinIndex(fields=['domain_counts']),
+            GinIndex(fields=['domain_ids'], name='domain_ids_prot_idx'),
+            # Proteins are listed per genome, narrowed by protein type and source
+            models.Index(fields=['genome', 'protein_type', 'source'], name='prot_genome_type_source_idx'),
         ]
 
     def __str__(self):
@@ -75,38 +213,68 @@ class DomainCombinationType(models.TextChoices):
     superfamily = 'superfamily'
     superfamily_comb = 'superfamily_comb'
 
+def workload_indexes(prefix, normalized_counts, leading_fields=()):
+    """
+    Indexes of the common statistics query: protein_type, source and domain_combination_type filters sorted by
+    count_raw (then id, the keyset tie-breaker). There is one partial index per source, each row is kept in
+    one of them only, and they include the normalized counts so that facet sums are answered from the index.
+    leading_fields are filtered on by every query of the table and lead the index.
+    Sorts without these filters use the single-column indexes of the count fields.
+    """
+    return [
+        models.Index(fields=[*leading_fields, 'protein_type', 'domain_combination_type', 'count_raw', 'id'], include=normalized_counts,
+                     condition=Q(source=source), name=f'{prefix}_{source}_count_idx')
+        for source in Source.values
+    ]
+
 class DomainStatisticsPerGenome(models.Model):
     genome = models.ForeignKey(GenomeMetadata, to_field='genome_version', related_name='domain_statistics_pergenome', on_delete=models.CASCADE)
     genome_accession = models.CharField(max_length=100, blank=True, null=True)
-    source =  models.CharField(max_length=7, choices=Source.choices, db_index=True)
-    protein_type = models.CharField(max_length=3, choices=ProteinType.choices, db_index=True)
+    source =  models.CharField(max_length=7, choices=Source.choices)
+    protein_type = models.CharField(max_length=3, choices=ProteinType.choices)
     domains = models.TextField()
-    domain_combination_type = models.TextField(blank=True, null=True, choices=DomainCombinationType.choices, db_index=True)
+    # Ids of the Domain entries of domains, in order, set by the loaders
+    domain_ids = ArrayField(models.IntegerField(), blank=True, null=True)
+    domain_combination_type = models.TextField(blank=True, null=True, choices=DomainCombinationType.choices)
     count_raw = models.IntegerField(blank=True, null=True, db_index=True)
     count_normalized_by_genome_size = models.DecimalField(max_digits=11, decimal_places=9, blank=True, null=True, db_index=True)
     count_normalized_by_total_proteins = models.DecimalField(max_digits=11, decimal_places=9, blank=True, null=True, db_index=True)
     search_vector = SearchVectorField(blank=True, null=True)
+    # md5 of the loaded fields, maintained by the loaders to skip unchanged rows
+    content_hash = models.CharField(max_length=32, blank=True, null=True, editable=False)
     objects = FullTextSearchQuerySet.as_manager()
 
     class Meta:
-        unique_together = ('genome', 'source', 'protein_type', 'domains', 'domain_combination_type')
+        constraints = [
+            models.UniqueConstraint(fields=['genome', 'source', 'protein_type', 'domains', 'domain_combination_type'], name='unique_domain_statistics_per_genome')
+        ]
         indexes = [
-            GinIndex(fields=['search_vector'], name='search_vector_genome_idx')
+            GinIndex(fields=['search_vector'], name='search_vector_genome_idx'),
+            GinIndex(fields=['domain_ids'], name='domain_ids_genome_idx'),
+            *workload_indexes('genome_stats', ['count_normalized_by_genome_size', 'count_normalized_by_total_proteins']),
         ]
 
 class DomainStatisticsPerTaxon(models.Model):
+    # Rows of NCBI taxa hold the NCBI lineage in the gtdb_taxonomy_* fields, named after the original GTDB-only rows
+    taxonomy_system = models.CharField(max_length=4, choices=TaxonomySystem.choices, default=TaxonomySystem.GTDB)
     gtdb_taxonomy_string = models.TextField()
     gtdb_taxonomy_last = models.CharField(max_length=100, db_index=True)
     gtdb_taxonomy_rank = models.CharField(max_length=20, blank=True, null=True)
-    source =  models.CharField(max_length=7, choices=Source.choices, db_index=True)
-    protein_type = models.CharField(max_length=3, choices=ProteinType.choices, db_index=True)
+    # Node of the taxon, set from the taxonomy system, rank and last taxon by the loaders
+    taxon = models.ForeignKey(TaxonomyNode, blank=True, null=True, related_name='statistics', on_delete=models.SET_NULL)
+    source =  models.CharField(max_length=7, choices=Source.choices)
+    protein_type = models.CharField(max_length=3, choices=ProteinType.choices)
     domains = models.TextField()
-    domain_combination_type = models.TextField(blank=True, null=True, choices=DomainCombinationType.choices, db_index=True)
+    # Ids of the Domain entries of domains, in order, set by the loaders
+    domain_ids = ArrayField(models.IntegerField(), blank=True, null=True)
+    domain_combination_type = models.TextField(blank=True, null=True, choices=DomainCombinationType.choices)
     count_raw = models.IntegerField(blank=True, null=True, db_index=True)
     count_normalized_by_total_genomes = models.DecimalField(max_digits=11, decimal_places=7, blank=True, null=True, db_index=True)
     count_normalized_by_genome_size_by_total_genomes = models.DecimalField(max_digits=11, decimal_places=9, blank=True, null=True, db_index=True)
     count_normalized_by_total_proteins_by_total_genomes = models.DecimalField(max_digits=11, decimal_places=9, blank=True, null=True, db_index=True)
     search_vector = SearchVectorField(blank=True, null=True)
+    # md5 of the loaded fields, maintained by the loaders to skip unchanged rows
+    content_hash = models.CharField(max_length=32, blank=True, null=True, editable=False)
     objects = FullTextSearchQuerySet.as_manager()
 
     genomes = models.ManyToManyField(
@@ -116,11 +284,94 @@ class DomainStatisticsPerTaxon(models.Model):
     )
 
     class Meta:
-        unique_together = ('gtdb_taxonomy_string', 'source', 'protein_type', 'domains', 'domain_combination_type')
+        constraints = [
+            models.UniqueConstraint(fields=['taxonomy_system', 'gtdb_taxonomy_string', 'source', 'protein_type', 'domains', 'domain_combination_type'],
+                                    name='unique_domain_statistics_per_taxon')
+        ]
         indexes = [
-            GinIndex(fields=['search_vector'], name='search_vector_taxon_idx')
+            GinIndex(fields=['search_vector'], name='search_vector_taxon_idx'),
+            GinIndex(fields=['domain_ids'], name='domain_ids_taxon_idx'),
+            *workload_indexes('taxon_stats', ['count_normalized_by_total_genomes', 'count_normalized_by_genome_size_by_total_genomes',
+                                              'count_normalized_by_total_proteins_by_total_genomes'], leading_fields=['taxonomy_system']),
         ]
 
 class TaxonGenomeLink(models.Model):
     taxon = models.ForeignKey(DomainStatisticsPerTaxon, on_delete=models.CASCADE)
-    genome = models.ForeignKey(GenomeMetadata, on_delete=models.CASCADE)
\ No newline at end of file
+    genome = models.ForeignKey(GenomeMetadata, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['taxon', 'genome'], name='unique_taxon_genome_link')
+        ]
+
+
+class StaleTaxon(models.Model):
+    """
+    GTDB and NCBI taxa (taxonomy system, rank and name) whose genomes or per-genome statistics changed since their
+    DomainStatisticsPerTaxon rows were aggregated. Filled by statement triggers on GenomeMetadata and DomainStatisticsPerGenome
+    (migrations 0018 and 0019), consumed by aggregate_domain_statistics_per_taxon().
+    """
+    taxonomy_system = models.CharField(max_length=4, choices=TaxonomySystem.choices, default=TaxonomySystem.GTDB)
+    rank = models.CharField(max_length=20)
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['taxonomy_system', 'rank', 'name'], name='unique_stale_taxon')
+        ]
+
+
+class DomainStatisticsPerGenomeFacet(models.Model):
+    """
+    Rows, count_raw and normalized count sums of DomainStatisticsPerGenome grouped by genome, source,
+    protein type and domain combination type. Rebuilt by refresh_facets() after each load.
+    """
+    genome = models.ForeignKey(GenomeMetadata, to_field='genome_version', related_name='+', on_delete=models.CASCADE)
+    genome_accession = models.CharField(max_length=100, blank=True, null=True)
+    source = models.CharField(max_length=7, choices=Source.choices)
+    protein_type = models.CharField(max_length=3, choices=ProteinType.choices)
+    domain_combination_type = models.TextField(blank=True, null=True, choices=DomainCombinationType.choices)
+    row_count = models.IntegerField()
+    count_raw = models.BigIntegerField(blank=True, null=True)
+    count_normalized_by_genome_size = models.DecimalField(max_digits=20, decimal_places=9, blank=True, null=True)
+    count_normalized_by_total_proteins = models.DecimalField(max_digits=20, decimal_places=9, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', 'protein_type', 'domain_combination_type'], name='genome_facet_dims_idx')
+        ]
+
+class DomainStatisticsPerTaxonFacet(models.Model):
+    """
+    Rows, count_raw and normalized count sums of DomainStatisticsPerTaxon grouped by taxon, source,
+    protein type and domain combination type. Rebuilt by refresh_facets() after each load.
+    """
+    taxonomy_system = models.CharField(max_length=4, choices=TaxonomySystem.choices, default=TaxonomySystem.GTDB)
+    gtdb_taxonomy_string = models.TextField()
+    gtdb_taxonomy_last = models.CharField(max_length=100, db_index=True)
+    source = models.CharField(max_length=7, choices=Source.choices)
+    protein_type = models.CharField(max_length=3, choices=ProteinType.choices)
+    domain_combination_type = models.TextField(blank=True, null=True, choices=DomainCombinationType.choices)
+    row_count = models.IntegerField()
+    count_raw = models.BigIntegerField(blank=True, null=True)
+    count_normalized_by_total_genomes = models.DecimalField(max_digits=20, decimal_places=7, blank=True, null=True)
+    count_normalized_by_genome_size_by_total_genomes = models.DecimalField(max_digits=20, decimal_places=9, blank=True, null=True)
+    count_normalized_by_total_proteins_by_total_genomes = models.DecimalField(max_digits=20, decimal_places=9, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', 'protein_type', 'domain_combination_type'], name='taxon_facet_dims_idx')
+        ]
+
+
+class LoadGeneration(models.Model):
+    """
+    Number of loads recorded for a table, bumped by the loaders. Cached responses are keyed on the
+    generations so that a load invalidates them all at once.
+    """
+    label = models.CharField(max_length=100, unique=True)
+    generation = models.PositiveBigIntegerField(default=0)
+    loaded_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.label}: {self.generation}"
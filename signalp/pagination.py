@@ -1,8 +1,345 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from hashlib import md5
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.template import loader
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from signalp.caching import data_generation
+
+
+def estimate_row_count(model, using='default'):
+    """
+    Return the planner's row estimate for the model table from pg_class.reltuples,
+    or None if the table has never been analyzed.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class CountingPage(Page):
+    """
+    Page of a CountingPaginator, has_next is known from fetching one extra row rather than from the count.
+    """
+    def __init__(self, object_list, number, paginator, more):
+        super().__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        return self.more
+
+
+class CountingPaginator(Paginator):
+    """
+    Paginator that avoids running COUNT(*) on every request:
+    - unfiltered querysets on large tables use the pg_class.reltuples estimate,
+    - filtered querysets count exactly, cached per normalized query for count_cache_timeout seconds.
+    count_is_exact tells which one was used. Pages are sliced independently of the count.
+    """
+    # Tables estimated below this size are counted exactly, the count is cheap there
+    exact_count_threshold = 10000
+    count_cache_timeout = 300
+    count_cache_prefix = 'signalp:count:'
+
+    @cached_property
+    def counted(self):
+        """
+        Return (count, count_is_exact) for object_list.
+        """
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.exact_count_threshold:
+                return estimate, False
+            return queryset.count(), True
+
+        # Ordering does not change the count, leave it out of the signature
+        sql, params = queryset.order_by().query.sql_with_params()
+        signature = md5(f"{queryset.model._meta.label}:{sql}:{params!r}".encode()).hexdigest()
+        # Keyed on the data generation, so counts are recomputed after a load
+        key = f"{self.count_cache_prefix}{data_generation()}:{signature}"
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.count_cache_timeout)
+        return count, True
+
+    @property
+    def count(self):
+        return self.counted[0]
+
+    @property
+    def count_is_exact(self):
+        return self.counted[1]
+
+    def validate_number(self, number):
+        # The count may be an estimate or cached, so it does not bound the page numbers
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        return CountingPage(rows[:self.per_page], number, self, more=len(rows) > self.per_page)
+
 
 class CustomPageNumberPagination(PageNumberPagination):
     # default
     page_size = 10
     page_size_query_param = 'page_size'
     # limits abuse
-    max_page_size = 100 
\ No newline at end of file
+    max_page_size = 100
+    django_paginator_class = CountingPaginator
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'count_is_exact': self.page.paginator.count_is_exact,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_exact'] = {'type': 'boolean'}
+        return response_schema
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination: every page is fetched with a WHERE on the ordering fields of the last
+    row of the previous page, so page 10,000 costs the same as page 1 and no COUNT(*) is run.
+    The ordering is the one requested via the ordering query parameter, else the queryset's own
+    (search rank), else id, with id appended as a tie-breaker so that every position is unique.
+    Passing a page query parameter switches back to CustomPageNumberPagination.
+    """
+    page_size = CustomPageNumberPagination.page_size
+    page_size_query_param = CustomPageNumberPagination.page_size_query_param
+    max_page_size = CustomPageNumberPagination.max_page_size
+    cursor_query_param = 'cursor'
+    page_number_query_param = CustomPageNumberPagination.page_query_param
+    tie_breaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+    template = 'rest_framework/pagination/previous_and_next.html'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_number_pagination = None
+        if self.page_number_query_param in request.query_params:
+            self.page_number_pagination = CustomPageNumberPagination()
+            if not queryset.ordered:
+                queryset = queryset.order_by(self.tie_breaker)
+            page = self.page_number_pagination.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.page_number_pagination.display_page_controls
+            return page
+
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        self.ordering = self.get_ordering(request, queryset, view)
+        position, reverse = self.decode_cursor(request)
+
+        fields = [(field.lstrip('-'), field.startswith('-') != reverse) for field in self.ordering]
+        queryset = queryset.order_by(*[f"-{name}" if descending else name for name, descending in fields])
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.seek_filter(queryset, fields, position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Return the requested ordering as a list of field names with id as the last tie-breaker.
+        Without a requested ordering, the field names the queryset is ordered by are used.
+        The tie-breaker follows the direction of the last field, so that a descending ordering is a
+        backward scan of the (field, id) indexes rather than a sort of the rows sharing a value.
+        """
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        if ordering is None:
+            ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        fields = []
+        for field in ordering or []:
+            fields.append(field)
+            # A requested id ordering keeps its direction, fields after it never apply
+            if field.lstrip('-') == self.tie_breaker:
+                return fields
+        descending = bool(fields) and fields[-1].startswith('-')
+        return fields + [f"-{self.tie_breaker}" if descending else self.tie_breaker]
+
+    @staticmethod
+    def seek_filter(queryset, fields, position):
+        """
+        Build the condition selecting the rows strictly after position in the given ordering:
+        (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ..., with < for the descending fields, the tie-breaker included.
+        NULLs sort last in ascending and first in descending order, as in PostgreSQL.
+        Fields are model fields or annotations of queryset, annotations are taken as not null.
+        """
+        condition = Q(pk__in=[])
+        equal = Q()
+        bound = Q()
+        for index, ((name, descending), value) in enumerate(zip(fields, position)):
+            if value is None:
+                after = Q(pk__in=[]) if not descending else Q(**{f"{name}__isnull": False})
+                same = Q(**{f"{name}__isnull": True})
+            else:
+                nulls_after = not descending and name not in queryset.query.annotations and queryset.model._meta.get_field(name).null
+                after = Q(**{f"{name}__lt" if descending else f"{name}__gt": value})
+                if index == 0:
+                    # Redundant with the OR below, but usable as an index condition where the OR is only a filter
+                    bound = Q(**{f"{name}__lte" if descending else f"{name}__gte": value})
+                    if nulls_after:
+                        bound |= Q(**{f"{name}__isnull": True})
+                if nulls_after:
+                    after |= Q(**{f"{name}__isnull": True})
+                same = Q(**{name: value})
+            condition |= equal & after
+            equal &= same
+        return bound & condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse, ordering = cursor['p'], bool(cursor['r']), cursor['o']
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, BinasciiError):
+            raise NotFound(self.invalid_cursor_message)
+        if ordering != self.ordering or not isinstance(position, list) or len(position) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, obj, reverse):
+        attnames = [self.attname(field.lstrip('-')) for field in self.ordering]
+        # Rows are model instances or .values() dicts
+        if isinstance(obj, dict):
+            position = [obj[attname] for attname in attnames]
+        else:
+            position = [getattr(obj, attname) for attname in attnames]
+        cursor = json.dumps({'p': position, 'r': reverse, 'o': self.ordering}, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return replace_query_param(self.base_url, self.cursor_query_param, urlsafe_b64encode(cursor.encode()).decode('ascii'))
+
+    def attname(self, name):
+        try:
+            return self.model._meta.get_field(name).attname
+        except FieldDoesNotExist:
+            # Annotation, e.g. the search rank
+            return name
+
+    def get_next_link(self):
+        if self.page_number_pagination:
+            return self.page_number_pagination.get_next_link()
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Stepped back past the first row of the table, start over
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if self.page_number_pagination:
+            return self.page_number_pagination.get_previous_link()
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.page_number_pagination:
+            return self.page_number_pagination.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.page_number_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'A page number within the paginated result set. Switches to page number pagination.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+    def to_html(self):
+        if self.page_number_pagination:
+            return self.page_number_pagination.to_html()
+        template = loader.get_template(self.template)
+        return template.render({'previous_url': self.get_previous_link(), 'next_url': self.get_next_link()})
@@ -1,10 +1,140 @@
+from collections import defaultdict
+from types import SimpleNamespace
+from urllib.parse import urlencode
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
 from rest_framework import serializers
-from signalp.models import GenomeMetadata, DomainStatisticsPerProtein, DomainStatisticsPerGenome, DomainStatisticsPerTaxon
+from rest_framework.reverse import reverse
+from signalp.facets import FACET_FIELDS
+from signalp.loaders.rank_index import GTDB_RANKS
+from signalp.models import (GenomeMetadata, DomainStatisticsPerProtein, DomainStatisticsPerGenome, DomainStatisticsPerTaxon, TaxonGenomeLink,
+                            DomainStatisticsPerGenomeFacet, DomainStatisticsPerTaxonFacet, TaxonomyNode)
+
+# Stands in for the primary key when reversing a URL template, must match the <int:pk> converters
+SENTINEL_PK = 987654321987
+
+
+def url_template(view_name, request, format=None):
+    """
+    Return the (prefix, suffix) around the primary key in the URLs of a detail view.
+    """
+    url = reverse(view_name, kwargs={'pk': SENTINEL_PK}, request=request, format=format)
+    prefix, suffix = url.split(str(SENTINEL_PK), 1)
+    return prefix, suffix
+
+
+class BulkField(serializers.Field):
+    """
+    Read-only field whose values are loaded for many rows at once by bulk_representation(rows).
+    Rows are dicts of the key and extra_fields model fields, the result maps row keys to values.
+    ValuesSerializer calls it once per page, serializing a single instance loads it for that instance alone.
+    Fields that can embed a capped list of related rows do so when their name is given in ?expand=.
+    """
+    key = 'id'
+    extra_fields = ()
+    expand_query_param = 'expand'
+    expand_limit = 100
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        row = {name: getattr(instance, name) for name in (self.key, *self.extra_fields)}
+        return self.bulk_representation([row])[row[self.key]]
+
+    def bulk_representation(self, rows):
+        raise NotImplementedError
+
+    def is_expanded(self):
+        request = self.context['request']
+        return self.field_name in request.query_params.get(self.expand_query_param, '').split(',')
+
+
+class GenomeStatisticsSummaryField(BulkField):
+    """
+    Summary of the rows of a statistics model belonging to a genome, in place of a list of all of them:
+    the total count, counts per protein type and source and the list URL filtered to the genome.
+    With ?expand=<field name> the detail URLs of the first expand_limit rows are added as results.
+    """
+    key = 'genome_version'
+
+    def __init__(self, model, list_view_name, detail_view_name, **kwargs):
+        self.model = model
+        self.list_view_name = list_view_name
+        self.detail_view_name = detail_view_name
+        super().__init__(**kwargs)
+
+    def bulk_representation(self, rows):
+        request = self.context['request']
+        format = self.context.get('format')
+        list_url = reverse(self.list_view_name, request=request, format=format)
+        keys = [row[self.key] for row in rows]
+        summaries = {key: {'url': f"{list_url}?{urlencode({'genome': key})}", 'count': 0, 'counts': {}} for key in keys}
+
+        rows = self.model._base_manager.filter(genome_id__in=keys)
+        grouped = rows.values_list('genome_id', 'protein_type', 'source').annotate(count=Count('id')).order_by('genome_id', 'protein_type', 'source')
+        for genome, protein_type, source, count in grouped:
+            summaries[genome]['count'] += count
+            summaries[genome]['counts'].setdefault(protein_type, {})[source] = count
+
+        if self.is_expanded():
+            prefix, suffix = url_template(self.detail_view_name, request, format)
+            for summary in summaries.values():
+                summary['results'] = []
+            # One query for the whole page, capped per genome
+            capped = (rows.annotate(position=Window(RowNumber(), partition_by=F('genome_id'), order_by=F('id').asc()))
+                      .filter(position__lte=self.expand_limit).order_by('genome_id', 'id').values_list('genome_id', 'id'))
+            for genome, pk in capped:
+                summaries[genome]['results'].append(f"{prefix}{pk}{suffix}")
+        return summaries
+
+
+class TaxonGenomesField(BulkField):
+    """
+    Genome membership of a taxon, the same size whatever the number of genomes: the genome count,
+    the URL of the paginated genome list of the taxon and the genome list URL filtered by the taxon.
+    With ?expand=genomes the detail URLs of the first expand_limit genomes are added as results.
+    """
+    extra_fields = ('taxonomy_system', 'gtdb_taxonomy_rank', 'gtdb_taxonomy_last')
+
+    def bulk_representation(self, rows):
+        request = self.context['request']
+        format = self.context.get('format')
+        prefix, suffix = url_template('domain_statistics_pertaxon-genomes', request, format)
+        genome_list_url = reverse('genome_metadata-list', request=request, format=format)
+        summaries = {}
+        for row in rows:
+            rank = row['gtdb_taxonomy_rank']
+            field = f"{row['taxonomy_system']}_{rank}"
+            filter_url = f"{genome_list_url}?{urlencode({field: row['gtdb_taxonomy_last']})}" if rank in GTDB_RANKS else None
+            summaries[row['id']] = {'count': 0, 'url': f"{prefix}{row['id']}{suffix}", 'filter_url': filter_url}
+
+        links = TaxonGenomeLink.objects.filter(taxon_id__in=summaries)
+        for taxon, count in links.values_list('taxon_id').annotate(count=Count('id')).order_by():
+            summaries[taxon]['count'] = count
+
+        if self.is_expanded():
+            genome_prefix, genome_suffix = url_template('genome_metadata-detail', request, format)
+            for summary in summaries.values():
+                summary['results'] = []
+            # One query for the whole page, capped per taxon
+            capped = (links.annotate(position=Window(RowNumber(), partition_by=F('taxon_id'), order_by=F('genome_id').asc()))
+                      .filter(position__lte=self.expand_limit).order_by('taxon_id', 'genome_id').values_list('taxon_id', 'genome_id'))
+            for taxon, genome in capped:
+                summaries[taxon]['results'].append(f"{genome_prefix}{genome}{genome_suffix}")
+        return summaries
+
 
 class GenomeMetadataSerializer(serializers.HyperlinkedModelSerializer):
     url = serializers.HyperlinkedIdentityField(view_name='genome_metadata-detail')
-    domain_statistics_perprotein = serializers.HyperlinkedRelatedField(many=True, view_name='domain_statistics_perprotein-detail', read_only=True)
-    domain_statistics_pergenome = serializers.HyperlinkedRelatedField(many=True, view_name='domain_statistics_pergenome-detail', read_only=True)
+    # Genomes have thousands of related statistics rows, they are summarized rather than listed
+    domain_statistics_perprotein = GenomeStatisticsSummaryField(DomainStatisticsPerProtein, 'domain_statistics_perprotein-list', 'domain_statistics_perprotein-detail')
+    domain_statistics_pergenome = GenomeStatisticsSummaryField(DomainStatisticsPerGenome, 'domain_statistics_pergenome-list', 'domain_statistics_pergenome-detail')
+    gtdb_taxon = serializers.HyperlinkedRelatedField(view_name='taxonomy_node-detail', read_only=True)
+    ncbi_taxon = serializers.HyperlinkedRelatedField(view_name='taxonomy_node-detail', read_only=True)
     # We do not expose related items as each genome is associated with an exessive number of related DomainStatisticsPerTaxon entries
     # domain_statistics_pertaxon = serializers.HyperlinkedRelatedField(many=True, view_name='domain_statistics_pertaxon-detail', source='mist_taxon_statistics', read_only=True)
 
@@ -12,7 +142,7 @@ class GenomeMetadataSerializer(serializers.HyperlinkedModelSerializer):
         model = GenomeMetadata
         fields = ['url', 'id', 'genome_version', 'genome_accession', 'genome_size', 'protein_count', 
                   'gtdb_kingdom', 'gtdb_phylum', 'gtdb_class', 'gtdb_order', 'gtdb_family', 'gtdb_genus', 'gtdb_species',
-                  'ncbi_kingdom', 'ncbi_phylum', 'ncbi_class', 'ncbi_order', 'ncbi_family', 'ncbi_genus', 'ncbi_species',
+                  'ncbi_kingdom', 'ncbi_phylum', 'ncbi_class', 'ncbi_order', 'ncbi_family', 'ncbi_genus', 'ncbi_species', 'gtdb_taxon', 'ncbi_taxon',
                   'domain_statistics_perprotein', 'domain_statistics_pergenome']
         
 class DomainStatisticsPerProteinSerializer(serializers.HyperlinkedModelSerializer):
@@ -33,10 +163,202 @@ class DomainStatisticsPerGenomeSerializer(serializers.HyperlinkedModelSerializer
 
 class DomainStatisticsPerTaxonSerializer(serializers.HyperlinkedModelSerializer):
     url = serializers.HyperlinkedIdentityField(view_name='domain_statistics_pertaxon-detail')
-    genomes = serializers.HyperlinkedRelatedField(many=True, view_name='genome_metadata-detail', read_only=True)
+    # Taxa of high ranks have tens of thousands of genomes, they are summarized rather than listed
+    genomes = TaxonGenomesField()
+    taxon = serializers.HyperlinkedRelatedField(view_name='taxonomy_node-detail', read_only=True)
 
     class Meta:
         model = DomainStatisticsPerTaxon
-        fields = ['url', 'id', 'gtdb_taxonomy_string', 'gtdb_taxonomy_last', 'gtdb_taxonomy_rank', 'source', 'protein_type', 'domains', 
+        fields = ['url', 'id', 'taxonomy_system', 'gtdb_taxonomy_string', 'gtdb_taxonomy_last', 'gtdb_taxonomy_rank', 'taxon', 'source', 'protein_type', 'domains', 
                   'domain_combination_type', 'count_raw', 'count_normalized_by_total_genomes',
-                  'count_normalized_by_genome_size_by_total_genomes', 'count_normalized_by_total_proteins_by_total_genomes', 'genomes']
\ No newline at end of file
+                  'count_normalized_by_genome_size_by_total_genomes', 'count_normalized_by_total_proteins_by_total_genomes', 'genomes']
+
+class TaxonomyNodeSerializer(serializers.HyperlinkedModelSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='taxonomy_node-detail')
+    parent = serializers.HyperlinkedRelatedField(view_name='taxonomy_node-detail', read_only=True)
+
+    class Meta:
+        model = TaxonomyNode
+        fields = ['url', 'id', 'taxonomy_system', 'rank', 'name', 'depth', 'lineage', 'parent']
+
+class FacetSerializer(serializers.ModelSerializer):
+    """
+    Serializes the groups of a facet request, the facet fields that were not requested are left out.
+    """
+    count = serializers.IntegerField()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        facets = self.context.get('facets', FACET_FIELDS)
+        for name in FACET_FIELDS:
+            if name not in facets:
+                del fields[name]
+        return fields
+
+class DomainStatisticsPerGenomeFacetSerializer(FacetSerializer):
+    class Meta:
+        model = DomainStatisticsPerGenomeFacet
+        fields = FACET_FIELDS + ['count', 'count_raw', 'count_normalized_by_genome_size', 'count_normalized_by_total_proteins']
+
+class DomainStatisticsPerTaxonFacetSerializer(FacetSerializer):
+    class Meta:
+        model = DomainStatisticsPerTaxonFacet
+        fields = FACET_FIELDS + ['count', 'count_raw', 'count_normalized_by_total_genomes', 'count_normalized_by_genome_size_by_total_genomes',
+                                 'count_normalized_by_total_proteins_by_total_genomes']
+
+class GenomeSetAggregateSerializer(serializers.ModelSerializer):
+    """
+    Serializes the groups of a genome set aggregation (see signalp/genome_sets.py), measured like taxon rows.
+    """
+    genome_count = serializers.IntegerField()
+
+    class Meta:
+        model = DomainStatisticsPerTaxon
+        fields = ['source', 'protein_type', 'domains', 'domain_combination_type', 'genome_count', 'count_raw', 'count_normalized_by_total_genomes',
+                  'count_normalized_by_genome_size_by_total_genomes', 'count_normalized_by_total_proteins_by_total_genomes']
+
+class ValuesSerializer:
+    """
+    Read-only list serializer working on .values() rows instead of model instances.
+    Produces the same output as the model serializer it is built from:
+    - hyperlinks are built from a URL template reversed once per request instead of once per row,
+    - slug related fields and hyperlinks to related rows read the foreign key column, without fetching the related row,
+    - many related hyperlinks and BulkFields are loaded with one query per page,
+    - decimals go through the serializer field, other values are passed through as loaded.
+    Built with for_serializer(), which returns None for serializers with fields it does not support.
+    """
+    PASS_THROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.ChoiceField)
+
+    def __init__(self, model):
+        self.model = model
+        # (field name, row key, callable building the value from the row key), in output order
+        self.fields = []
+        # field name -> callable loading {row key: value} for the rows of a page
+        self.loaders = {}
+        self.value_fields = {'id'}
+
+    @classmethod
+    def for_serializer(cls, serializer):
+        model = serializer.Meta.model
+        values_serializer = cls(model)
+        for name, field in serializer.fields.items():
+            if not values_serializer.add_field(name, field):
+                return None
+        return values_serializer
+
+    @classmethod
+    def url_template(cls, field):
+        """
+        Return the (prefix, suffix) around the primary key in the URLs of a hyperlinked field.
+        """
+        request = field.context['request']
+        format = field.context.get('format')
+        if format and field.format and field.format != format:
+            format = field.format
+        url = field.get_url(SimpleNamespace(pk=SENTINEL_PK), field.view_name, request, format)
+        prefix, suffix = url.split(str(SENTINEL_PK), 1)
+        return prefix, suffix
+
+    def add_field(self, name, field):
+        if isinstance(field, serializers.HyperlinkedIdentityField):
+            if field.lookup_field != 'pk':
+                return False
+            prefix, suffix = self.url_template(field)
+            self.fields.append((name, 'id', lambda pk: f"{prefix}{pk}{suffix}"))
+            return True
+
+        if isinstance(field, serializers.ManyRelatedField):
+            loader = self.many_loader(field)
+            if loader is None:
+                return False
+            owner_key, self.loaders[name] = loader
+            self.fields.append((name, owner_key, None))
+            return True
+
+        if isinstance(field, BulkField):
+            # Rows are keyed by attname, which is the field name for non relational fields
+            self.loaders[name] = field.bulk_representation
+            self.fields.append((name, field.key, None))
+            self.value_fields.update((field.key, *field.extra_fields))
+            return True
+
+        if field.source == '*' or '.' in field.source:
+            return False
+        try:
+            model_field = self.model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return False
+        if not model_field.concrete:
+            return False
+
+        if isinstance(field, serializers.SlugRelatedField):
+            if not model_field.is_relation or field.slug_field != model_field.target_field.name:
+                return False
+            convert = None
+        elif isinstance(field, serializers.HyperlinkedRelatedField):
+            if not model_field.many_to_one or field.lookup_field != 'pk' or not model_field.target_field.primary_key:
+                return False
+            prefix, suffix = self.url_template(field)
+            convert = lambda pk: f"{prefix}{pk}{suffix}"
+        elif isinstance(field, serializers.DecimalField):
+            convert = field.to_representation
+        elif isinstance(field, serializers.JSONField):
+            if field.binary:
+                return False
+            convert = None
+        elif isinstance(field, self.PASS_THROUGH_FIELDS):
+            convert = None
+        else:
+            return False
+        self.fields.append((name, model_field.attname, convert))
+        self.value_fields.add(model_field.attname)
+        return True
+
+    def many_loader(self, field):
+        """
+        Return the row key and a callable loading the hyperlinks of a many related field for a page of rows.
+        Supports forward many-to-many fields and reverse foreign keys linked by primary key.
+        """
+        child = field.child_relation
+        if not isinstance(child, serializers.HyperlinkedRelatedField) or child.lookup_field != 'pk':
+            return None
+        try:
+            model_field = self.model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+
+        if model_field.many_to_many and not model_field.auto_created:
+            through = model_field.remote_field.through
+            owner_column = through._meta.get_field(model_field.m2m_field_name()).attname
+            target_column = through._meta.get_field(model_field.m2m_reverse_field_name()).attname
+            related, owner_key = through, 'id'
+        elif model_field.one_to_many:
+            related, owner_column, target_column = model_field.related_model, model_field.field.attname, 'pk'
+            owner_key = model_field.field.target_field.attname
+        else:
+            return None
+        self.value_fields.add(owner_key)
+        prefix, suffix = self.url_template(child)
+
+        def load(rows):
+            links = defaultdict(list)
+            keys = {row[owner_key] for row in rows}
+            pairs = related._base_manager.filter(**{f"{owner_column}__in": keys}).order_by(target_column).values_list(owner_column, target_column)
+            for owner, target in pairs:
+                links[owner].append(f"{prefix}{target}{suffix}")
+            return links
+        return owner_key, load
+
+    def serialize(self, rows):
+        loaded = {name: load(rows) for name, load in self.loaders.items()}
+        data = []
+        for row in rows:
+            item = {}
+            for name, key, convert in self.fields:
+                value = row[key]
+                if name in loaded:
+                    item[name] = loaded[name].get(value, [])
+                else:
+                    item[name] = convert(value) if convert is not None and value is not None else value
+            data.append(item)
+        return data
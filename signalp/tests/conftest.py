@@ -0,0 +1,8 @@
+import pytest
+from django.core.cache import caches
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Cached responses are keyed on the data generation, which test data does not bump
+    for cache in caches.all():
+        cache.clear()
@@ -1,6 +1,13 @@
 import factory
 from signalp.models import GenomeMetadata, DomainStatisticsPerProtein, DomainStatisticsPerGenome, DomainStatisticsPerTaxon
 from signalp.models import ProteinType, Source, DomainCombinationType
+from signalp.loaders.domains import domain_id_map, split_domains
+
+def domain_ids(obj):
+    # Set like the loaders do
+    names = split_domains(obj.domains)
+    ids = domain_id_map(names)
+    return [ids[name] for name in names]
 
 class GenomeMetadataFactory(factory.django.DjangoModelFactory):
     class Meta:
@@ -42,6 +49,7 @@ class DomainStatisticsPerProteinFactory(factory.django.DjangoModelFactory):
     sensors_or_regulators="nodomain"
     domain_counts={"Response_reg":1}
     domains="Response_reg"
+    domain_ids = factory.LazyAttribute(domain_ids)
 
 class DomainStatisticsPerGenomeFactory(factory.django.DjangoModelFactory):
     class Meta:
@@ -52,6 +60,7 @@ class DomainStatisticsPerGenomeFactory(factory.django.DjangoModelFactory):
     source = Source.MIST
     protein_type = ProteinType.HK
     domains = "PAS_3,PAS_4,PAS_9"
+    domain_ids = factory.LazyAttribute(domain_ids)
     domain_combination_type = DomainCombinationType.domain_comb
     count_raw = 2
     count_normalized_by_genome_size = 4.882401262588967e-07
@@ -67,6 +76,7 @@ class DomainStatisticsPerTaxonFactory(factory.django.DjangoModelFactory):
     source =  Source.MIST
     protein_type = ProteinType.HK
     domains = "PAS_Fold,PAS_Fold,Peripla_BP"
+    domain_ids = factory.LazyAttribute(domain_ids)
     domain_combination_type = "superfamily_comb"
     count_raw = 2
     count_normalized_by_total_genomes = 0.044444444444444446
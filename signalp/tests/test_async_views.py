@@ -0,0 +1,100 @@
+import asyncio
+import json
+import threading
+import time
+from inspect import iscoroutinefunction
+import pytest
+from asgiref.sync import async_to_sync
+from rest_framework.test import APIClient, APIRequestFactory
+from factories import DomainStatisticsPerGenomeFactory, GenomeMetadataFactory
+from signalp import exporters, views
+
+async def read_streaming_content(response):
+    return b"".join([chunk async for chunk in response.streaming_content])
+
+@pytest.fixture
+def view_pool(settings, monkeypatch):
+    """
+    Serve views asynchronously from a fresh pool, sized by settings.ASYNC_VIEW_THREADS when first used.
+    """
+    settings.ASYNC_VIEWS = True
+    settings.RESPONSE_CACHE_TIMEOUT = 0
+    monkeypatch.setattr(views.AsyncViewMixin, "executor", None)
+    yield
+    if views.AsyncViewMixin.executor is not None:
+        views.AsyncViewMixin.executor.shutdown()
+
+def slow_genome_stats_requests(monkeypatch, count):
+    """
+    Send count concurrent genome-stats list requests that take 0.3 s each, return their (start, end) times in start order.
+    """
+    spans = []
+    list_rows = views.DomainStatisticsPerGenomeList.list
+
+    def slow_list(self, request, *args, **kwargs):
+        start = time.monotonic()
+        time.sleep(0.3)
+        response = list_rows(self, request, *args, **kwargs)
+        spans.append((start, time.monotonic()))
+        return response
+    monkeypatch.setattr(views.DomainStatisticsPerGenomeList, "list", slow_list)
+
+    view = views.DomainStatisticsPerGenomeList.as_view()
+    factory = APIRequestFactory()
+
+    async def send():
+        return await asyncio.gather(*(view(factory.get("/genome-stats/", HTTP_ACCEPT="application/json")) for _ in range(count)))
+    assert [response.status_code for response in async_to_sync(send)()] == [200] * count
+    return sorted(spans)
+
+# Requests run in the threads of the view pool, with their own connections, which only see committed data
+@pytest.mark.django_db(transaction=True)
+def test_async_views_answer_like_sync_views(settings, view_pool, monkeypatch):
+    genome = GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    DomainStatisticsPerGenomeFactory(genome=genome, domains="HisKA", count_raw=2)
+    DomainStatisticsPerGenomeFactory(genome=genome, domains="PAS", count_raw=5)
+    settings.ASYNC_VIEWS = False
+    expected = APIClient().get("/genome-stats/?ordering=count_raw", HTTP_ACCEPT="application/json").json()
+    settings.ASYNC_VIEWS = True
+
+    factory = APIRequestFactory()
+    view = views.DomainStatisticsPerGenomeList.as_view()
+    assert iscoroutinefunction(view)
+    response = async_to_sync(view)(factory.get("/genome-stats/?ordering=count_raw", HTTP_ACCEPT="application/json"))
+    assert response.status_code == 200
+    assert json.loads(response.content) == expected
+
+    response = async_to_sync(views.GenomeMetadataDetail.as_view())(factory.get(f"/genomes/{genome.pk}/", HTTP_ACCEPT="application/json"), pk=genome.pk)
+    assert json.loads(response.content)["genome_version"] == "GCF_000009965.1"
+    response = async_to_sync(views.GenomeMetadataDetail.as_view())(factory.get("/genomes/0/", HTTP_ACCEPT="application/json"), pk=0)
+    assert response.status_code == 404
+
+    # Exports are streamed asynchronously rather than read in memory, by a thread of the pool
+    readers = set()
+    export_chunks = exporters.iter_chunks
+
+    def iter_chunks(*args, **kwargs):
+        readers.add(threading.current_thread().name)
+        yield from export_chunks(*args, **kwargs)
+    monkeypatch.setattr(exporters, "iter_chunks", iter_chunks)
+    response = async_to_sync(views.DomainStatisticsPerGenomeExport.as_view())(factory.get("/genome-stats/export/?format=ndjson&ordering=count_raw"))
+    assert response.is_async
+    rows = [json.loads(line) for line in async_to_sync(read_streaming_content)(response).decode().splitlines()]
+    assert [row["domains"] for row in rows] == ["HisKA", "PAS"]
+    assert len(readers) == 1 and readers.pop().startswith("signalp-view")
+
+@pytest.mark.django_db(transaction=True)
+def test_async_views_overlap_up_to_the_pool_size(settings, view_pool, monkeypatch):
+    settings.ASYNC_VIEW_THREADS = 2
+    (_, first_end), (second_start, _) = slow_genome_stats_requests(monkeypatch, 2)
+    assert second_start < first_end
+
+@pytest.mark.django_db(transaction=True)
+def test_async_views_wait_for_a_free_thread(settings, view_pool, monkeypatch):
+    settings.ASYNC_VIEW_THREADS = 1
+    (_, first_end), (second_start, _) = slow_genome_stats_requests(monkeypatch, 2)
+    assert second_start >= first_end
+
+def test_views_are_sync_without_async_views(settings):
+    settings.ASYNC_VIEWS = False
+    assert not iscoroutinefunction(views.DomainStatisticsPerGenomeList.as_view())
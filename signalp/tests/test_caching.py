@@ -0,0 +1,82 @@
+import pytest
+from django.core.cache import caches
+from rest_framework.test import APIClient
+from factories import DomainStatisticsPerGenomeFactory, GenomeMetadataFactory
+from signalp.caching import data_generation, record_load
+from signalp.models import DomainStatisticsPerGenome, GenomeMetadata, LoadGeneration
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+@pytest.mark.django_db
+def test_responses_are_cached_until_a_load(api_client, django_capture_on_commit_callbacks):
+    genome = GenomeMetadataFactory()
+    stats = DomainStatisticsPerGenomeFactory(genome=genome, count_raw=2)
+
+    response = api_client.get("/genome-stats/?count_raw__gte=1&source=mistdb", HTTP_ACCEPT="application/json")
+    assert response["X-Cache"] == "MISS"
+    # Same query with reordered and empty parameters
+    response_cached = api_client.get("/genome-stats/?source=mistdb&search=&count_raw__gte=1", HTTP_ACCEPT="application/json")
+    assert response_cached["X-Cache"] == "HIT-LOCAL"
+    assert response_cached.json()["results"] == response.json()["results"]
+
+    caches["local"].clear()
+    assert api_client.get("/genome-stats/?count_raw__gte=1&source=mistdb")["X-Cache"] == "HIT-SHARED"
+    assert api_client.get("/genome-stats/?count_raw__gte=1&source=mistdb")["X-Cache"] == "HIT-LOCAL"
+
+    response_detail = api_client.get(f"/genome-stats/{stats.pk}/")
+    assert response_detail["X-Cache"] == "MISS"
+    assert api_client.get(f"/genome-stats/{stats.pk}/")["X-Cache"] == "HIT-LOCAL"
+
+    # A load bumps the data generation once it commits, invalidating every cached response
+    DomainStatisticsPerGenome.objects.filter(pk=stats.pk).update(count_raw=7)
+    generation = data_generation()
+    with django_capture_on_commit_callbacks(execute=True):
+        record_load(DomainStatisticsPerGenome)
+    assert data_generation() == generation + 1
+    assert LoadGeneration.objects.get(label="signalp.DomainStatisticsPerGenome").generation == 1
+
+    response = api_client.get("/genome-stats/?count_raw__gte=1&source=mistdb")
+    assert response["X-Cache"] == "MISS"
+    assert response.data["results"][0]["count_raw"] == 7
+
+@pytest.mark.django_db
+def test_errors_are_not_cached(api_client):
+    # Errors are raised past the cache
+    for url in ["/genome-stats/1111111/", "/genomes/?genome_size=abc"]:
+        response = api_client.get(url)
+        assert response.status_code in (400, 404)
+        assert "X-Cache" not in response
+
+@pytest.mark.django_db
+def test_conditional_requests(api_client, django_assert_num_queries, django_capture_on_commit_callbacks):
+    genome = GenomeMetadataFactory()
+    DomainStatisticsPerGenomeFactory(genome=genome)
+    with django_capture_on_commit_callbacks(execute=True):
+        record_load(DomainStatisticsPerGenome)
+
+    response = api_client.get("/genome-stats/?source=mistdb", HTTP_ACCEPT="application/json")
+    etag = response["ETag"]
+    assert etag.startswith('"') and response["Last-Modified"]
+    # The browsable API is not validated
+    assert "ETag" not in api_client.get("/genome-stats/?source=mistdb")
+
+    # Answered before the cache or the database are hit
+    with django_assert_num_queries(0):
+        response = api_client.get("/genome-stats/?source=mistdb", HTTP_ACCEPT="application/json", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+    last_modified = api_client.get("/genome-stats/?source=mistdb", HTTP_ACCEPT="application/json")["Last-Modified"]
+    response = api_client.get("/genome-stats/?source=mistdb", HTTP_ACCEPT="application/json", HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == 304
+
+    # Loads of other tables do not change the validators, loads of the table do
+    with django_capture_on_commit_callbacks(execute=True):
+        record_load(GenomeMetadata)
+    assert api_client.get("/genome-stats/?source=mistdb", HTTP_ACCEPT="application/json", HTTP_IF_NONE_MATCH=etag).status_code == 304
+    with django_capture_on_commit_callbacks(execute=True):
+        record_load(DomainStatisticsPerGenome)
+    response = api_client.get("/genome-stats/?source=mistdb", HTTP_ACCEPT="application/json", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
@@ -31,6 +31,14 @@ def test_domain_stats_per_genome_list_view(api_client):
     assert len(response_search.data["results"]) == 1
     assert response_search.data["results"][0]["domains"] == "GAF_2,GAF_3,PAS_3,PAS_4"
 
+    # Filtering by domain sets
+    response_domains = api_client.get("/genome-stats/?domains_all=PAS_4,PAS_3")
+    assert len(response_domains.data["results"]) == 2
+    response_domains = api_client.get("/genome-stats/?domains_any=GAF_3,PAS_9&domains_exclude=PAS_9")
+    assert [item["domains"] for item in response_domains.data["results"]] == ["GAF_2,GAF_3,PAS_3,PAS_4"]
+    # Unknown domains match nothing
+    assert api_client.get("/genome-stats/?domains_all=PAS_3,Unknown").data["results"] == []
+
 @pytest.mark.django_db
 def test_domain_stats_per_genome_detail_view(api_client):
     genome_metadata = GenomeMetadataFactory(genome_version="GCF_000015765.1")
@@ -41,4 +41,31 @@ def test_domain_stats_per_protein_detail_view(api_client):
 
     # Not existing genome
     response_404 = api_client.get("/protein-stats/1111111/")
-    assert response_404.status_code == 404
\ No newline at end of file
+    assert response_404.status_code == 404
+
+@pytest.mark.django_db
+def test_domain_stats_per_protein_domain_queries(api_client):
+    genome = GenomeMetadataFactory()
+    DomainStatisticsPerProteinFactory(genome=genome, mist_protein_accession="A", domains="HATPase_c,HisKA", domain_counts={"HisKA": 1, "HATPase_c": 1})
+    DomainStatisticsPerProteinFactory(genome=genome, mist_protein_accession="B", domains="HATPase_c,HisKA,PAS", domain_counts={"HisKA": 2, "HATPase_c": 1, "PAS": 1})
+    DomainStatisticsPerProteinFactory(genome=genome, mist_protein_accession="C", domains="HisKA", domain_counts={"HisKA": 3})
+    DomainStatisticsPerProteinFactory(genome=genome, mist_protein_accession="D", domains=None, domain_counts=None)
+
+    def query(**params):
+        response = api_client.get("/protein-stats/", params, HTTP_ACCEPT="application/json")
+        assert response.status_code == 200
+        return sorted(row["mist_protein_accession"] for row in response.json()["results"])
+
+    assert query(domains_all="HisKA,HATPase_c", domains_exclude="PAS") == ["A"]
+    assert query(domains_any="PAS,Response_reg") == ["B"]
+    assert query(domains_exclude="HATPase_c") == ["C", "D"]
+    assert query(domain_count="HisKA:2:3") == ["B", "C"]
+    assert query(domain_count="HisKA:2") == ["B"]
+    assert query(domain_count="HisKA:2:") == ["B", "C"]
+    # Proteins without a domain count 0 of it
+    assert query(domain_count="PAS::0") == ["A", "C", "D"]
+    assert query(domain_count="HisKA::1,HATPase_c:1") == ["A"]
+
+    response = api_client.get("/protein-stats/?domain_count=HisKA:two", HTTP_ACCEPT="application/json")
+    assert response.status_code == 400
+    assert "domain_count" in response.json()
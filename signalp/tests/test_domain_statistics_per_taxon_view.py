@@ -1,4 +1,5 @@
 import pytest
+from signalp.caching import data_generation
 from rest_framework.test import APIClient
 from factories import DomainStatisticsPerTaxonFactory, GenomeMetadataFactory
 from signalp.models import TaxonGenomeLink
@@ -44,7 +45,7 @@ def test_domain_stats_per_taxon_list_view(api_client):
     assert len(response_search.data["results"]) == 1
     assert response_search.data["results"][0]["gtdb_taxonomy_string"] == "Bacteria;Elusimicrobiota;Elusimicrobia"
     # Test linked genome_metadata models
-    assert len(response_search.data["results"][0]["genomes"]) == 2
+    assert response_search.data["results"][0]["genomes"]["count"] == 2
 
 @pytest.mark.django_db
 def test_domain_stats_per_taxon_detail_view(api_client):
@@ -60,4 +61,58 @@ def test_domain_stats_per_taxon_detail_view(api_client):
 
     # Not existing domain_stat_per_taxon
     response_404 = api_client.get("/taxon-stats/1111111/")
-    assert response_404.status_code == 404
\ No newline at end of file
+    assert response_404.status_code == 404
+
+@pytest.mark.django_db
+def test_domain_stats_per_taxon_genomes(api_client, django_assert_num_queries):
+    genome_metadata1 = GenomeMetadataFactory(genome_version="GCF_000013445.1", gtdb_order="Methanomicrobiales")
+    genome_metadata2 = GenomeMetadataFactory(genome_version="GCF_000009965.1", gtdb_order="Methanomicrobiales")
+    GenomeMetadataFactory(genome_version="GCA_001800075.1", gtdb_order="Elusimicrobiales")
+    domain_stat_per_taxon = DomainStatisticsPerTaxonFactory(gtdb_taxonomy_last="Methanomicrobiales", gtdb_taxonomy_rank="order")
+    DomainStatisticsPerTaxonFactory(gtdb_taxonomy_last="Methanomicrobiales", gtdb_taxonomy_rank="order", domains="GAF_2")
+    TaxonGenomeLink.objects.create(taxon=domain_stat_per_taxon, genome=genome_metadata1)
+    TaxonGenomeLink.objects.create(taxon=domain_stat_per_taxon, genome=genome_metadata2)
+
+    data_generation()
+    # One query for the page and one for the genome counts of all its taxa
+    with django_assert_num_queries(2):
+        response = api_client.get("/taxon-stats/")
+    genomes = response.data["results"][0]["genomes"]
+    assert genomes == {
+        "count": 2,
+        "url": f"http://testserver/taxon-stats/{domain_stat_per_taxon.pk}/genomes/",
+        "filter_url": "http://testserver/genomes/?gtdb_order=Methanomicrobiales",
+    }
+    assert response.data["results"][1]["genomes"]["count"] == 0
+
+    response_filter = api_client.get(genomes["filter_url"])
+    assert {item["genome_version"] for item in response_filter.data["results"]} == {"GCF_000013445.1", "GCF_000009965.1"}
+
+    response_genomes = api_client.get(genomes["url"] + "?page_size=1")
+    assert [item["genome_version"] for item in response_genomes.data["results"]] == ["GCF_000013445.1"]
+    assert response_genomes.data["next"] is not None
+    assert api_client.get("/taxon-stats/1111111/genomes/").status_code == 404
+
+    response_expanded = api_client.get(f"/taxon-stats/{domain_stat_per_taxon.pk}/?expand=genomes")
+    assert response_expanded.data["genomes"]["results"] == [
+        f"http://testserver/genomes/{genome_metadata1.pk}/", f"http://testserver/genomes/{genome_metadata2.pk}/"
+    ]
+
+@pytest.mark.django_db
+def test_domain_stats_per_taxon_taxonomy_system(api_client):
+    gtdb = DomainStatisticsPerTaxonFactory(gtdb_taxonomy_string="Archaea;Methanobacteriota_B", gtdb_taxonomy_last="Methanobacteriota_B",
+                                           gtdb_taxonomy_rank="phylum")
+    ncbi = DomainStatisticsPerTaxonFactory(taxonomy_system="ncbi", gtdb_taxonomy_string="Archaea;Euryarchaeota", gtdb_taxonomy_last="Euryarchaeota",
+                                           gtdb_taxonomy_rank="phylum")
+
+    # GTDB rows unless NCBI is asked for
+    response = api_client.get("/taxon-stats/")
+    assert [item["id"] for item in response.data["results"]] == [gtdb.pk]
+    response = api_client.get("/taxon-stats/?taxonomy_system=ncbi")
+    assert [item["id"] for item in response.data["results"]] == [ncbi.pk]
+    assert response.data["results"][0]["taxonomy_system"] == "ncbi"
+    assert response.data["results"][0]["genomes"]["filter_url"] == "http://testserver/genomes/?ncbi_phylum=Euryarchaeota"
+    assert api_client.get("/taxon-stats/?taxonomy_system=silva").status_code == 400
+
+    response = api_client.get("/taxon-stats/facets/?taxonomy_system=ncbi", HTTP_ACCEPT="application/json")
+    assert [group["count"] for group in response.json()["results"]] == [1]
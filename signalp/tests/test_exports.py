@@ -0,0 +1,57 @@
+import io
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from rest_framework.test import APIClient
+from factories import DomainStatisticsPerGenomeFactory, DomainStatisticsPerProteinFactory, GenomeMetadataFactory
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+@pytest.fixture
+def genome_stats():
+    genome = GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    DomainStatisticsPerGenomeFactory(genome=genome, domains="PAS_3,PAS_4,PAS_9", count_raw=2, count_normalized_by_genome_size=4.882401262588967e-07)
+    DomainStatisticsPerGenomeFactory(genome=genome, domains="GAF_2,GAF_3", count_raw=5, count_normalized_by_genome_size=None)
+
+def content(response):
+    return b"".join(response.streaming_content)
+
+@pytest.mark.django_db
+def test_export_genome_stats_ndjson(api_client, genome_stats):
+    response = api_client.get("/genome-stats/export/?format=ndjson")
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/x-ndjson; charset=utf-8"
+    rows = [json.loads(line) for line in content(response).decode().splitlines()]
+    assert [row["domains"] for row in rows] == ["PAS_3,PAS_4,PAS_9", "GAF_2,GAF_3"]
+    assert rows[0]["genome"] == "GCF_000009965.1"
+    assert rows[0]["count_normalized_by_genome_size"] == "0.000000488"
+    assert "url" not in rows[0]
+
+    # Filters of the list view apply
+    response = api_client.get("/genome-stats/export/?format=ndjson&count_raw__gte=3")
+    assert len(content(response).decode().splitlines()) == 1
+
+@pytest.mark.django_db
+def test_export_genome_stats_tsv_by_accept_header(api_client, genome_stats):
+    response = api_client.get("/genome-stats/export/", HTTP_ACCEPT="text/tab-separated-values")
+    assert response.status_code == 200
+    lines = content(response).decode().splitlines()
+    header = lines[0].split("\t")
+    assert header[:3] == ["id", "genome", "genome_accession"]
+    assert len(lines) == 3
+    assert lines[2].split("\t")[header.index("count_normalized_by_genome_size")] == ""
+
+@pytest.mark.django_db
+def test_export_protein_stats_columnar(api_client):
+    DomainStatisticsPerProteinFactory(domain_counts={"Response_reg": 1})
+
+    table = pq.read_table(io.BytesIO(content(api_client.get("/protein-stats/export/?format=parquet"))))
+    assert table.num_rows == 1
+    assert table.column("genome").to_pylist() == ["GCF_000009965.1"]
+    assert json.loads(table.column("domain_counts")[0].as_py()) == {"Response_reg": 1}
+
+    table = pa.ipc.open_stream(content(api_client.get("/protein-stats/export.arrow"))).read_all()
+    assert table.column("protein_length").to_pylist() == [120]
@@ -0,0 +1,74 @@
+import pytest
+from rest_framework.test import APIClient
+from factories import DomainStatisticsPerGenomeFactory, DomainStatisticsPerTaxonFactory, GenomeMetadataFactory
+from signalp.caching import record_load
+from signalp.facets import refresh_facets
+from signalp.models import DomainStatisticsPerGenome, DomainStatisticsPerTaxon
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+def load(model, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        record_load(model)
+        refresh_facets(model)
+
+@pytest.mark.django_db
+def test_genome_stats_facets(api_client, django_capture_on_commit_callbacks):
+    genome1 = GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    genome2 = GenomeMetadataFactory(genome_version="GCF_000015765.1")
+    DomainStatisticsPerGenomeFactory(genome=genome1, domains="PAS_3", count_raw=2, count_normalized_by_genome_size=0.000000400)
+    DomainStatisticsPerGenomeFactory(genome=genome1, domains="PAS_4", count_raw=3, count_normalized_by_genome_size=0.000000100)
+    DomainStatisticsPerGenomeFactory(genome=genome1, domains="GAF_2", source="rmodels", count_raw=1)
+    DomainStatisticsPerGenomeFactory(genome=genome2, domains="PAS_3", count_raw=7)
+
+    # Without a summary the statistics table is aggregated
+    response = api_client.get("/genome-stats/facets/?genome=GCF_000009965.1&facets=source", HTTP_ACCEPT="application/json")
+    assert response.status_code == 200
+    live = response.json()
+    assert live["precomputed"] is False
+    assert live["results"][0] == {"source": "mistdb", "count": 2, "count_raw": 5,
+                                  "count_normalized_by_genome_size": "0.000000500", "count_normalized_by_total_proteins": "0.001150418"}
+    assert [group["count"] for group in live["results"]] == [2, 1]
+
+    load(DomainStatisticsPerGenome, django_capture_on_commit_callbacks)
+    response = api_client.get("/genome-stats/facets/?genome=GCF_000009965.1&facets=source", HTTP_ACCEPT="application/json")
+    assert response.json()["precomputed"] is True
+    assert response.json()["results"] == live["results"]
+
+    response = api_client.get("/genome-stats/facets/", HTTP_ACCEPT="application/json")
+    assert response.json()["facets"] == ["source", "protein_type", "domain_combination_type"]
+    assert sum(group["count"] for group in response.json()["results"]) == 4
+
+    # Filters the summary cannot answer aggregate the statistics table
+    response = api_client.get("/genome-stats/facets/?count_raw__gte=3&facets=source", HTTP_ACCEPT="application/json")
+    assert response.json()["precomputed"] is False
+    assert response.json()["results"][0]["count_raw"] == 10
+
+    # Changes outside a refresh make the summary stale
+    DomainStatisticsPerGenomeFactory(genome=genome2, domains="PAS_4", count_raw=1)
+    with django_capture_on_commit_callbacks(execute=True):
+        record_load(DomainStatisticsPerGenome)
+    response = api_client.get("/genome-stats/facets/?facets=source", HTTP_ACCEPT="application/json")
+    assert response.json()["precomputed"] is False
+    assert response.json()["results"][0]["count"] == 4
+
+    response = api_client.get("/genome-stats/facets/?facets=domains", HTTP_ACCEPT="application/json")
+    assert response.status_code == 400
+
+@pytest.mark.django_db
+def test_taxon_stats_facets(api_client, django_capture_on_commit_callbacks):
+    DomainStatisticsPerTaxonFactory(domains="PAS_3", count_raw=4)
+    DomainStatisticsPerTaxonFactory(domains="PAS_4", count_raw=6, protein_type="rr")
+    DomainStatisticsPerTaxonFactory(gtdb_taxonomy_string="d__Bacteria", gtdb_taxonomy_last="d__Bacteria", gtdb_taxonomy_rank="domain",
+                                    domains="PAS_3", count_raw=100)
+    load(DomainStatisticsPerTaxon, django_capture_on_commit_callbacks)
+
+    response = api_client.get("/taxon-stats/facets/?gtdb_taxonomy_last=d__Bacteria", HTTP_ACCEPT="application/json")
+    assert response.json()["precomputed"] is True
+    assert [(group["protein_type"], group["count"], group["count_raw"]) for group in response.json()["results"]] == [("hk", 1, 100)]
+
+    response = api_client.get("/taxon-stats/facets/?facets=protein_type&search=PAS_4", HTTP_ACCEPT="application/json")
+    assert response.json()["precomputed"] is False
+    assert [(group["protein_type"], group["count_raw"]) for group in response.json()["results"]] == [("rr", 6)]
@@ -1,6 +1,8 @@
 import pytest
+from signalp.caching import data_generation
 from rest_framework.test import APIClient
-from factories import GenomeMetadataFactory
+from factories import GenomeMetadataFactory, DomainStatisticsPerProteinFactory
+from signalp.serializers import GenomeStatisticsSummaryField
 
 @pytest.fixture
 def api_client():
@@ -38,4 +40,35 @@ def test_genome_metadata_detail_view(api_client):
 
     # Not existing genome
     response_404 = api_client.get("/genomes/1111111/")
-    assert response_404.status_code == 404
\ No newline at end of file
+    assert response_404.status_code == 404
+
+@pytest.mark.django_db
+def test_genome_metadata_summarizes_related_statistics(api_client, django_assert_num_queries, monkeypatch):
+    genome_metadata = GenomeMetadataFactory(genome_version="GCF_000015765.1")
+    DomainStatisticsPerProteinFactory(genome=genome_metadata, mist_protein_accession="p1", protein_type="hk", source="mistdb")
+    DomainStatisticsPerProteinFactory(genome=genome_metadata, mist_protein_accession="p2", protein_type="hk", source="rmodels")
+    DomainStatisticsPerProteinFactory(genome=genome_metadata, mist_protein_accession="p3", protein_type="rr", source="mistdb")
+    GenomeMetadataFactory(genome_version="GCF_000009965.1")
+
+    data_generation()
+    # One query for the page and one grouped query per summarized model
+    with django_assert_num_queries(3):
+        api_client.get("/genomes/")
+    response = api_client.get("/genomes/?genome_version=GCF_000015765.1")
+    summary = response.data["results"][0]["domain_statistics_perprotein"]
+    assert summary["count"] == 3
+    assert summary["counts"] == {"hk": {"mistdb": 1, "rmodels": 1}, "rr": {"mistdb": 1}}
+    assert summary["url"] == "http://testserver/protein-stats/?genome=GCF_000015765.1"
+    assert "results" not in summary
+    assert response.data["results"][0]["domain_statistics_pergenome"]["count"] == 0
+
+    # The detail view gives the same summary
+    response_detail = api_client.get(f"/genomes/{genome_metadata.pk}/")
+    assert response_detail.data["domain_statistics_perprotein"] == summary
+
+    # Expanded rows are capped per genome
+    monkeypatch.setattr(GenomeStatisticsSummaryField, "expand_limit", 2)
+    response_expanded = api_client.get("/genomes/?expand=domain_statistics_perprotein")
+    expanded = {item["genome_version"]: item["domain_statistics_perprotein"]["results"] for item in response_expanded.data["results"]}
+    assert len(expanded["GCF_000015765.1"]) == 2
+    assert expanded["GCF_000009965.1"] == []
@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+import pytest
+from rest_framework.test import APIClient
+from factories import DomainStatisticsPerGenomeFactory, GenomeMetadataFactory
+from signalp.genome_sets import EMPTY_SET_SIGNATURE, aggregate_genome_set, genome_set_signature
+from signalp.models import DomainStatisticsPerGenome, GenomeMetadata
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+@pytest.fixture
+def genomes():
+    genome1 = GenomeMetadataFactory(genome_version="GCF_000009965.1", genome_size=2088737)
+    genome2 = GenomeMetadataFactory(genome_version="GCF_000015765.1", genome_size=1860000, gtdb_genus="Pyrococcus", ncbi_genus="Pyrococcus")
+    genome3 = GenomeMetadataFactory(genome_version="GCF_000013445.1", genome_size=3100000)
+    DomainStatisticsPerGenomeFactory(genome=genome1, domains="HisKA", count_raw=2, count_normalized_by_genome_size=Decimal("0.000000400"),
+                                     count_normalized_by_total_proteins=Decimal("0.000800000"))
+    DomainStatisticsPerGenomeFactory(genome=genome2, domains="HisKA", count_raw=5, count_normalized_by_genome_size=Decimal("0.000001000"),
+                                     count_normalized_by_total_proteins=Decimal("0.002000000"))
+    DomainStatisticsPerGenomeFactory(genome=genome3, domains="PAS", count_raw=1)
+    return genome1, genome2, genome3
+
+@pytest.mark.django_db
+def test_genome_set_signature(genomes):
+    signature, total = genome_set_signature(GenomeMetadata.objects.filter(gtdb_kingdom="Archaea"))
+    assert total == 3
+    # Independent of the filter and of the order of the genomes
+    assert genome_set_signature(GenomeMetadata.objects.order_by("-genome_size")) == (signature, 3)
+    assert genome_set_signature(GenomeMetadata.objects.none()) == (EMPTY_SET_SIGNATURE, 0)
+
+@pytest.mark.django_db
+def test_aggregate_genome_set(genomes):
+    selected = GenomeMetadata.objects.filter(genome_size__lte=2500000)
+    groups = aggregate_genome_set(DomainStatisticsPerGenome.objects.all(), selected, 2)
+    assert len(groups) == 1
+    assert groups[0]["domains"] == "HisKA" and (groups[0]["genome_count"], groups[0]["count_raw"]) == (2, 7)
+    assert groups[0]["count_normalized_by_total_genomes"] == Decimal("3.5000000")
+    assert groups[0]["count_normalized_by_genome_size_by_total_genomes"] == Decimal("0.000000700")
+    assert groups[0]["count_normalized_by_total_proteins_by_total_genomes"] == Decimal("0.001400000")
+    assert aggregate_genome_set(DomainStatisticsPerGenome.objects.all(), GenomeMetadata.objects.none(), 0) == []
+
+@pytest.mark.django_db
+def test_genome_set_aggregate_view(api_client, genomes):
+    response = api_client.get("/genome-stats/aggregate/?ncbi_kingdom=Archaea&genome_size__gte=2000000", HTTP_ACCEPT="application/json")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_genomes"] == 2
+    # Normalized by the genomes of the set, with or without statistics
+    assert data["results"] == [
+        {"source": "mistdb", "protein_type": "hk", "domains": "HisKA", "domain_combination_type": "domain_comb", "genome_count": 1, "count_raw": 2,
+         "count_normalized_by_total_genomes": "1.0000000", "count_normalized_by_genome_size_by_total_genomes": "0.000000200",
+         "count_normalized_by_total_proteins_by_total_genomes": "0.000400000"},
+        {"source": "mistdb", "protein_type": "hk", "domains": "PAS", "domain_combination_type": "domain_comb", "genome_count": 1, "count_raw": 1,
+         "count_normalized_by_total_genomes": "0.5000000", "count_normalized_by_genome_size_by_total_genomes": "0.000000244",
+         "count_normalized_by_total_proteins_by_total_genomes": "0.000287605"},
+    ]
+
+    response = api_client.get("/genome-stats/aggregate/?gtdb_genus=Pyrococcus&domains_any=HisKA", HTTP_ACCEPT="application/json")
+    assert response.json()["total_genomes"] == 1 and response.json()["results"][0]["count_raw"] == 5
+
+    response = api_client.get("/genome-stats/aggregate/?genomes=GCF_000009965.1,GCF_000000000.1", HTTP_ACCEPT="application/json")
+    assert response.json()["total_genomes"] == 1 and len(response.json()["results"]) == 1
+
+    response = api_client.get("/genome-stats/aggregate/?genome_size__gte=big", HTTP_ACCEPT="application/json")
+    assert response.status_code == 400 and "genome_size__gte" in response.json()
+
+@pytest.mark.django_db
+def test_genome_set_aggregate_is_cached_per_genome_set(api_client, genomes):
+    genome1, genome2, _ = genomes
+    response = api_client.get("/genome-stats/aggregate/?gtdb_genus=Thermococcus&genome_size__gte=2000000", HTTP_ACCEPT="application/json")
+    assert response["X-Cache"] == "MISS"
+    cached = response.json()
+
+    # Test data does not bump the data generation, a changed result would show the query ran again
+    DomainStatisticsPerGenome.objects.filter(genome=genome1).update(count_raw=9)
+    response = api_client.get(f"/genome-stats/aggregate/?genomes={genome1.genome_version},GCF_000013445.1", HTTP_ACCEPT="application/json")
+    assert response["X-Cache"] == "MISS"
+    assert response.json() == cached
+
+    # Other row filters over the same genomes are computed separately
+    response = api_client.get(f"/genome-stats/aggregate/?genomes={genome1.genome_version},GCF_000013445.1&domains_all=HisKA",
+                              HTTP_ACCEPT="application/json")
+    assert response.json()["results"][0]["count_raw"] == 9
@@ -0,0 +1,245 @@
+import pytest
+from django.db import IntegrityError, connection, transaction
+from factories import GenomeMetadataFactory
+from signalp.models import Domain, DomainStatisticsPerProtein, DomainStatisticsPerGenome, DomainStatisticsPerGenomeFacet, DomainStatisticsPerTaxon, LoadGeneration, StaleTaxon, TaxonGenomeLink
+from signalp.loaders.parallel import resolve_input_files
+from signalp.loaders.per_protein_stats_loader import load_domain_statistics_per_protein, stream_domain_statistics_per_protein
+from signalp.loaders.per_genome_stats_loader import load_domain_statistics_per_genome
+from signalp.loaders.per_taxon_stats_loader import load_domain_statistics_per_taxon
+
+PROTEIN_HEADER = ["genome", "genome_accession", "ncbi_protein_accession", "mist_protein_accession", "protein_type", "source",
+                  "protein_length", "domain_architecture", "sensors_or_regulators", "domain_counts", "domains"]
+GENOME_STATS_HEADER = ["genome", "genome_accession", "source", "protein_type", "domains", "domain_combination_type",
+                       "count_raw", "count_normalized_by_genome_size", "count_normalized_by_total_proteins"]
+TAXON_STATS_HEADER = ["gtdb_taxonomy_string", "gtdb_taxonomy_last", "gtdb_taxonomy_rank", "source", "protein_type", "domains",
+                      "domain_combination_type", "count_raw", "count_normalized_by_total_genomes",
+                      "count_normalized_by_genome_size_by_total_genomes", "count_normalized_by_total_proteins_by_total_genomes"]
+
+def write_tsv(path, header, rows):
+    lines = ["\t".join(header)] + ["\t".join(row) for row in rows]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+@pytest.mark.django_db
+def test_stream_per_protein_stats(tmp_path):
+    GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    tsv = write_tsv(tmp_path / "proteins.tsv", PROTEIN_HEADER, [
+        ["GCF_000009965.1", "GCF_000009965", "WP_1.1", "GCF_000009965.1-A", "hk", "mistdb", "500", "HisKA:1-60", "HisKA", "HisKA:1", "HisKA"],
+        ["GCF_000009965.1", "GCF_000009965", "WP_2.1", "GCF_000009965.1-B", "rr", "mistdb", "", "Response_reg:4-115", "nodomain", "Response_reg:1", "Response_reg"],
+        # Unknown genome is skipped
+        ["GCF_999999999.1", "GCF_999999999", "WP_3.1", "GCF_999999999.1-C", "hk", "mistdb", "400", "HisKA:1-60", "HisKA", "HisKA:1", "HisKA"],
+        # Missing accession is skipped
+        ["GCF_000009965.1", "GCF_000009965", "WP_4.1", "", "hk", "mistdb", "400", "HisKA:1-60", "HisKA", "HisKA:1", "HisKA"],
+    ])
+    stream_domain_statistics_per_protein(file_path=tsv)
+    assert DomainStatisticsPerProtein.objects.count() == 2
+    protein = DomainStatisticsPerProtein.objects.get(mist_protein_accession="GCF_000009965.1-B")
+    assert protein.protein_length is None
+    assert protein.genome.genome_version == "GCF_000009965.1"
+    assert protein.domain_counts == {"Response_reg": 1}
+
+    # Reloading updates rows in place, the last duplicate wins
+    tsv = write_tsv(tmp_path / "proteins.tsv", PROTEIN_HEADER, [
+        ["GCF_000009965.1", "GCF_000009965", "WP_1.1", "GCF_000009965.1-A", "hk", "mistdb", "510", "HisKA:1-60", "HisKA", "HisKA:1", "HisKA"],
+        ["GCF_000009965.1", "GCF_000009965", "WP_1.1", "GCF_000009965.1-A", "hk", "mistdb", "520", "HisKA:1-60", "HisKA", "HisKA:1", "HisKA"],
+    ])
+    stream_domain_statistics_per_protein(file_path=tsv)
+    assert DomainStatisticsPerProtein.objects.count() == 2
+    assert DomainStatisticsPerProtein.objects.get(mist_protein_accession="GCF_000009965.1-A").protein_length == 520
+
+@pytest.mark.django_db
+def test_stream_per_protein_stats_after_orm_load(tmp_path):
+    GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    row = ["GCF_000009965.1", "GCF_000009965", "WP_1.1", "GCF_000009965.1-A", "hk", "mistdb", "500", "HisKA:1-60", "HisKA", "HisKA:1", "HisKA"]
+    streamed = write_tsv(tmp_path / "streamed.tsv", PROTEIN_HEADER, [row])
+    stream_domain_statistics_per_protein(file_path=streamed)
+    load_domain_statistics_per_protein(file_path=write_tsv(tmp_path / "orm.tsv", PROTEIN_HEADER, [row[:6] + ["999"] + row[7:]]))
+    assert DomainStatisticsPerProtein.objects.get().protein_length == 999
+
+    # The ORM load left no stale content hash, the original values are not taken as unchanged
+    stream_domain_statistics_per_protein(file_path=streamed)
+    assert DomainStatisticsPerProtein.objects.get().protein_length == 500
+
+def test_stream_per_protein_stats_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        stream_domain_statistics_per_protein(file_path=tmp_path / "missing.tsv")
+
+@pytest.mark.django_db
+def test_load_per_genome_stats_upserts_only_changed_rows(tmp_path):
+    GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    rows = [
+        ["GCF_000009965.1", "GCF_000009965", "mistdb", "hk", "PAS_3,PAS_4", "domain_comb", "2", "4.8e-07", "0.00057"],
+        ["GCF_000009965.1", "GCF_000009965", "mistdb", "hk", "HisKA", "domain", "5", "1.2e-06", "0.0014"],
+        ["GCF_999999999.1", "GCF_999999999", "mistdb", "hk", "HisKA", "domain", "5", "1.2e-06", "0.0014"],
+    ]
+    load_domain_statistics_per_genome(file_path=write_tsv(tmp_path / "genomes.tsv", GENOME_STATS_HEADER, rows))
+    assert DomainStatisticsPerGenome.objects.count() == 2
+    unchanged = DomainStatisticsPerGenome.objects.get(domains="PAS_3,PAS_4")
+    xmin_before = DomainStatisticsPerGenome.objects.extra(select={"xmin": "xmin::text"}).values_list("xmin", flat=True).get(pk=unchanged.pk)
+
+    rows[1][6] = "6"
+    load_domain_statistics_per_genome(file_path=write_tsv(tmp_path / "genomes.tsv", GENOME_STATS_HEADER, rows))
+    assert DomainStatisticsPerGenome.objects.count() == 2
+    assert DomainStatisticsPerGenome.objects.get(domains="HisKA").count_raw == 6
+    # Domains are mapped to ids of the Domain dictionary, in order
+    domain_ids = dict(Domain.objects.values_list("name", "id"))
+    assert unchanged.domain_ids == [domain_ids["PAS_3"], domain_ids["PAS_4"]]
+    # The unchanged row was not rewritten
+    xmin_after = DomainStatisticsPerGenome.objects.extra(select={"xmin": "xmin::text"}).values_list("xmin", flat=True).get(pk=unchanged.pk)
+    assert xmin_before == xmin_after
+
+@pytest.mark.django_db
+def test_load_per_genome_stats_reports_unchanged_and_deletes_missing(tmp_path):
+    GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    rows = [
+        ["GCF_000009965.1", "GCF_000009965", "mistdb", "hk", "PAS_3,PAS_4", "domain_comb", "2", "4.8e-07", "0.00057"],
+        ["GCF_000009965.1", "GCF_000009965", "mistdb", "hk", "HisKA", "domain", "5", "1.2e-06", "0.0014"],
+    ]
+    result = load_domain_statistics_per_genome(file_path=write_tsv(tmp_path / "genomes.tsv", GENOME_STATS_HEADER, rows))
+    assert result == {"created": 2, "updated": 0, "unchanged": 0, "deleted": 0}
+
+    result = load_domain_statistics_per_genome(file_path=write_tsv(tmp_path / "genomes.tsv", GENOME_STATS_HEADER, rows[:1]))
+    assert result == {"created": 0, "updated": 0, "unchanged": 1, "deleted": 0}
+    # Loads that change nothing leave the load generation, and so the response cache, alone
+    assert LoadGeneration.objects.get(label="signalp.DomainStatisticsPerGenome").generation == 1
+    assert DomainStatisticsPerGenome.objects.count() == 2
+
+    result = load_domain_statistics_per_genome(
+        file_path=write_tsv(tmp_path / "genomes.tsv", GENOME_STATS_HEADER, rows[:1]), delete_missing=True
+    )
+    assert result == {"created": 0, "updated": 0, "unchanged": 1, "deleted": 1}
+    assert list(DomainStatisticsPerGenome.objects.values_list("domains", flat=True)) == ["PAS_3,PAS_4"]
+    # The facet summary is rebuilt with the load
+    assert list(DomainStatisticsPerGenomeFacet.objects.values_list("domain_combination_type", "row_count", "count_raw")) == [("domain_comb", 1, 2)]
+
+@pytest.mark.django_db
+def test_load_per_taxon_stats_links_genomes(tmp_path):
+    genome1 = GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    genome2 = GenomeMetadataFactory(genome_version="GCF_000015765.1", gtdb_genus="Pyrococcus")
+    other = GenomeMetadataFactory(genome_version="GCF_000013445.1", gtdb_order="Methanomicrobiales")
+    rows = [
+        ["Archaea;Methanobacteriota_B;Thermococci;Thermococcales", "Thermococcales", "order", "mistdb", "hk", "HisKA", "domain", "4", "2", "1e-06", "0.001"],
+        ["Archaea;Methanobacteriota_B;Thermococci;Thermococcales;Thermococcaceae;Pyrococcus", "Pyrococcus", "genus", "mistdb", "hk", "HisKA", "domain", "1", "1", "1e-06", "0.001"],
+        ["Bacteria;Unknown", "Unknown", "phylum", "mistdb", "hk", "HisKA", "domain", "1", "1", "1e-06", "0.001"],
+    ]
+    load_domain_statistics_per_taxon(file_path=write_tsv(tmp_path / "taxa.tsv", TAXON_STATS_HEADER, rows))
+    assert DomainStatisticsPerTaxon.objects.count() == 2
+    order = DomainStatisticsPerTaxon.objects.get(gtdb_taxonomy_last="Thermococcales")
+    assert set(order.genomes.all()) == {genome1, genome2}
+    assert list(DomainStatisticsPerTaxon.objects.get(gtdb_taxonomy_last="Pyrococcus").genomes.all()) == [genome2]
+
+    # Stale links are removed and missing links restored on reload
+    TaxonGenomeLink.objects.filter(taxon=order, genome=genome1).delete()
+    TaxonGenomeLink.objects.create(taxon=order, genome=other)
+    load_domain_statistics_per_taxon(file_path=write_tsv(tmp_path / "taxa.tsv", TAXON_STATS_HEADER, rows))
+    assert set(order.genomes.all()) == {genome1, genome2}
+
+@pytest.mark.django_db
+def test_load_per_taxon_stats_of_ncbi_taxonomy(tmp_path):
+    genome = GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    row = ["mistdb", "hk", "HisKA", "domain", "4", "2", "1e-06", "0.001"]
+    load_domain_statistics_per_taxon(file_path=write_tsv(tmp_path / "gtdb.tsv", TAXON_STATS_HEADER, [
+        ["Archaea;Methanobacteriota_B", "Methanobacteriota_B", "phylum", *row],
+    ]))
+    ncbi_header = [column.replace("gtdb_", "ncbi_") for column in TAXON_STATS_HEADER]
+    ncbi_rows = [["Archaea;Euryarchaeota", "Euryarchaeota", "phylum", *row], ["Archaea", "Archaea", "kingdom", *row]]
+    for rebuild in (False, True):
+        result = load_domain_statistics_per_taxon(file_path=write_tsv(tmp_path / "ncbi.tsv", ncbi_header, ncbi_rows[:1 + rebuild]),
+                                                  taxonomy_system="ncbi", delete_missing=True, rebuild=rebuild)
+        # Rows of the other taxonomy system are not missing
+        assert (result["created"], result["deleted"]) == (1, 0)
+    assert set(DomainStatisticsPerTaxon.objects.values_list("taxonomy_system", "gtdb_taxonomy_last")) == {
+        ("gtdb", "Methanobacteriota_B"), ("ncbi", "Euryarchaeota"), ("ncbi", "Archaea")
+    }
+    assert list(DomainStatisticsPerTaxon.objects.get(gtdb_taxonomy_last="Euryarchaeota").genomes.all()) == [genome]
+
+@pytest.mark.django_db
+def test_rebuild_per_genome_stats_swaps_in_a_new_table(tmp_path):
+    GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    table = DomainStatisticsPerGenome._meta.db_table
+    rows = [
+        ["GCF_000009965.1", "GCF_000009965", "mistdb", "hk", "PAS_3,PAS_4", "domain_comb", "2", "4.8e-07", "0.00057"],
+        ["GCF_000009965.1", "GCF_000009965", "mistdb", "hk", "HisKA", "domain", "5", "1.2e-06", "0.0014"],
+    ]
+    load_domain_statistics_per_genome(file_path=write_tsv(tmp_path / "genomes.tsv", GENOME_STATS_HEADER, rows))
+    ids = dict(DomainStatisticsPerGenome.objects.values_list("domains", "id"))
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+
+    StaleTaxon.objects.all().delete()
+    rows[1][6] = "6"
+    rows.append(["GCF_000009965.1", "GCF_000009965", "rmodels", "hk", "GAF_2", "domain", "1", "1e-06", "0.001"])
+    result = load_domain_statistics_per_genome(file_path=write_tsv(tmp_path / "genomes.tsv", GENOME_STATS_HEADER, rows), rebuild=True)
+    assert result == {"created": 1, "updated": 1, "unchanged": 1, "deleted": 0}
+    # Existing rows keep their ids, new rows continue the sequence
+    rebuilt = dict(DomainStatisticsPerGenome.objects.values_list("domains", "id"))
+    assert {domains: rebuilt[domains] for domains in ids} == ids
+    assert rebuilt["GAF_2"] > max(ids.values())
+    assert DomainStatisticsPerGenome.objects.get(domains="HisKA").count_raw == 6
+    assert DomainStatisticsPerGenome.objects.get(domains="GAF_2").domain_ids == [Domain.objects.get(name="GAF_2").id]
+    # Constraints and indexes are recreated under their names
+    with connection.cursor() as cursor:
+        assert connection.introspection.get_constraints(cursor, table).keys() == constraints.keys()
+        # search_vector is computed like the trigger does, and the trigger is back for later writes
+        cursor.execute(f"SELECT array_agg(search_vector::text ORDER BY id) FROM {table}")
+        search_vectors = cursor.fetchone()[0]
+        cursor.execute(f"UPDATE {table} SET search_vector = NULL")
+        cursor.execute(f"SELECT array_agg(search_vector::text ORDER BY id) FROM {table}")
+        assert cursor.fetchone()[0] == search_vectors
+    assert DomainStatisticsPerGenome.objects.search("GAF_2").count() == 1
+    # Every taxon is due for aggregation after a rebuild
+    assert StaleTaxon.objects.filter(rank="order", name="Thermococcales").exists()
+
+    result = load_domain_statistics_per_genome(
+        file_path=write_tsv(tmp_path / "genomes.tsv", GENOME_STATS_HEADER, rows[:1]), rebuild=True, delete_missing=True
+    )
+    assert result == {"created": 0, "updated": 0, "unchanged": 1, "deleted": 2}
+    assert list(DomainStatisticsPerGenomeFacet.objects.values_list("domain_combination_type", "row_count", "count_raw")) == [("domain_comb", 1, 2)]
+
+@pytest.mark.django_db
+def test_rebuild_per_taxon_stats_keeps_links(tmp_path):
+    genome = GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    rows = [
+        ["Archaea;Methanobacteriota_B;Thermococci;Thermococcales", "Thermococcales", "order", "mistdb", "hk", "HisKA", "domain", "4", "2", "1e-06", "0.001"],
+        ["Archaea;Methanobacteriota_B;Thermococci;Thermococcales", "Thermococcales", "order", "mistdb", "hk", "PAS_3", "domain", "1", "1", "1e-06", "0.001"],
+    ]
+    load_domain_statistics_per_taxon(file_path=write_tsv(tmp_path / "taxa.tsv", TAXON_STATS_HEADER, rows))
+    result = load_domain_statistics_per_taxon(
+        file_path=write_tsv(tmp_path / "taxa.tsv", TAXON_STATS_HEADER, rows[:1]), rebuild=True, delete_missing=True
+    )
+    assert result == {"created": 0, "updated": 0, "unchanged": 1, "deleted": 1}
+    # Links of the dropped row are deleted with it, the foreign key now points to the new table
+    assert list(TaxonGenomeLink.objects.values_list("taxon__domains", "genome")) == [("HisKA", genome.pk)]
+    with pytest.raises(IntegrityError), transaction.atomic():
+        TaxonGenomeLink.objects.create(taxon_id=0, genome=genome)
+        connection.check_constraints()
+
+@pytest.mark.django_db(transaction=True)
+def test_load_per_genome_stats_from_directory_in_parallel(tmp_path):
+    GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    chunks = tmp_path / "chunks"
+    chunks.mkdir()
+    write_tsv(chunks / "part_1.tsv", GENOME_STATS_HEADER, [
+        ["GCF_000009965.1", "GCF_000009965", "mistdb", "hk", "HisKA", "domain", "1", "1e-06", "0.001"],
+        ["GCF_000009965.1", "GCF_000009965", "mistdb", "hk", "PAS_3", "domain", "3", "1e-06", "0.001"],
+    ])
+    write_tsv(chunks / "part_2.tsv", GENOME_STATS_HEADER, [
+        # Later chunks take precedence, exactly like later rows of a single file
+        ["GCF_000009965.1", "GCF_000009965", "mistdb", "hk", "HisKA", "domain", "2", "1e-06", "0.001"],
+        ["GCF_999999999.1", "GCF_999999999", "mistdb", "hk", "HisKA", "domain", "5", "1e-06", "0.001"],
+    ])
+    load_domain_statistics_per_genome(file_path=chunks, workers=2)
+    assert DomainStatisticsPerGenome.objects.count() == 2
+    assert DomainStatisticsPerGenome.objects.get(domains="HisKA").count_raw == 2
+
+    load_domain_statistics_per_genome(file_path=chunks / "part_1.tsv", workers=2)
+    assert DomainStatisticsPerGenome.objects.get(domains="HisKA").count_raw == 1
+
+def test_resolve_input_files(tmp_path):
+    for name in ("b.tsv", "a.tsv", "notes.txt"):
+        (tmp_path / name).write_text("")
+    assert resolve_input_files(tmp_path, None) == [tmp_path / "a.tsv", tmp_path / "b.tsv"]
+    assert resolve_input_files(str(tmp_path / "b*"), None) == [tmp_path / "b.tsv"]
+    assert resolve_input_files(None, tmp_path / "a.tsv") == [tmp_path / "a.tsv"]
+    with pytest.raises(FileNotFoundError):
+        resolve_input_files(tmp_path / "missing_*.tsv", None)
@@ -0,0 +1,93 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from rest_framework.test import APIClient
+from signalp.pagination import CountingPaginator
+from factories import DomainStatisticsPerGenomeFactory, GenomeMetadataFactory
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+def walk(api_client, url, link="next"):
+    pages = []
+    while url:
+        response = api_client.get(url)
+        assert response.status_code == 200
+        pages.append([item["id"] for item in response.data["results"]])
+        url = response.data[link]
+    return pages
+
+@pytest.mark.django_db
+def test_keyset_pagination_walks_both_directions(api_client):
+    genome = GenomeMetadataFactory()
+    counts = [3, None, 1, 3, 2, None, 3]
+    stats = [DomainStatisticsPerGenomeFactory(genome=genome, domains=f"D{i}", count_raw=count) for i, count in enumerate(counts)]
+
+    pages = walk(api_client, "/genome-stats/?page_size=3")
+    assert pages == [[s.pk for s in stats[:3]], [s.pk for s in stats[3:6]], [stats[6].pk]]
+
+    for ordering in ["count_raw", "-count_raw"]:
+        expected = sorted(stats, key=lambda s: (s.count_raw is None, s.count_raw or 0, s.pk))
+        if ordering.startswith("-"):
+            # The id tie-breaker follows the direction of the ordering
+            expected = sorted(stats, key=lambda s: (s.count_raw is not None, -(s.count_raw or 0), -s.pk))
+        pages = walk(api_client, f"/genome-stats/?page_size=2&ordering={ordering}")
+        assert sum(pages, []) == [s.pk for s in expected]
+
+        # Walking back from the last page yields the same pages
+        last = api_client.get(f"/genome-stats/?page_size=2&ordering={ordering}")
+        while last.data["next"]:
+            last = api_client.get(last.data["next"])
+        backwards = walk(api_client, last.data["previous"], link="previous")
+        assert backwards == pages[-2::-1]
+
+    response = api_client.get("/genome-stats/?page_size=2")
+    assert "count" not in response.data
+    assert api_client.get("/genome-stats/?cursor=garbage").status_code == 404
+
+@pytest.mark.django_db
+def test_page_number_pagination_opt_in(api_client):
+    genome = GenomeMetadataFactory()
+    for i in range(3):
+        DomainStatisticsPerGenomeFactory(genome=genome, domains=f"D{i}")
+
+    response = api_client.get("/genome-stats/?page=2&page_size=2")
+    assert response.status_code == 200
+    assert response.data["count"] == 3
+    assert response.data["count_is_exact"] is True
+    assert len(response.data["results"]) == 1
+
+@pytest.mark.django_db
+def test_page_number_pagination_estimates_unfiltered_count(api_client, monkeypatch):
+    genome = GenomeMetadataFactory()
+    for i in range(5):
+        DomainStatisticsPerGenomeFactory(genome=genome, domains=f"D{i}")
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE signalp_domainstatisticspergenome")
+    monkeypatch.setattr(CountingPaginator, "exact_count_threshold", 1)
+
+    response = api_client.get("/genome-stats/?page=1&page_size=2")
+    assert response.data["count_is_exact"] is False
+    assert response.data["count"] == 5
+    # Pages are not bounded by the estimate, the last one is found by fetching one extra row
+    response = api_client.get("/genome-stats/?page=3&page_size=2")
+    assert len(response.data["results"]) == 1
+    assert response.data["next"] is None
+    assert api_client.get("/genome-stats/?page=4&page_size=2").status_code == 404
+
+@pytest.mark.django_db
+def test_page_number_pagination_caches_filtered_count(api_client):
+    cache.clear()
+    genome = GenomeMetadataFactory()
+    for i in range(3):
+        DomainStatisticsPerGenomeFactory(genome=genome, domains=f"D{i}", count_raw=i)
+
+    response = api_client.get("/genome-stats/?page=1&count_raw__gte=1")
+    assert response.data["count"] == 2
+    assert response.data["count_is_exact"] is True
+    DomainStatisticsPerGenomeFactory(genome=genome, domains="D3", count_raw=3)
+    # The same filters in a different order hit the cached count
+    response = api_client.get("/genome-stats/?count_raw__gte=1&ordering=-count_raw&page=1")
+    assert response.data["count"] == 2
+    assert len(response.data["results"]) == 3
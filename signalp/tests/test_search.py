@@ -0,0 +1,49 @@
+import pytest
+from rest_framework.test import APIClient
+from factories import DomainStatisticsPerGenomeFactory, DomainStatisticsPerProteinFactory, GenomeMetadataFactory
+from signalp.models import DomainStatisticsPerGenome, search_terms
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+def test_search_terms():
+    assert search_terms('PAS_3 "GAF_2,PAS_4" HisK* - ""') == [("PAS_3", False), ("GAF_2,PAS_4", False), ("HisK", True)]
+
+@pytest.mark.django_db
+def test_genome_stats_full_text_search(api_client):
+    genome = GenomeMetadataFactory()
+    DomainStatisticsPerGenomeFactory(genome=genome, domains="PAS_3,PAS_4,PAS_9")
+    DomainStatisticsPerGenomeFactory(genome=genome, domains="GAF_2,PAS_3")
+    DomainStatisticsPerGenomeFactory(genome=genome, domains="HisKA_3")
+    DomainStatisticsPerGenomeFactory(genome=genome, domains="HisKA,HATPase_c", genome_accession="GCA_001800075")
+
+    def search(query, **params):
+        response = api_client.get("/genome-stats/", {"search": query, **params}, HTTP_ACCEPT="application/json")
+        assert response.status_code == 200
+        return [row["domains"] for row in response.json()["results"]]
+
+    # Words match their lexemes in sequence, PAS_3 does not match PAS_4,PAS_3
+    assert sorted(search("PAS_3")) == ["GAF_2,PAS_3", "PAS_3,PAS_4,PAS_9"]
+    assert search('"PAS_4,PAS_9"') == ["PAS_3,PAS_4,PAS_9"]
+    assert search("PAS_4 GAF_2") == []
+    assert sorted(search("HisK*")) == ["HisKA,HATPase_c", "HisKA_3"]
+    # Accessions are matched as substrings
+    assert search("001800075") == ["HisKA,HATPase_c"]
+
+    # Rows are ranked, the more occurrences of PAS the higher
+    assert search("PAS") == ["PAS_3,PAS_4,PAS_9", "GAF_2,PAS_3"]
+    first = api_client.get("/genome-stats/", {"search": "PAS", "page_size": 1}, HTTP_ACCEPT="application/json").json()
+    assert [row["domains"] for row in first["results"]] == ["PAS_3,PAS_4,PAS_9"]
+    second = api_client.get(first["next"], HTTP_ACCEPT="application/json").json()
+    assert [row["domains"] for row in second["results"]] == ["GAF_2,PAS_3"]
+    assert second["next"] is None
+    # A requested ordering replaces the ranking
+    assert search("PAS", ordering="-id") == ["GAF_2,PAS_3", "PAS_3,PAS_4,PAS_9"]
+
+@pytest.mark.django_db
+def test_search_vector_covers_protein_text_columns(api_client):
+    DomainStatisticsPerProteinFactory(domains="Response_reg", domain_architecture="Response_reg:4-115", sensors_or_regulators="Trans_reg_C")
+    response = api_client.get("/protein-stats/?search=Trans_reg_C", HTTP_ACCEPT="application/json")
+    assert len(response.json()["results"]) == 1
+    assert DomainStatisticsPerGenome.objects.search("").count() == 0
@@ -0,0 +1,87 @@
+from decimal import Decimal
+
+import pytest
+from factories import DomainStatisticsPerGenomeFactory, DomainStatisticsPerTaxonFactory, GenomeMetadataFactory
+from signalp.loaders.taxon_aggregation import aggregate_domain_statistics_per_taxon
+from signalp.models import DomainStatisticsPerTaxon, GenomeMetadata, StaleTaxon
+
+def taxon_row(rank, last, domains="HisKA", taxonomy_system="gtdb"):
+    return DomainStatisticsPerTaxon.objects.get(taxonomy_system=taxonomy_system, gtdb_taxonomy_rank=rank, gtdb_taxonomy_last=last, domains=domains)
+
+@pytest.mark.django_db
+def test_aggregate_taxon_stats_from_genome_stats():
+    genome1 = GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    genome2 = GenomeMetadataFactory(genome_version="GCF_000015765.1", gtdb_genus="Pyrococcus", gtdb_species="Pyrococcus sp")
+    GenomeMetadataFactory(genome_version="GCF_000013445.1", gtdb_phylum="Halobacteriota", gtdb_class=None, gtdb_order=None,
+                          gtdb_family=None, gtdb_genus=None, gtdb_species=None)
+    DomainStatisticsPerGenomeFactory(genome=genome1, domains="HisKA", count_raw=2, count_normalized_by_genome_size=Decimal("0.000000400"),
+                                     count_normalized_by_total_proteins=Decimal("0.000800000"))
+    DomainStatisticsPerGenomeFactory(genome=genome2, domains="HisKA", count_raw=5, count_normalized_by_genome_size=Decimal("0.000001000"),
+                                     count_normalized_by_total_proteins=Decimal("0.002000000"))
+    # Loaded taxon rows are replaced by a full aggregation
+    DomainStatisticsPerTaxonFactory(gtdb_taxonomy_string="Bacteria", gtdb_taxonomy_last="Bacteria", gtdb_taxonomy_rank="kingdom")
+
+    result = aggregate_domain_statistics_per_taxon(full=True)
+    # 11 GTDB taxa, the loaded kingdom included, and the 7 NCBI taxa the three genomes share
+    assert result["taxa"] == 18 and result["deleted"] == 1
+    assert not StaleTaxon.objects.exists()
+    kingdom = taxon_row("kingdom", "Archaea")
+    # Normalized by the 3 genomes of the kingdom, with or without statistics
+    assert (kingdom.gtdb_taxonomy_string, kingdom.count_raw, kingdom.count_normalized_by_total_genomes) == ("Archaea", 7, Decimal("2.3333333"))
+    assert kingdom.count_normalized_by_genome_size_by_total_genomes == Decimal("0.000000467")
+    assert kingdom.count_normalized_by_total_proteins_by_total_genomes == Decimal("0.000933333")
+    order = taxon_row("order", "Thermococcales")
+    assert order.gtdb_taxonomy_string == "Archaea;Methanobacteriota_B;Thermococci;Thermococcales"
+    assert (order.count_raw, order.count_normalized_by_total_genomes) == (7, Decimal("3.5000000"))
+    assert set(order.genomes.all()) == {genome1, genome2}
+    assert list(taxon_row("genus", "Pyrococcus").genomes.all()) == [genome2]
+    assert not DomainStatisticsPerTaxon.objects.filter(gtdb_taxonomy_last="Halobacteriota").exists()
+    ncbi_order = taxon_row("order", "Thermococcales", taxonomy_system="ncbi")
+    assert ncbi_order.gtdb_taxonomy_string == "Archaea;Euryarchaeota;Thermococci;Thermococcales"
+    assert (ncbi_order.count_raw, ncbi_order.count_normalized_by_total_genomes) == (7, Decimal("2.3333333"))
+    assert ncbi_order.genomes.count() == 3
+
+    # Changed statistics mark the taxa of their genome stale, only those are recomputed
+    genome2.domain_statistics_pergenome.update(count_raw=7)
+    assert set(StaleTaxon.objects.values_list("rank", flat=True)) == {"kingdom", "phylum", "class", "order", "family", "genus", "species"}
+    assert set(StaleTaxon.objects.values_list("taxonomy_system", flat=True)) == {"gtdb", "ncbi"}
+    result = aggregate_domain_statistics_per_taxon()
+    assert result == {"taxa": 14, "created": 0, "updated": 14, "unchanged": 0, "deleted": 0}
+    assert taxon_row("order", "Thermococcales").count_raw == 9
+    assert taxon_row("genus", "Thermococcus").count_raw == 2
+
+    # Reclassified genomes leave their old taxa, the species row moves to its new taxonomy string
+    GenomeMetadata.objects.filter(pk=genome2.pk).update(gtdb_genus="Palaeococcus")
+    result = aggregate_domain_statistics_per_taxon()
+    assert result["created"] == 2 and result["deleted"] == 2
+    assert not DomainStatisticsPerTaxon.objects.filter(gtdb_taxonomy_last="Pyrococcus").exists()
+    assert list(taxon_row("genus", "Palaeococcus").genomes.all()) == [genome2]
+    assert taxon_row("genus", "Thermococcus", taxonomy_system="ncbi").count_raw == 9
+
+    genome1.delete()
+    aggregate_domain_statistics_per_taxon()
+    assert taxon_row("order", "Thermococcales").count_raw == 7
+    assert not DomainStatisticsPerTaxon.objects.filter(taxonomy_system="gtdb", gtdb_taxonomy_last="Thermococcus").exists()
+
+@pytest.mark.django_db
+def test_aggregate_taxon_stats_skips_empty_ranks():
+    # The genome metadata loader stores empty ranks as ''
+    genome1 = GenomeMetadataFactory(genome_version="GCF_000009965.1", gtdb_species="", ncbi_class="")
+    genome2 = GenomeMetadataFactory(genome_version="GCF_000013445.1", gtdb_phylum="Halobacteriota", gtdb_class="Halobacteria",
+                                    gtdb_order="Halobacteriales", gtdb_family="Haloferacaceae", gtdb_genus="Haloferax", gtdb_species="",
+                                    ncbi_phylum="Euryarchaeota", ncbi_class="", ncbi_order="Halobacteriales", ncbi_family="Haloferacaceae",
+                                    ncbi_genus="Haloferax", ncbi_species="Haloferax volcanii")
+    DomainStatisticsPerGenomeFactory(genome=genome1, domains="HisKA", count_raw=2)
+    DomainStatisticsPerGenomeFactory(genome=genome2, domains="HisKA", count_raw=2)
+    assert not StaleTaxon.objects.filter(name="").exists()
+    aggregate_domain_statistics_per_taxon()
+    assert not DomainStatisticsPerTaxon.objects.filter(gtdb_taxonomy_last="").exists()
+
+    # Rows aggregated for empty ranks before are deleted by a full aggregation
+    DomainStatisticsPerTaxonFactory(gtdb_taxonomy_string="Archaea;Methanobacteriota_B;Thermococci;Thermococcales;Thermococcaceae;Thermococcus;",
+                                    gtdb_taxonomy_last="", gtdb_taxonomy_rank="species")
+    result = aggregate_domain_statistics_per_taxon(full=True)
+    assert result["deleted"] == 1
+    assert not DomainStatisticsPerTaxon.objects.filter(gtdb_taxonomy_last="").exists()
+    assert taxon_row("genus", "Haloferax").count_raw == 2
+    assert taxon_row("phylum", "Euryarchaeota", taxonomy_system="ncbi").count_raw == 4
@@ -0,0 +1,93 @@
+import pytest
+from django.db import connection, transaction
+from rest_framework.test import APIClient
+from factories import DomainStatisticsPerTaxonFactory, GenomeMetadataFactory
+from signalp.loaders.genome_metadata_loader import FIELDS, load_genome_metadata_from_tsv
+from signalp.loaders.taxonomy import refresh_taxonomy
+from signalp.models import DomainStatisticsPerTaxon, GenomeMetadata, TaxonomyClosure, TaxonomyNode
+
+THERMOCOCCUS = ["Archaea", "Methanobacteriota_B", "Thermococci", "Thermococcales", "Thermococcaceae", "Thermococcus", "Thermococcus kodakarensis",
+                "Archaea", "Euryarchaeota", "Thermococci", "Thermococcales", "Thermococcaceae", "Thermococcus", "Thermococcus kodakarensis"]
+
+def node(rank, name, taxonomy_system="gtdb"):
+    return TaxonomyNode.objects.get(taxonomy_system=taxonomy_system, rank=rank, name=name)
+
+def write_metadata(path, rows):
+    lines = ["\t".join(FIELDS)] + ["\t".join(row) for row in rows]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+@pytest.mark.django_db
+def test_load_genome_metadata_builds_taxonomy_tree(tmp_path):
+    pyrococcus = THERMOCOCCUS[:5] + ["Pyrococcus", "Pyrococcus furiosus"] + THERMOCOCCUS[7:12] + ["Pyrococcus", "Pyrococcus furiosus"]
+    # Genomes without an NCBI class hang below the phylum
+    unclassified = THERMOCOCCUS[:7] + ["Archaea", "Euryarchaeota", "", "", "", "", ""]
+    rows = [["GCF_000009965.1", "GCF_000009965", "2088737", "2314", *THERMOCOCCUS],
+            ["GCF_000007305.1", "GCF_000007305", "1908256", "2125", *pyrococcus],
+            ["GCF_000013445.1", "GCF_000013445", "2000000", "2000", *unclassified]]
+    load_genome_metadata_from_tsv(file_path=write_metadata(tmp_path / "genomes.tsv", rows))
+
+    # 9 nodes per system, the empty ranks are not taxa
+    assert TaxonomyNode.objects.filter(taxonomy_system="gtdb").count() == 9
+    assert TaxonomyNode.objects.filter(taxonomy_system="ncbi").count() == 9
+    assert not TaxonomyNode.objects.filter(name="").exists()
+    genus = node("genus", "Pyrococcus")
+    assert (genus.depth, genus.parent, genus.lineage) == (5, node("family", "Thermococcaceae"),
+                                                          "Archaea;Methanobacteriota_B;Thermococci;Thermococcales;Thermococcaceae;Pyrococcus")
+    lineage = TaxonomyClosure.objects.filter(descendant=node("species", "Pyrococcus furiosus")).order_by("-distance")
+    assert [link.ancestor.name for link in lineage] == ["Archaea", "Methanobacteriota_B", "Thermococci", "Thermococcales", "Thermococcaceae",
+                                                        "Pyrococcus", "Pyrococcus furiosus"]
+    genome = GenomeMetadata.objects.get(genome_version="GCF_000013445.1")
+    assert (genome.gtdb_taxon, genome.ncbi_taxon) == (node("species", "Thermococcus kodakarensis"), node("phylum", "Euryarchaeota", "ncbi"))
+
+    # Per-taxon statistics are linked to their nodes
+    DomainStatisticsPerTaxonFactory(gtdb_taxonomy_string="Archaea;Methanobacteriota_B;Thermococci;Thermococcales;Thermococcaceae;Pyrococcus",
+                                    gtdb_taxonomy_last="Pyrococcus", gtdb_taxonomy_rank="genus")
+    with transaction.atomic(), connection.cursor() as cursor:
+        result = refresh_taxonomy(cursor)
+    assert result == {"created": 0, "updated": 0, "deleted": 0, "genomes": 0, "statistics": 1}
+    assert DomainStatisticsPerTaxon.objects.get().taxon == genus
+
+    # Reclassified genomes move to their new nodes, taxa without genomes are deleted and their statistics unlinked
+    rows[1] = rows[0][:4] + THERMOCOCCUS[:5] + ["Palaeococcus", "Palaeococcus sp"] + THERMOCOCCUS[7:]
+    load_genome_metadata_from_tsv(file_path=write_metadata(tmp_path / "genomes.tsv", rows[:1] + [["GCF_000007305.1", *rows[1][1:]]] + rows[2:]))
+    assert not TaxonomyNode.objects.filter(name__startswith="Pyrococcus").exists()
+    assert GenomeMetadata.objects.get(genome_version="GCF_000007305.1").gtdb_taxon == node("species", "Palaeococcus sp")
+    assert DomainStatisticsPerTaxon.objects.get().taxon is None
+    assert TaxonomyClosure.objects.filter(ancestor=node("family", "Thermococcaceae")).count() == 5
+
+@pytest.mark.django_db
+def test_taxonomy_filters(api_client):
+    thermococcus = GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    pyrococcus = GenomeMetadataFactory(genome_version="GCF_000007305.1", gtdb_genus="Pyrococcus", gtdb_species="Pyrococcus furiosus")
+    GenomeMetadataFactory(genome_version="GCF_000013445.1", gtdb_order="Methanomicrobiales", gtdb_family=None, gtdb_genus=None, gtdb_species=None,
+                          ncbi_order="Methanomicrobiales", ncbi_family=None, ncbi_genus=None, ncbi_species=None)
+    for rank, last in [("order", "Thermococcales"), ("genus", "Pyrococcus"), ("order", "Methanomicrobiales")]:
+        DomainStatisticsPerTaxonFactory(gtdb_taxonomy_string=last, gtdb_taxonomy_last=last, gtdb_taxonomy_rank=rank)
+    with transaction.atomic(), connection.cursor() as cursor:
+        refresh_taxonomy(cursor)
+
+    response = api_client.get("/genomes/?gtdb_within=order:Thermococcales", HTTP_ACCEPT="application/json")
+    assert {genome["genome_version"] for genome in response.json()["results"]} == {thermococcus.genome_version, pyrococcus.genome_version}
+    assert response.json()["results"][0]["gtdb_taxon"] == f"http://testserver/taxa/{node('species', 'Thermococcus kodakarensis').id}/"
+    response = api_client.get("/genomes/?ncbi_within=Pyrococcus", HTTP_ACCEPT="application/json")
+    assert response.json()["results"] == []
+
+    response = api_client.get("/taxon-stats/?within=order:Thermococcales", HTTP_ACCEPT="application/json")
+    assert {row["gtdb_taxonomy_last"] for row in response.json()["results"]} == {"Thermococcales", "Pyrococcus"}
+    assert response.json()["results"][0]["taxon"].startswith("http://testserver/taxa/")
+    response = api_client.get("/taxon-stats/?lineage_of=species:Pyrococcus furiosus", HTTP_ACCEPT="application/json")
+    assert {row["gtdb_taxonomy_last"] for row in response.json()["results"]} == {"Thermococcales", "Pyrococcus"}
+
+    response = api_client.get("/taxa/?taxonomy_system=gtdb&lineage_of=genus:Pyrococcus", HTTP_ACCEPT="application/json")
+    assert [taxon["name"] for taxon in response.json()["results"]] == ["Archaea", "Methanobacteriota_B", "Thermococci", "Thermococcales",
+                                                                      "Thermococcaceae", "Pyrococcus"]
+    family = node("family", "Thermococcaceae")
+    response = api_client.get(f"/taxa/?parent={family.id}", HTTP_ACCEPT="application/json")
+    assert [taxon["name"] for taxon in response.json()["results"]] == ["Pyrococcus", "Thermococcus"]
+    response = api_client.get(f"/taxa/{node('genus', 'Pyrococcus').id}/", HTTP_ACCEPT="application/json")
+    assert response.json()["parent"] == f"http://testserver/taxa/{family.id}/"
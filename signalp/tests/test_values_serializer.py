@@ -0,0 +1,37 @@
+import json
+import pytest
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from signalp.models import GenomeMetadata, DomainStatisticsPerProtein, DomainStatisticsPerGenome, DomainStatisticsPerTaxon
+from signalp.serializers import GenomeMetadataSerializer, DomainStatisticsPerProteinSerializer, DomainStatisticsPerGenomeSerializer, DomainStatisticsPerTaxonSerializer
+from factories import DomainStatisticsPerProteinFactory, DomainStatisticsPerGenomeFactory, DomainStatisticsPerTaxonFactory, GenomeMetadataFactory
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url, model, serializer_class, format", [
+    ("/genomes/", GenomeMetadata, GenomeMetadataSerializer, None),
+    ("/protein-stats/", DomainStatisticsPerProtein, DomainStatisticsPerProteinSerializer, None),
+    ("/genome-stats/", DomainStatisticsPerGenome, DomainStatisticsPerGenomeSerializer, None),
+    ("/taxon-stats/", DomainStatisticsPerTaxon, DomainStatisticsPerTaxonSerializer, None),
+    ("/taxon-stats.json", DomainStatisticsPerTaxon, DomainStatisticsPerTaxonSerializer, "json"),
+])
+def test_list_output_matches_model_serializer(api_client, url, model, serializer_class, format):
+    genome1 = GenomeMetadataFactory(genome_version="GCF_000009965.1")
+    genome2 = GenomeMetadataFactory(genome_version="GCF_000015765.1", genome_size=None)
+    DomainStatisticsPerProteinFactory(genome=genome1, mist_protein_accession="GCF_000009965.1-TK_RS031251")
+    DomainStatisticsPerProteinFactory(genome=genome2, mist_protein_accession="GCF_000015765.1-MLAB_RS06235", domain_counts=None)
+    DomainStatisticsPerGenomeFactory(genome=genome1, domains="PAS_3,PAS_4,PAS_9")
+    DomainStatisticsPerGenomeFactory(genome=genome2, domains="GAF_2", count_normalized_by_genome_size=None)
+    taxon = DomainStatisticsPerTaxonFactory(domains="PAS_3")
+    taxon.genomes.add(genome2, genome1)
+    DomainStatisticsPerTaxonFactory(domains="GAF_2")
+
+    response = api_client.get(url, {"expand": "domain_statistics_perprotein,genomes"}, HTTP_ACCEPT="application/json")
+    assert response.status_code == 200
+    context = {"request": Request(response.wsgi_request), "format": format}
+    expected = serializer_class(model.objects.order_by("id"), many=True, context=context).data
+    assert json.loads(response.content)["results"] == json.loads(JSONRenderer().render(expected))
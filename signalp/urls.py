@@ -5,12 +5,22 @@ from rest_framework.urlpatterns import format_suffix_patterns
 urlpatterns = format_suffix_patterns([
     path('', views.api_root),
     path('genomes/', views.GenomeMetadataList.as_view(), name='genome_metadata-list'),
+    path('genomes/export/', views.GenomeMetadataExport.as_view(), name='genome_metadata-export'),
     path('genomes/<int:pk>/', views.GenomeMetadataDetail.as_view(), name='genome_metadata-detail'),
     path('protein-stats/', views.DomainStatisticsPerProteinList.as_view(), name='domain_statistics_perprotein-list'),
+    path('protein-stats/export/', views.DomainStatisticsPerProteinExport.as_view(), name='domain_statistics_perprotein-export'),
     path('protein-stats/<int:pk>/', views.DomainStatisticsPerProteinDetail.as_view(), name='domain_statistics_perprotein-detail'),
     path('genome-stats/', views.DomainStatisticsPerGenomeList.as_view(), name='domain_statistics_pergenome-list'),
+    path('genome-stats/export/', views.DomainStatisticsPerGenomeExport.as_view(), name='domain_statistics_pergenome-export'),
+    path('genome-stats/facets/', views.DomainStatisticsPerGenomeFacets.as_view(), name='domain_statistics_pergenome-facets'),
+    path('genome-stats/aggregate/', views.DomainStatisticsPerGenomeAggregate.as_view(), name='domain_statistics_pergenome-aggregate'),
     path('genome-stats/<int:pk>/', views.DomainStatisticsPerGenomeDetail.as_view(), name='domain_statistics_pergenome-detail'),
     path('taxon-stats/', views.DomainStatisticsPerTaxonList.as_view(), name='domain_statistics_pertaxon-list'),
+    path('taxon-stats/export/', views.DomainStatisticsPerTaxonExport.as_view(), name='domain_statistics_pertaxon-export'),
+    path('taxon-stats/facets/', views.DomainStatisticsPerTaxonFacets.as_view(), name='domain_statistics_pertaxon-facets'),
     path('taxon-stats/<int:pk>/', views.DomainStatisticsPerTaxonDetail.as_view(), name='domain_statistics_pertaxon-detail'),
+    path('taxon-stats/<int:pk>/genomes/', views.DomainStatisticsPerTaxonGenomeList.as_view(), name='domain_statistics_pertaxon-genomes'),
+    path('taxa/', views.TaxonomyNodeList.as_view(), name='taxonomy_node-list'),
+    path('taxa/<int:pk>/', views.TaxonomyNodeDetail.as_view(), name='taxonomy_node-detail'),
 ])
 
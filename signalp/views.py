@@ -1,11 +1,33 @@
-from django.shortcuts import render
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework import generics
-from signalp.models import GenomeMetadata, DomainStatisticsPerProtein, DomainStatisticsPerGenome, DomainStatisticsPerTaxon
-from signalp.serializers import GenomeMetadataSerializer, DomainStatisticsPerProteinSerializer, DomainStatisticsPerGenomeSerializer, DomainStatisticsPerTaxonSerializer
-from signalp.custom_filters import DomainStatisticsPerProteinFilter, DomainStatisticsPerGenomeFilter, DomainStatisticsPerTaxonFilter
+from rest_framework.settings import api_settings
+from signalp.models import (GenomeMetadata, DomainStatisticsPerProtein, DomainStatisticsPerGenome, DomainStatisticsPerTaxon, TaxonGenomeLink,
+                            DomainStatisticsPerGenomeFacet, DomainStatisticsPerTaxonFacet, TaxonomyClosure, TaxonomyNode)
+from signalp.serializers import (GenomeMetadataSerializer, DomainStatisticsPerProteinSerializer, DomainStatisticsPerGenomeSerializer, DomainStatisticsPerTaxonSerializer,
+                                 DomainStatisticsPerGenomeFacetSerializer, DomainStatisticsPerTaxonFacetSerializer, GenomeSetAggregateSerializer, TaxonomyNodeSerializer,
+                                 ValuesSerializer)
+from signalp.custom_filters import (DomainStatisticsPerProteinFilter, DomainStatisticsPerGenomeFilter, DomainStatisticsPerTaxonFilter, GenomeMetadataFilter,
+                                    GenomeSetAggregateFilter, GenomeSetFilter, TaxonomyNodeFilter)
+from signalp.caching import cache_response, genome_set_cache_key, get_cached_response, normalized_params, response_cache_key, validators
+from signalp.custom_renderer import NDJSONRenderer, TSVRenderer, ParquetRenderer, ArrowRenderer
+from signalp.exporters import export_columns, export_response
+from signalp.facets import FACET_FIELDS, SUMMARY_TABLES, facet_counts, summary_fields, summary_is_current
+from signalp.genome_sets import aggregate_genome_set, genome_set_signature
 
 
 @api_view(['GET'])
@@ -15,50 +37,383 @@ def api_root(request, format=None):
         'protein-stats': reverse('domain_statistics_perprotein-list', request=request, format=format),
         'genome-stats': reverse('domain_statistics_pergenome-list', request=request, format=format),
         'taxon-stats': reverse('domain_statistics_pertaxon-list', request=request, format=format),
+        'taxa': reverse('taxonomy_node-list', request=request, format=format),
     })
 
 
-class GenomeMetadataList(generics.ListAPIView):
+class AsyncViewMixin:
+    """
+    Serves the view as a coroutine when ASYNC_VIEWS is set, as it is under the ASGI application.
+    Django would run a sync view in a new thread per request, with a new database connection each time and
+    no bound on either. Here requests run in a per-process pool of ASYNC_VIEW_THREADS threads, each keeping
+    its connection for CONN_MAX_AGE, while the event loop keeps accepting requests: a slow search or count
+    holds one thread, not a worker. Django's async ORM methods would not help, they run the same sync queries in a thread.
+    Streamed exports hold a pool thread until their last chunk is sent, rather than being loaded in memory
+    before the first byte, so that the pool bounds the database connections of exports too.
+    """
+    executor = None
+    # Chunks of a streamed export read ahead of the client
+    stream_buffer = 4
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        if not settings.ASYNC_VIEWS:
+            return view
+
+        @wraps(view)
+        async def async_view(request, *args, **kwargs):
+            handle = sync_to_async(cls.handle_in_thread, thread_sensitive=False, executor=cls.get_executor())
+            response = await handle(view, request, *args, **kwargs)
+            if response.streaming and not response.is_async:
+                response.streaming_content = cls.stream_in_thread(response.streaming_content, response)
+            return response
+        return async_view
+
+    @classmethod
+    def get_executor(cls):
+        # Shared by all views of the process
+        if AsyncViewMixin.executor is None:
+            AsyncViewMixin.executor = ThreadPoolExecutor(max_workers=settings.ASYNC_VIEW_THREADS, thread_name_prefix='signalp-view')
+        return AsyncViewMixin.executor
+
+    @staticmethod
+    def handle_in_thread(view, request, *args, **kwargs):
+        # Django's request_started and request_finished signals only manage the connections of its own threads
+        close_old_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            # Rendering may query too, e.g. the filter forms of the browsable API
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    @classmethod
+    async def stream_in_thread(cls, content, response):
+        """
+        Yield the chunks of the sync content of a streaming response, all read by one pool thread: the server-side cursor
+        of an export stays on the connection of the thread that opened it. The thread waits while
+        stream_buffer chunks are queued, and stops, closing the export, when the client goes away.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(maxsize=cls.stream_buffer)
+        stopped = threading.Event()
+
+        def put(item):
+            queued = asyncio.run_coroutine_threadsafe(chunks.put(item), loop)
+            while True:
+                try:
+                    queued.result(timeout=1)
+                    return True
+                except FutureTimeoutError:
+                    if stopped.is_set():
+                        queued.cancel()
+                        return False
+
+        def read():
+            close_old_connections()
+            try:
+                for chunk in content:
+                    if not put(chunk):
+                        response.close()
+                        return
+                put(None)
+            except Exception as error:
+                put(error)
+            finally:
+                close_old_connections()
+
+        loop.run_in_executor(cls.get_executor(), read)
+        try:
+            while (item := await chunks.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+
+
+class CachedResponseMixin:
+    """
+    Serves list and detail responses from the two-tier response cache (see signalp/caching.py).
+    Entries are keyed on the normalized query and the data generation, so they never outlive a load.
+    The X-Cache header tells whether a response came from the local or shared tier or missed.
+    Responses carry a strong ETag and Last-Modified derived from the load generations of cache_models,
+    the tables the view reads, and conditional requests are answered with 304 before any query runs.
+    The browsable API is not validated, its pages embed per-request content.
+    """
+    cache_models = []
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        etag, last_modified = None, None
+        if request.accepted_renderer.format != 'api':
+            etag, last_modified = validators(request, self, self.cache_models)
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return self.with_validators(not_modified, etag, last_modified)
+
+        if not settings.RESPONSE_CACHE_TIMEOUT:
+            return self.with_validators(handler(request, *args, **kwargs), etag, last_modified)
+        key = response_cache_key(request, self)
+        data, tier = get_cached_response(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = f"HIT-{tier.upper()}"
+            return self.with_validators(response, etag, last_modified)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache_response(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return self.with_validators(response, etag, last_modified)
+
+    @staticmethod
+    def with_validators(response, etag, last_modified):
+        if etag is None or response.status_code not in (200, 304):
+            return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # Caches may store responses but have to revalidate them, which is cheap, before reuse
+        response['Cache-Control'] = 'public, no-cache'
+        return response
+
+
+class ValuesListMixin:
+    """
+    Lists from .values() rows with a ValuesSerializer built from the view's serializer,
+    giving the same output without instantiating models or reversing URLs per row.
+    Falls back to the regular list when the serializer has fields ValuesSerializer does not support.
+    """
+    def list(self, request, *args, **kwargs):
+        values_serializer = ValuesSerializer.for_serializer(self.get_serializer())
+        if values_serializer is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # Keyset pagination reads the ordering fields, and annotations such as the search rank, from the rows
+        value_fields = (values_serializer.value_fields | {queryset.model._meta.get_field(name).attname for name in self.ordering_fields}
+                        | set(queryset.query.annotations))
+        queryset = queryset.values(*value_fields)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(values_serializer.serialize(page))
+        return Response(values_serializer.serialize(list(queryset)))
+
+
+class ExportMixin:
+    """
+    Streams the whole filtered list of a list view as NDJSON, TSV, Parquet or Arrow,
+    selected with ?format= or the Accept header. Takes the filter, search and ordering parameters of the list view.
+    """
+    renderer_classes = [NDJSONRenderer, TSVRenderer, ParquetRenderer, ArrowRenderer]
+    pagination_class = None
+    export_name = None
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.ordered:
+            queryset = queryset.order_by('id')
+        return export_response(queryset, export_columns(self.get_serializer_class()), request.accepted_renderer, self.export_name)
+
+
+class FacetMixin:
+    """
+    Counts the rows of a statistics list view and sums their counts, grouped by ?facets= (comma separated
+    subset of source, protein_type and domain_combination_type, all by default), under the filters and search of the list view.
+    Requests filtered on the fields of the facet summary table only are answered from it (see signalp/facets.py).
+    """
+    pagination_class = None
+    facet_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(self.facet_list, request, *args, **kwargs)
+
+    def facet_list(self, request, *args, **kwargs):
+        facets = self.get_facets()
+        queryset = self.get_queryset()
+        filterset = DjangoFilterBackend().get_filterset(request, queryset, self)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        filters = {name: value for name, value in filterset.form.cleaned_data.items() if value not in (None, '')}
+
+        model = queryset.model
+        precomputed = (not request.query_params.get(api_settings.SEARCH_PARAM)
+                       and set(filters) <= summary_fields(model) and summary_is_current(model))
+        if precomputed:
+            summary, _, _ = SUMMARY_TABLES[model]
+            queryset = summary.objects.filter(**filters)
+        else:
+            queryset = self.filter_queryset(queryset)
+        groups = facet_counts(queryset, facets, precomputed)
+        return Response({
+            'facets': facets,
+            'precomputed': precomputed,
+            'results': self.facet_serializer_class(groups, many=True, context={**self.get_serializer_context(), 'facets': facets}).data,
+        })
+
+    def get_facets(self):
+        param = self.request.query_params.get('facets')
+        if not param:
+            return FACET_FIELDS
+        facets = [facet.strip() for facet in param.split(',') if facet.strip()]
+        unknown = [facet for facet in facets if facet not in FACET_FIELDS]
+        if unknown:
+            raise ValidationError({'facets': [f"Unknown facet '{facet}', expected one of {', '.join(FACET_FIELDS)}" for facet in unknown]})
+        return list(dict.fromkeys(facets))
+
+
+class GenomeMetadataList(AsyncViewMixin, CachedResponseMixin, ValuesListMixin, generics.ListAPIView):
+    # Genomes are served with summaries of their per-protein and per-genome statistics, ?gtdb_within= and ?ncbi_within= read the taxonomy trees
+    cache_models = [GenomeMetadata, DomainStatisticsPerProtein, DomainStatisticsPerGenome, TaxonomyClosure]
     queryset = GenomeMetadata.objects.all()
     serializer_class = GenomeMetadataSerializer
-    filterset_fields = ['genome_version', 'genome_accession', 'genome_size', 'protein_count']
-    search_fields = ['gtdb_kingdom', 'gtdb_phylum', 'gtdb_class', 'gtdb_order', 'gtdb_family', 'gtdb_genus', 'gtdb_species', 'ncbi_kingdom', 'ncbi_phylum',
+    filterset_class = GenomeMetadataFilter
+    search_fields = ['genome_version', 'genome_accession', 'gtdb_kingdom', 'gtdb_phylum', 'gtdb_class', 'gtdb_order', 'gtdb_family', 'gtdb_genus', 'gtdb_species', 'ncbi_kingdom', 'ncbi_phylum',
                      'ncbi_class', 'ncbi_order', 'ncbi_family', 'ncbi_genus', 'ncbi_species']
+    ordering_fields = ['id', 'genome_version', 'genome_size', 'protein_count']
+
+class GenomeMetadataExport(ExportMixin, GenomeMetadataList):
+    export_name = 'genomes'
 
-class GenomeMetadataDetail(generics.RetrieveAPIView):
+class GenomeMetadataDetail(AsyncViewMixin, CachedResponseMixin, generics.RetrieveAPIView):
+    # Genomes are served with summaries of their per-protein and per-genome statistics
+    cache_models = [GenomeMetadata, DomainStatisticsPerProtein, DomainStatisticsPerGenome]
     queryset = GenomeMetadata.objects.all()
     serializer_class = GenomeMetadataSerializer
 
 
-class DomainStatisticsPerProteinList(generics.ListAPIView):
+class DomainStatisticsPerProteinList(AsyncViewMixin, CachedResponseMixin, ValuesListMixin, generics.ListAPIView):
+    cache_models = [DomainStatisticsPerProtein]
     queryset = DomainStatisticsPerProtein.objects.all()
     serializer_class = DomainStatisticsPerProteinSerializer
     filterset_class = DomainStatisticsPerProteinFilter
-    search_fields = ['domains', 'domain_architecture', 'sensors_or_regulators']
+    # Domains, architectures and sensors/regulators are searched through search_vector
+    search_fields = ['mist_protein_accession', 'ncbi_protein_accession']
+    ordering_fields = ['id', 'mist_protein_accession', 'protein_length']
+
+class DomainStatisticsPerProteinExport(ExportMixin, DomainStatisticsPerProteinList):
+    export_name = 'protein-stats'
 
-class DomainStatisticsPerProteinDetail(generics.RetrieveAPIView):
+class DomainStatisticsPerProteinDetail(AsyncViewMixin, CachedResponseMixin, generics.RetrieveAPIView):
+    cache_models = [DomainStatisticsPerProtein]
     queryset = DomainStatisticsPerProtein.objects.all()
     serializer_class = DomainStatisticsPerProteinSerializer
 
 
-class DomainStatisticsPerGenomeList(generics.ListAPIView):
+class DomainStatisticsPerGenomeList(AsyncViewMixin, CachedResponseMixin, ValuesListMixin, generics.ListAPIView):
+    cache_models = [DomainStatisticsPerGenome]
     queryset = DomainStatisticsPerGenome.objects.all()
     serializer_class = DomainStatisticsPerGenomeSerializer
     filterset_class = DomainStatisticsPerGenomeFilter
-    search_fields = ['domains']
+    # Domains are searched through search_vector
+    search_fields = ['genome_accession']
+    ordering_fields = ['id', 'count_raw', 'count_normalized_by_genome_size', 'count_normalized_by_total_proteins']
+
+class DomainStatisticsPerGenomeExport(ExportMixin, DomainStatisticsPerGenomeList):
+    export_name = 'genome-stats'
+
+class DomainStatisticsPerGenomeFacets(FacetMixin, DomainStatisticsPerGenomeList):
+    cache_models = [DomainStatisticsPerGenome, DomainStatisticsPerGenomeFacet]
+    facet_serializer_class = DomainStatisticsPerGenomeFacetSerializer
 
-class DomainStatisticsPerGenomeDetail(generics.RetrieveAPIView):
+class DomainStatisticsPerGenomeAggregate(AsyncViewMixin, CachedResponseMixin, generics.ListAPIView):
+    """
+    Aggregates the per-genome statistics of an ad-hoc genome set like the per-taxon statistics, e.g.
+    ?gtdb_genus=Thermococcus&genome_size__gte=2000000&protein_type=hk. The genomes are selected with the
+    GenomeSetFilter parameters, the rows with source, protein_type, domain_combination_type and the domain filters.
+    Results are cached per genome set, so queries selecting the same genomes with different parameters share them.
+    """
+    cache_models = [GenomeMetadata, DomainStatisticsPerGenome, TaxonomyClosure]
+    queryset = DomainStatisticsPerGenome.objects.all()
+    serializer_class = GenomeSetAggregateSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = GenomeSetAggregateFilter
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(self.aggregate_list, request, *args, **kwargs)
+
+    def aggregate_list(self, request, *args, **kwargs):
+        genome_filterset = GenomeSetFilter(request.query_params, queryset=GenomeMetadata.objects.all(), request=request)
+        if not genome_filterset.is_valid():
+            raise translate_validation(genome_filterset.errors)
+        genomes = genome_filterset.qs
+        queryset = self.filter_queryset(self.get_queryset())
+        genome_set, total = genome_set_signature(genomes)
+
+        key = genome_set_cache_key(genome_set, normalized_params(request.query_params, GenomeSetAggregateFilter.base_filters))
+        data, _ = get_cached_response(key) if settings.RESPONSE_CACHE_TIMEOUT else (None, None)
+        if data is None:
+            data = {
+                'genome_set': genome_set,
+                'total_genomes': total,
+                'results': self.get_serializer(aggregate_genome_set(queryset, genomes, total), many=True).data,
+            }
+            if settings.RESPONSE_CACHE_TIMEOUT:
+                cache_response(key, data)
+        return Response(data)
+
+class DomainStatisticsPerGenomeDetail(AsyncViewMixin, CachedResponseMixin, generics.RetrieveAPIView):
+    cache_models = [DomainStatisticsPerGenome]
     queryset = DomainStatisticsPerGenome.objects.all()
     serializer_class = DomainStatisticsPerGenomeSerializer
 
 
-class DomainStatisticsPerTaxonList(generics.ListAPIView):
+class DomainStatisticsPerTaxonList(AsyncViewMixin, CachedResponseMixin, ValuesListMixin, generics.ListAPIView):
+    cache_models = [DomainStatisticsPerTaxon, TaxonGenomeLink, TaxonomyClosure]
     queryset = DomainStatisticsPerTaxon.objects.all()
     serializer_class = DomainStatisticsPerTaxonSerializer
     filterset_class = DomainStatisticsPerTaxonFilter
-    search_fields = ['gtdb_taxonomy_last', 'domains']
+    # Domains and the taxonomy string are searched through search_vector
+    search_fields = ['gtdb_taxonomy_last']
+    ordering_fields = ['id', 'count_raw', 'count_normalized_by_total_genomes', 'count_normalized_by_genome_size_by_total_genomes',
+                       'count_normalized_by_total_proteins_by_total_genomes']
+
+class DomainStatisticsPerTaxonExport(ExportMixin, DomainStatisticsPerTaxonList):
+    export_name = 'taxon-stats'
 
-class DomainStatisticsPerTaxonDetail(generics.RetrieveAPIView):
+class DomainStatisticsPerTaxonFacets(FacetMixin, DomainStatisticsPerTaxonList):
+    cache_models = [DomainStatisticsPerTaxon, DomainStatisticsPerTaxonFacet, TaxonomyClosure]
+    facet_serializer_class = DomainStatisticsPerTaxonFacetSerializer
+
+class DomainStatisticsPerTaxonDetail(AsyncViewMixin, CachedResponseMixin, generics.RetrieveAPIView):
+    cache_models = [DomainStatisticsPerTaxon, TaxonGenomeLink]
     queryset = DomainStatisticsPerTaxon.objects.all()
     serializer_class = DomainStatisticsPerTaxonSerializer
 
+class DomainStatisticsPerTaxonGenomeList(GenomeMetadataList):
+    """
+    Paginated list of the genomes of a taxon, with the filters of the genome list.
+    """
+    cache_models = GenomeMetadataList.cache_models + [TaxonGenomeLink]
+
+    def get_queryset(self):
+        taxon = get_object_or_404(DomainStatisticsPerTaxon.objects.only('id'), pk=self.kwargs['pk'])
+        return GenomeMetadata.objects.filter(mist_taxon_statistics=taxon)
+
+
+class TaxonomyNodeList(AsyncViewMixin, CachedResponseMixin, ValuesListMixin, generics.ListAPIView):
+    """
+    The GTDB and NCBI taxonomy trees, root first. ?lineage_of=genus:Thermococcus lists the lineage of a taxon,
+    ?within=order:Thermococcales its subtree and ?parent=<id> the children of a node.
+    """
+    cache_models = [TaxonomyNode, TaxonomyClosure]
+    queryset = TaxonomyNode.objects.order_by('depth', 'name')
+    serializer_class = TaxonomyNodeSerializer
+    filterset_class = TaxonomyNodeFilter
+    search_fields = ['name']
+    ordering_fields = ['id', 'depth', 'name']
+
+class TaxonomyNodeDetail(AsyncViewMixin, CachedResponseMixin, generics.RetrieveAPIView):
+    cache_models = [TaxonomyNode]
+    queryset = TaxonomyNode.objects.all()
+    serializer_class = TaxonomyNodeSerializer
@@ -13,11 +13,21 @@ if [ "$DEBUG" = "0" ]; then
   echo "Collecting static files..."
   python manage.py collectstatic --noinput
 
-  echo "Starting Gunicorn..."
-  gunicorn signaldb:application \
-      --bind 0.0.0.0:8000 \
-      --workers 3 \
-      --log-level inf
+  if [ "$SERVER" = "uvicorn" ]; then
+    # Each worker serves up to ASYNC_VIEW_THREADS concurrent API requests
+    echo "Starting Uvicorn..."
+    uvicorn signaldb.asgi:application \
+        --host 0.0.0.0 \
+        --port 8000 \
+        --workers ${WORKERS:-3} \
+        --log-level info
+  else
+    echo "Starting Gunicorn..."
+    gunicorn signaldb.wsgi:application \
+        --bind 0.0.0.0:8000 \
+        --workers ${WORKERS:-3} \
+        --log-level info
+  fi
 
 elif [ "$DEBUG" = "1"  ]; then
   echo "PostgreSQL is up. Running migrations..."